@@ -0,0 +1,267 @@
+"""
+Offline conversation generation through the provider batch APIs.
+
+Packages level x theme generation requests into an OpenAI Batch or
+Anthropic Message Batches job, polls it, and streams the results back as
+validated, de-duplicated conversations. Batches are billed at a discount
+and count against separate batch quotas, so bulk corpus builds no longer
+compete with the live bot for interactive rate limits.
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+from config import config
+from llm import (
+    GENERATION_SYSTEM_PROMPT,
+    ClaudeProvider,
+    JSONArrayStreamParser,
+    LLMProviderError,
+    OpenAIProvider,
+    build_generation_prompt,
+    is_valid_conversation,
+    _raise_for_status,
+)
+from state_db import get_connection, transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_batches (
+    id TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    status TEXT NOT NULL,
+    requests TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+BATCH_PROVIDERS = ("openai", "claude")
+
+def request_id(level: str, theme: str, index: int) -> str:
+    """custom_id of one request; Anthropic only allows [a-zA-Z0-9_-]"""
+    return f"{level}-{theme}-{index}"
+
+def parse_conversations(text: str) -> List[dict]:
+    """Valid jp/kr objects from a completed generation response"""
+    parser = JSONArrayStreamParser()
+    return [
+        {"jp": item["jp"], "kr": item["kr"]}
+        for item in parser.feed(text) if is_valid_conversation(item)
+    ]
+
+def conversation_key(conversation: dict) -> str:
+    """Dedupe key: the Japanese sentence without whitespace"""
+    return "".join(conversation["jp"].split())
+
+class OpenAIBatchClient:
+    """OpenAI Batch API: upload a JSONL file, create a batch, download the output file"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, base_url: str = None):
+        self.provider = OpenAIProvider(api_key)
+        self.base_url = (base_url or config.openai_base_url).rstrip("/")
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.provider.api_key}"}
+
+    def build_request(self, custom_id: str, prompt: str, max_tokens: int) -> dict:
+        _, body = self.provider._build_request(GENERATION_SYSTEM_PROMPT, prompt, max_tokens, 0.8)
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+    async def submit(self, session: aiohttp.ClientSession, requests: List[dict]) -> str:
+        payload = "".join(json.dumps(request, ensure_ascii=False) + "\n" for request in requests)
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field("file", payload.encode("utf-8"), filename="generation.jsonl", content_type="application/jsonl")
+        async with session.post(f"{self.base_url}/v1/files", headers=self._headers(), data=form) as response:
+            _raise_for_status(response, "OpenAI")
+            file_id = (await response.json())["id"]
+        batch = {"input_file_id": file_id, "endpoint": "/v1/chat/completions", "completion_window": "24h"}
+        async with session.post(f"{self.base_url}/v1/batches", headers=self._headers(), json=batch) as response:
+            _raise_for_status(response, "OpenAI")
+            return (await response.json())["id"]
+
+    async def poll(self, session: aiohttp.ClientSession, batch_id: str) -> Tuple[bool, str, dict]:
+        """(finished, status, raw batch object)"""
+        async with session.get(f"{self.base_url}/v1/batches/{batch_id}", headers=self._headers()) as response:
+            _raise_for_status(response, "OpenAI")
+            batch = await response.json()
+        status = batch["status"]
+        return status in ("completed", "failed", "expired", "cancelled"), status, batch
+
+    async def results(self, session: aiohttp.ClientSession, batch: dict) -> AsyncIterator[Tuple[str, Optional[str], Optional[str]]]:
+        """Yield (custom_id, completion text, error) per request as the output file streams in"""
+        for file_key in ("output_file_id", "error_file_id"):
+            file_id = batch.get(file_key)
+            if not file_id:
+                continue
+            url = f"{self.base_url}/v1/files/{file_id}/content"
+            async with session.get(url, headers=self._headers()) as response:
+                _raise_for_status(response, "OpenAI")
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    body = (result.get("response") or {}).get("body") or {}
+                    if result.get("error") or "choices" not in body:
+                        yield result["custom_id"], None, json.dumps(result.get("error") or body, ensure_ascii=False)
+                    else:
+                        yield result["custom_id"], body["choices"][0]["message"]["content"], None
+
+class ClaudeBatchClient:
+    """Anthropic Message Batches API: submit the requests, stream the JSONL results"""
+
+    name = "claude"
+
+    def __init__(self, api_key: str, base_url: str = None):
+        self.provider = ClaudeProvider(api_key)
+        self.base_url = (base_url or config.claude_base_url).rstrip("/")
+
+    def _headers(self) -> dict:
+        headers, _ = self.provider._build_request("", "", 0, 0.0)
+        return headers
+
+    def build_request(self, custom_id: str, prompt: str, max_tokens: int) -> dict:
+        _, params = self.provider._build_request(GENERATION_SYSTEM_PROMPT, prompt, max_tokens, 0.8)
+        return {"custom_id": custom_id, "params": params}
+
+    async def submit(self, session: aiohttp.ClientSession, requests: List[dict]) -> str:
+        url = f"{self.base_url}/v1/messages/batches"
+        async with session.post(url, headers=self._headers(), json={"requests": requests}) as response:
+            _raise_for_status(response, "Claude")
+            return (await response.json())["id"]
+
+    async def poll(self, session: aiohttp.ClientSession, batch_id: str) -> Tuple[bool, str, dict]:
+        async with session.get(f"{self.base_url}/v1/messages/batches/{batch_id}", headers=self._headers()) as response:
+            _raise_for_status(response, "Claude")
+            batch = await response.json()
+        status = batch["processing_status"]
+        return status == "ended", status, batch
+
+    async def results(self, session: aiohttp.ClientSession, batch: dict) -> AsyncIterator[Tuple[str, Optional[str], Optional[str]]]:
+        url = batch.get("results_url") or f"{self.base_url}/v1/messages/batches/{batch['id']}/results"
+        async with session.get(url, headers=self._headers()) as response:
+            _raise_for_status(response, "Claude")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                outcome = result.get("result") or {}
+                if outcome.get("type") == "succeeded":
+                    content = outcome["message"]["content"]
+                    yield result["custom_id"], "".join(block.get("text", "") for block in content), None
+                else:
+                    yield result["custom_id"], None, json.dumps(outcome, ensure_ascii=False)
+
+def create_batch_client(provider: str = None):
+    """Batch client for `provider`, or the first configured provider with a batch API"""
+    names = [provider] if provider else [name for name in config.llm_providers if name in BATCH_PROVIDERS]
+    for name in names:
+        api_key = config.llm_api_keys.get(name)
+        if name == "openai" and api_key:
+            return OpenAIBatchClient(api_key)
+        if name == "claude" and api_key:
+            return ClaudeBatchClient(api_key)
+    raise LLMProviderError(f"No batch-capable provider configured (supported: {', '.join(BATCH_PROVIDERS)})")
+
+class BatchGeneration:
+    """Submits one batch for a set of (level, theme, count) jobs and collects its results.
+
+    Submitted batches are recorded in the shared state database, so an
+    interrupted run picks up polling the same batch instead of paying for a
+    second one.
+    """
+
+    def __init__(self, client, path: str = None, per_request: int = 25, poll_interval: float = None):
+        self.client = client
+        self.path = path
+        self.per_request = per_request
+        self.poll_interval = config.batch_poll_interval if poll_interval is None else poll_interval
+        self._initialized = False
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _pending_batch(self) -> Optional[Tuple[str, Dict[str, str]]]:
+        row = self._conn().execute(
+            "SELECT id, requests FROM llm_batches WHERE provider = ? AND status = 'submitted' ORDER BY submitted DESC LIMIT 1",
+            (self.client.name,)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _record(self, batch_id: str, levels: Dict[str, str]):
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_batches (id, provider, status, requests, submitted, updated) VALUES (?, ?, 'submitted', ?, ?, ?)",
+                (batch_id, self.client.name, json.dumps(levels), now, now)
+            )
+
+    def _finish(self, batch_id: str, status: str):
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute("UPDATE llm_batches SET status = ?, updated = ? WHERE id = ?", (status, time.time(), batch_id))
+
+    def build_requests(self, jobs: Iterable[Tuple[str, str, int]]) -> Tuple[List[dict], Dict[str, str]]:
+        """Batch requests for the jobs, split into `per_request` conversations each, and custom_id -> level"""
+        requests, levels = [], {}
+        for level, theme, count in jobs:
+            for index, start in enumerate(range(0, count, self.per_request)):
+                custom_id = request_id(level, theme, index)
+                prompt = build_generation_prompt(level, theme, min(self.per_request, count - start))
+                requests.append(self.client.build_request(custom_id, prompt, max_tokens=4000))
+                levels[custom_id] = level
+        return requests, levels
+
+    async def run(self, jobs: Iterable[Tuple[str, str, int]], existing: Iterable[dict] = ()) -> AsyncIterator[dict]:
+        """Yield new conversations (with `level`), skipping invalid items and duplicates of `existing`"""
+        seen = {conversation_key(conv) for conv in existing if is_valid_conversation(conv)}
+        async with aiohttp.ClientSession() as session:
+            pending = await asyncio.to_thread(self._pending_batch)
+            if pending:
+                batch_id, levels = pending
+                print(f"🔁 Resuming {self.client.name} batch {batch_id} ({len(levels)} requests)")
+            else:
+                requests, levels = self.build_requests(jobs)
+                batch_id = await self.client.submit(session, requests)
+                await asyncio.to_thread(self._record, batch_id, levels)
+                print(f"📦 Submitted {self.client.name} batch {batch_id} ({len(requests)} requests)")
+
+            while True:
+                finished, status, batch = await self.client.poll(session, batch_id)
+                if finished:
+                    break
+                print(f"⏳ Batch {batch_id}: {status}")
+                await asyncio.sleep(self.poll_interval)
+            print(f"📬 Batch {batch_id} finished: {status}")
+
+            failed = invalid = duplicates = 0
+            async for custom_id, text, error in self.client.results(session, batch):
+                if error is not None:
+                    failed += 1
+                    print(f"  ⚠️ {custom_id} failed: {error[:200]}")
+                    continue
+                conversations = parse_conversations(text)
+                if not conversations:
+                    invalid += 1
+                    continue
+                for conv in conversations:
+                    key = conversation_key(conv)
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    conv["level"] = levels.get(custom_id, custom_id.split("-")[0])
+                    yield conv
+            await asyncio.to_thread(self._finish, batch_id, status)
+            print(f"📊 Batch {batch_id}: {failed} failed requests, {invalid} unparseable, {duplicates} duplicates skipped")
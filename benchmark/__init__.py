@@ -0,0 +1,9 @@
+"""
+Throughput benchmark for the bot.
+
+Starts local aiohttp servers that impersonate the OpenAI/Claude chat
+endpoints and the Telegram Bot API, then drives the real Application
+through broadcasts, /push, button callbacks and quiz answers.
+
+    python -m benchmark --users 50 --output bench.json
+"""
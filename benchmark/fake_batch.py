@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from aiohttp import web
+
+from benchmark.fake_llm import fake_completion
+
+class FakeBatchServer:
+    """Local stand-in for the OpenAI Batch and Anthropic Message Batches APIs.
+
+    Batches finish `processing_seconds` after submission; `failure_rate` of
+    the requests in a batch come back as errors.
+
+        python -m benchmark.fake_batch --port 8090
+        OPENAI_BASE_URL=http://127.0.0.1:8090 python run_mass_generation.py --batch
+    """
+
+    def __init__(self, processing_seconds: float = 1.0, failure_rate: float = 0.0, seed: int = None):
+        self.processing_seconds = processing_seconds
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._files = {}
+        self._batches = {}
+        self._runner = None
+        self.base_url = ""
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post("/v1/files", self._upload_file)
+        app.router.add_get("/v1/files/{file_id}/content", self._file_content)
+        app.router.add_post("/v1/batches", self._create_openai_batch)
+        app.router.add_get("/v1/batches/{batch_id}", self._get_openai_batch)
+        app.router.add_post("/v1/messages/batches", self._create_claude_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}", self._get_claude_batch)
+        app.router.add_get("/v1/messages/batches/{batch_id}/results", self._claude_results)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _finished(self, batch: dict) -> bool:
+        return time.time() - batch["created_at"] >= self.processing_seconds
+
+    def _fails(self) -> bool:
+        return self._random.random() < self.failure_rate
+
+    # OpenAI
+
+    async def _upload_file(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form["file"]
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self._files[file_id] = upload.file.read()
+        return web.json_response({"id": file_id, "object": "file", "purpose": form.get("purpose")})
+
+    async def _file_content(self, request: web.Request) -> web.Response:
+        content = self._files.get(request.match_info["file_id"])
+        if content is None:
+            return web.json_response({"error": {"message": "No such file"}}, status=404)
+        return web.Response(body=content, content_type="application/jsonl")
+
+    async def _create_openai_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if body["input_file_id"] not in self._files:
+            return web.json_response({"error": {"message": "No such file"}}, status=400)
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = {"id": batch_id, "input_file_id": body["input_file_id"], "created_at": time.time()}
+        return web.json_response(self._openai_batch(self._batches[batch_id]))
+
+    def _openai_batch(self, batch: dict) -> dict:
+        if not self._finished(batch):
+            return {"id": batch["id"], "object": "batch", "status": "in_progress", "output_file_id": None}
+        if "output_file_id" not in batch:
+            lines = []
+            for line in self._files[batch["input_file_id"]].decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                if self._fails():
+                    lines.append({"custom_id": request["custom_id"], "response": None, "error": {"code": "server_error", "message": "simulated failure"}})
+                    continue
+                completion = fake_completion(request["body"]["messages"][-1]["content"], self._random)
+                body = {"choices": [{"message": {"role": "assistant", "content": completion}, "finish_reason": "stop"}]}
+                lines.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+            batch["output_file_id"] = f"file-{uuid.uuid4().hex[:12]}"
+            self._files[batch["output_file_id"]] = "".join(
+                json.dumps(line, ensure_ascii=False) + "\n" for line in lines
+            ).encode("utf-8")
+        return {"id": batch["id"], "object": "batch", "status": "completed", "output_file_id": batch["output_file_id"]}
+
+    async def _get_openai_batch(self, request: web.Request) -> web.Response:
+        batch = self._batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "No such batch"}}, status=404)
+        return web.json_response(self._openai_batch(batch))
+
+    # Anthropic
+
+    async def _create_claude_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = {"id": batch_id, "requests": body["requests"], "created_at": time.time()}
+        return web.json_response(self._claude_batch(self._batches[batch_id]))
+
+    def _claude_batch(self, batch: dict) -> dict:
+        ended = self._finished(batch)
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    async def _get_claude_batch(self, request: web.Request) -> web.Response:
+        batch = self._batches.get(request.match_info["batch_id"])
+        if batch is None:
+            return web.json_response({"error": {"message": "No such batch"}}, status=404)
+        return web.json_response(self._claude_batch(batch))
+
+    async def _claude_results(self, request: web.Request) -> web.StreamResponse:
+        batch = self._batches.get(request.match_info["batch_id"])
+        if batch is None or not self._finished(batch):
+            return web.json_response({"error": {"message": "Batch has not ended"}}, status=400)
+        response = web.StreamResponse(headers={"Content-Type": "application/binary"})
+        await response.prepare(request)
+        for item in batch["requests"]:
+            if self._fails():
+                result = {"type": "errored", "error": {"type": "api_error", "message": "simulated failure"}}
+            else:
+                completion = fake_completion(item["params"]["messages"][-1]["content"], self._random)
+                result = {"type": "succeeded", "message": {"content": [{"type": "text", "text": completion}]}}
+            line = json.dumps({"custom_id": item["custom_id"], "result": result}, ensure_ascii=False) + "\n"
+            await response.write(line.encode("utf-8"))
+        return response
+
+async def _serve(args):
+    server = FakeBatchServer(args.processing_seconds, args.failure_rate, args.seed)
+    base_url = await server.start(args.host, args.port)
+    print(f"Fake batch API listening on {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the OpenAI/Anthropic batch APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--processing-seconds", type=float, default=1.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import random
+import re
+from aiohttp import web
+
+from benchmark.latency import LatencyModel
+
+SAMPLE_PAIRS = [
+    ("おはようございます", "좋은 아침입니다"),
+    ("ご注文はお決まりですか", "주문은 정하셨나요?"),
+    ("駅はどこですか", "역은 어디입니까?"),
+    ("もう一度言ってください", "다시 한번 말씀해 주세요"),
+    ("会議は何時からですか", "회의는 몇 시부터입니까?"),
+    ("この席は空いていますか", "이 자리 비어 있나요?"),
+]
+
+def fake_completion(prompt: str, rng: random.Random) -> str:
+    """Produce a plausible answer for each prompt the bot sends"""
+    if "Evaluate this translation" in prompt:
+        stars = "⭐" * rng.randint(2, 5)
+        return f"Stars: {stars}\nFeedback: 좋아요"
+    if "hiragana reading" in prompt:
+        return "きょう は よい てんき です ね"
+    match = re.search(r"대화 쌍을 (\d+)개", prompt)
+    if match:
+        items = []
+        for _ in range(int(match.group(1))):
+            jp, kr = rng.choice(SAMPLE_PAIRS)
+            items.append({"jp": jp, "kr": kr})
+        return "```json\n" + json.dumps(items, ensure_ascii=False, indent=2) + "\n```"
+    return "pong"
+
+def _chunks(text: str, size: int = 24):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+class FakeLLMServer:
+    """Local stand-in for the OpenAI chat completions and Claude messages APIs"""
+
+    def __init__(self, latency: LatencyModel = None, stream_chunk_delay: float = 0.0, seed: int = None):
+        self.latency = latency or LatencyModel()
+        self.stream_chunk_delay = stream_chunk_delay
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._runner = None
+        self.base_url = ""
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._openai)
+        app.router.add_post("/v1/messages", self._claude)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _begin(self):
+        self.calls += 1
+        await self.latency.wait()
+        if self.latency.should_fail():
+            self.errors += 1
+            return web.json_response({"error": {"message": "simulated failure"}}, status=503)
+        return None
+
+    @staticmethod
+    def _usage(prompt: str, completion: str) -> tuple:
+        # Rough token estimate, good enough for load accounting
+        return len(prompt) // 2, len(completion) // 2
+
+    async def _openai(self, request: web.Request) -> web.StreamResponse:
+        error = await self._begin()
+        if error:
+            return error
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        completion = fake_completion(prompt, self._random)
+        prompt_tokens, completion_tokens = self._usage(prompt, completion)
+
+        if not body.get("stream"):
+            return web.json_response({
+                "choices": [{"message": {"role": "assistant", "content": completion}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for piece in _chunks(completion):
+            event = {"choices": [{"delta": {"content": piece}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if self.stream_chunk_delay:
+                await asyncio.sleep(self.stream_chunk_delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}}
+            await response.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def _claude(self, request: web.Request) -> web.StreamResponse:
+        error = await self._begin()
+        if error:
+            return error
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        completion = fake_completion(prompt, self._random)
+        prompt_tokens, completion_tokens = self._usage(prompt, completion)
+
+        if not body.get("stream"):
+            return web.json_response({
+                "content": [{"type": "text", "text": completion}],
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        start = {"type": "message_start", "message": {"usage": {"input_tokens": prompt_tokens, "output_tokens": 0}}}
+        await response.write(f"event: message_start\ndata: {json.dumps(start)}\n\n".encode("utf-8"))
+        for piece in _chunks(completion):
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+            await response.write(f"event: content_block_delta\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if self.stream_chunk_delay:
+                await asyncio.sleep(self.stream_chunk_delay)
+        delta = {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": completion_tokens}}
+        await response.write(f"event: message_delta\ndata: {json.dumps(delta)}\n\n".encode("utf-8"))
+        await response.write(b'event: message_stop\ndata: {"type": "message_stop"}\n\n')
+        return response
@@ -0,0 +1,92 @@
+import itertools
+import json
+import time
+from aiohttp import web
+
+from benchmark.latency import LatencyModel
+
+# Methods that deliver something to the user; used for the send rate
+SEND_METHODS = {"sendMessage", "editMessageText", "sendAudio", "sendVoice"}
+
+class FakeTelegramServer:
+    """Local stand-in for the Telegram Bot API (`/bot<token>/<method>`)"""
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        self.calls = {}
+        self.send_times = []
+        self._message_ids = itertools.count(1000)
+        self._runner = None
+        self.base_url = ""
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def reset_counters(self):
+        self.calls = {}
+        self.send_times = []
+
+    @property
+    def messages_sent(self) -> int:
+        return len(self.send_times)
+
+    async def _read_params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            params[key] = value if isinstance(value, str) else "<file>"
+        return params
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        message.update(extra)
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._read_params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await self.latency.wait()
+
+        if self.latency.should_fail() and method in SEND_METHODS:
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"}, status=500)
+
+        if method in SEND_METHODS:
+            self.send_times.append(time.monotonic())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params)
+        elif method in ("sendAudio", "sendVoice"):
+            result = self._message(params, audio={"file_id": "audio", "file_unique_id": "audio", "duration": 1})
+        elif method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result}, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
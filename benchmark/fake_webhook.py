@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import aiohttp
+
+from benchmark.run import BENCH_USER_BASE, callback_update, command_update, percentile, text_update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class FakeWebhookSender:
+    """Local stand-in for Telegram's side of a webhook: POSTs updates to the bot.
+
+    Records the status and acknowledgement time of every request, which is
+    what Telegram sees of a webhook (the update is handled after the 200).
+
+        python -m benchmark.fake_webhook --url http://127.0.0.1:8443/telegram --secret bench --users 20 --updates 200
+    """
+
+    def __init__(self, url: str, secret: str = ""):
+        self.url = url
+        self.secret = secret
+        self.statuses = {}
+        self.ack_times = []
+        self._update_ids = itertools.count(1)
+
+    async def send(self, session: aiohttp.ClientSession, update: dict, secret: str = None) -> int:
+        headers = {SECRET_HEADER: self.secret if secret is None else secret}
+        start = time.perf_counter()
+        async with session.post(self.url, json=update, headers=headers) as response:
+            await response.read()
+            status = response.status
+        self.ack_times.append(time.perf_counter() - start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status
+
+    def random_update(self, rng: random.Random, users: int) -> dict:
+        update_id = next(self._update_ids)
+        user_id = BENCH_USER_BASE + rng.randrange(users)
+        kind = rng.random()
+        if kind < 0.4:
+            return command_update(update_id, user_id, "/push")
+        if kind < 0.8:
+            return callback_update(update_id, user_id, rng.choice(["show_jp_1", "listen_jp_1", "new_quiz"]))
+        return text_update(update_id, user_id, "こんにちは")
+
+    async def run(self, users: int, updates: int, concurrency: int = 10, seed: int = None) -> dict:
+        rng = random.Random(seed)
+        batch = [self.random_update(rng, users) for _ in range(updates)]
+        slots = asyncio.Semaphore(concurrency)
+
+        async def post(update: dict):
+            async with slots:
+                await self.send(session, update)
+
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(post(update) for update in batch))
+            duration = time.perf_counter() - start
+            # Telegram-side checks: a wrong secret must be refused
+            rejected = await self.send(session, self.random_update(rng, users), secret="wrong")
+        return {
+            "updates": updates,
+            "statuses": self.statuses,
+            "wrong_secret_status": rejected,
+            "updates_per_second": updates / duration if duration else 0.0,
+            "ack_p50_ms": percentile(self.ack_times, 0.5) * 1000,
+            "ack_p95_ms": percentile(self.ack_times, 0.95) * 1000,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="POST synthetic Telegram updates to a webhook endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    sender = FakeWebhookSender(args.url, args.secret)
+    result = asyncio.run(sender.run(args.users, args.updates, args.concurrency, args.seed))
+    for key, value in result.items():
+        print(f"{key}: {value}")
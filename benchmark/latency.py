@@ -0,0 +1,24 @@
+import asyncio
+import random
+
+class LatencyModel:
+    """Log-normal response latency with an optional error rate"""
+
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.5, error_rate: float = 0.0, seed: int = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def sample_seconds(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * self._random.lognormvariate(0.0, self.sigma) / 1000.0
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    async def wait(self):
+        delay = self.sample_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,112 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from conversation_store import ConversationStore
+from corpus_snapshot import CorpusSnapshot, write_snapshot
+
+LEVELS = ["N5", "N4", "N3", "N2", "N1"]
+THEMES = ["식당", "쇼핑", "여행", "학교", "회사", "병원", "날씨", "취미"]
+
+def synthetic_corpus(count: int, seed: int = 1, source: str = "data.json") -> str:
+    """data.json text with `count` conversations, cycling the real ones (with unique texts) if available"""
+    try:
+        with open(source, "r", encoding="utf-8") as f:
+            templates = json.load(f).get("conversations", [])
+    except (OSError, ValueError):
+        templates = []
+    rng = random.Random(seed)
+    conversations = []
+    for i in range(count):
+        if templates:
+            template = templates[i % len(templates)]
+            jp, kr = template["jp"], template["kr"]
+            level, theme = template.get("level", "N5"), template.get("theme")
+        else:
+            jp = "すみません、この近くに駅はありますか？ はい、まっすぐ行って右です。"
+            kr = "실례합니다, 이 근처에 역이 있나요? 네, 쭉 가서 오른쪽입니다."
+            level, theme = rng.choice(LEVELS), rng.choice(THEMES)
+        conv = {"id": i + 1, "level": level, "jp": f"{jp} #{i}", "kr": f"{kr} #{i}"}
+        if theme:
+            conv["theme"] = theme
+        conversations.append(conv)
+    return json.dumps({"conversations": conversations}, ensure_ascii=False)
+
+def traced_bytes(build: Callable[[], object]) -> tuple:
+    """Heap bytes still held by what `build` returns, once its temporaries are freed"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return held, result
+
+def serve_ns(corpus, levels: List[str], samples: int) -> float:
+    """Mean time to pick a random conversation of a level and read its texts, the stored-serve path"""
+    by_level = {level: corpus.by_level(level) if hasattr(corpus, "by_level") else [c for c in corpus if c["level"] == level]
+                for level in levels}
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for _ in range(samples):
+        conv = rng.choice(by_level[rng.choice(levels)])
+        _ = conv["jp"], conv["kr"]
+    return (time.perf_counter() - start) / samples * 1e9
+
+def run(count: int, samples: int) -> Dict:
+    text = synthetic_corpus(count)
+    results = {"conversations": count}
+
+    dicts_bytes, dicts = traced_bytes(lambda: json.loads(text)["conversations"])
+    levels = sorted({conv["level"] for conv in dicts})
+    results["dicts"] = {"bytes": dicts_bytes, "serve_ns": serve_ns(dicts, levels, samples)}
+
+    store_bytes, store = traced_bytes(lambda: ConversationStore(json.loads(text)["conversations"]))
+    results["store"] = {"bytes": store_bytes, "serve_ns": serve_ns(store, levels, samples)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.snapshot")
+        write_snapshot(dicts, path)
+        snapshot_bytes, snapshot = traced_bytes(lambda: CorpusSnapshot(path))
+        results["snapshot"] = {
+            "bytes": snapshot_bytes,
+            # Page cache, shared by every process mapping the file
+            "mapped_bytes": os.path.getsize(path),
+            "serve_ns": serve_ns(snapshot, levels, samples),
+        }
+        snapshot.close()
+
+    for name in ("dicts", "store", "snapshot"):
+        results[name]["bytes_per_conversation"] = results[name]["bytes"] / count if count else 0.0
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory per conversation for the in-memory corpus representations")
+    parser.add_argument("--count", type=int, default=200000, help="conversations in the synthetic corpus")
+    parser.add_argument("--samples", type=int, default=100000, help="random serves timed per representation")
+    parser.add_argument("--output", default="", help="write JSON results here as well")
+    args = parser.parse_args(argv)
+
+    results = run(args.count, args.samples)
+    print(f"🧠 {args.count} conversations")
+    for name, label in (("dicts", "list of dicts"), ("store", "ConversationStore"), ("snapshot", "CorpusSnapshot")):
+        row = results[name]
+        line = f"  {label:<18} {row['bytes_per_conversation']:8.1f} B/conv  {row['bytes'] / 1048576:8.1f} MiB heap"
+        if "mapped_bytes" in row:
+            line += f" + {row['mapped_bytes'] / 1048576:.1f} MiB mapped"
+        print(f"{line}  serve {row['serve_ns']:.0f}ns")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(json.dumps(results, indent=2) + "\n")
+        print(f"💾 Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark.fake_llm import FakeLLMServer
+from benchmark.fake_telegram import FakeTelegramServer
+from benchmark.latency import LatencyModel
+
+SCENARIOS = ["push", "callbacks", "quiz", "broadcast"]
+BENCH_USER_BASE = 100000
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_version() -> str:
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=5)
+        return result.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}"}
+
+def _chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private"}
+
+def command_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": _chat(user_id), "from": _user(user_id),
+            "text": text, "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        }
+    }
+
+def text_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": _chat(user_id), "from": _user(user_id), "text": text}
+    }
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": _user(user_id), "chat_instance": str(user_id), "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": _chat(user_id), "text": "practice"}
+        }
+    }
+
+def configure(args, llm_url: str, telegram_url: str, workdir: str):
+    """Point the bot at the local stand-ins; must run before llm/handlers are imported"""
+    from config import config
+    config.bot_token = "123456:BENCHMARK"
+    config.llm_provider = args.provider
+    config.llm_providers = [args.provider]
+    config.llm_api_key = "benchmark"
+    config.llm_api_keys = {args.provider: "benchmark"}
+    config.openai_base_url = llm_url
+    config.claude_base_url = llm_url
+    config.telegram_base_url = telegram_url
+    config.admin_ids = []
+    config.llm_record_path = args.record
+    config.llm_replay_path = args.replay
+    config.llm_replay_latency_scale = args.replay_latency_scale
+    # Jobs, rate-limit buckets and the delivery ledger stay out of the real state database
+    config.state_db_path = os.path.join(workdir, "bot_state.db")
+
+    import utils
+    utils.DATA_FILE = os.path.join(workdir, "data.json")
+    utils.WORDBOOK_DIR = os.path.join(workdir, "wordbooks")
+    utils.AUDIO_DIR = os.path.join(workdir, "audio_cache")
+    os.makedirs(utils.WORDBOOK_DIR, exist_ok=True)
+    os.makedirs(utils.AUDIO_DIR, exist_ok=True)
+    if os.path.exists("data.json"):
+        shutil.copy("data.json", utils.DATA_FILE)
+    utils.data_manager.load_data()
+    utils.data_manager.toggle_realtime_generation(not args.no_realtime)
+
+    # Pre-cache audio so listen_ callbacks measure the bot, not gTTS
+    for conv in utils.data_manager.conversations:
+        with open(os.path.join(utils.AUDIO_DIR, f"conv_{conv['id']}.mp3"), "wb") as f:
+            f.write(b"\0" * 1024)
+
+def llm_call_count() -> int:
+    """LLM requests issued by the bot, counted on its side so replayed runs are included"""
+    from metrics import metrics
+    histogram = metrics.histogram("llm_request_duration_seconds", "LLM call latency", ("provider", "operation"))
+    return sum(series["count"] for key, series in histogram.snapshot().items() if key[1] != "probe")
+
+class BenchmarkDriver:
+    def __init__(self, application, bot, llm_server: FakeLLMServer, telegram_server: FakeTelegramServer, args):
+        self.application = application
+        self.bot = bot
+        self.llm_server = llm_server
+        self.telegram_server = telegram_server
+        self.args = args
+        self.errors = 0
+        self._update_ids = iter(range(1, 10 ** 9))
+        self._random = random.Random(args.seed)
+        from utils import data_manager
+        self.stored_ids = [c["id"] for c in data_manager.conversations]
+
+    async def count_error(self, update, context):
+        self.errors += 1
+
+    async def _process(self, payload: dict, latencies: list):
+        from telegram import Update
+        update = Update.de_json(payload, self.application.bot)
+        start = time.perf_counter()
+        # Same path as polling, so the concurrency limit and per-chat ordering apply
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    def _user_ids(self) -> list:
+        return [BENCH_USER_BASE + i for i in range(self.args.users)]
+
+    async def _push_user(self, user_id: int, latencies: list):
+        for _ in range(self.args.actions):
+            await self._process(command_update(next(self._update_ids), user_id, "/push"), latencies)
+
+    async def _callbacks_user(self, user_id: int, latencies: list):
+        actions = ["show_jp_{}", "show_kr_{}", "save_{}", "listen_jp_{}"]
+        for i in range(self.args.actions):
+            data = actions[i % len(actions)].format(self._random.choice(self.stored_ids))
+            await self._process(callback_update(next(self._update_ids), user_id, data), latencies)
+
+    async def _quiz_user(self, user_id: int, latencies: list):
+        for _ in range(self.args.actions):
+            conv_id = self._random.choice(self.stored_ids)
+            await self._process(callback_update(next(self._update_ids), user_id, f"quiz_{conv_id}"), latencies)
+            await self._process(text_update(next(self._update_ids), user_id, "주문은 정하셨나요?"), latencies)
+
+    async def run_scenario(self, name: str) -> dict:
+        latencies = []
+        errors_before = self.errors
+        llm_calls_before = llm_call_count()
+        self.telegram_server.reset_counters()
+
+        start = time.perf_counter()
+        if name == "broadcast":
+            # Time each delivery (practice generation + send) as the per-action latency
+            deliver = self.bot.delivery.send
+
+            async def timed_deliver(user_id):
+                delivery_start = time.perf_counter()
+                try:
+                    return await deliver(user_id)
+                finally:
+                    latencies.append((time.perf_counter() - delivery_start) * 1000)
+
+            self.bot.delivery.send = timed_deliver
+            try:
+                await self.bot.daily_broadcast()
+            finally:
+                self.bot.delivery.send = deliver
+            actions = self.args.users
+        else:
+            per_user = {"push": self._push_user, "callbacks": self._callbacks_user, "quiz": self._quiz_user}[name]
+            await asyncio.gather(*(per_user(uid, latencies) for uid in self._user_ids()))
+            actions = len(latencies)
+        duration = time.perf_counter() - start
+
+        return {
+            "actions": actions,
+            "duration_s": round(duration, 4),
+            "messages_sent": self.telegram_server.messages_sent,
+            "messages_per_sec": round(self.telegram_server.messages_sent / duration, 2) if duration else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(max(latencies), 2) if latencies else 0.0
+            },
+            "llm_calls": llm_call_count() - llm_calls_before,
+            "llm_calls_per_action": round((llm_call_count() - llm_calls_before) / actions, 3) if actions else 0.0,
+            "errors": self.errors - errors_before,
+            "telegram_calls": dict(self.telegram_server.calls)
+        }
+
+async def run_benchmark(args) -> dict:
+    llm_server = FakeLLMServer(
+        LatencyModel(args.llm_latency_ms, args.llm_sigma, args.llm_error_rate, seed=args.seed),
+        stream_chunk_delay=args.llm_chunk_delay_ms / 1000.0,
+        seed=args.seed
+    )
+    telegram_server = FakeTelegramServer(
+        LatencyModel(args.telegram_latency_ms, args.telegram_sigma, args.telegram_error_rate, seed=args.seed)
+    )
+    await llm_server.start()
+    await telegram_server.start()
+    workdir = tempfile.mkdtemp(prefix="bench_")
+
+    try:
+        configure(args, llm_server.base_url, telegram_server.base_url, workdir)
+
+        # Imported late: llm_manager reads config at import time
+        from telegram.ext import PicklePersistence
+        from main import JapaneseLearningBot
+
+        bot = JapaneseLearningBot()
+        persistence = PicklePersistence(filepath=os.path.join(workdir, "bot_data.pickle"))
+        application = bot.build_application(persistence=persistence)
+        driver = BenchmarkDriver(application, bot, llm_server, telegram_server, args)
+        application.add_error_handler(driver.count_error)
+
+        await application.initialize()
+        levels = ["N5", "N4", "N3", "N2", "N1"]
+        for i, user_id in enumerate(driver._user_ids()):
+            data = {"level": levels[i % len(levels)]}
+            application.user_data[user_id].update(data)
+            await persistence.update_user_data(user_id, data)
+
+        results = {}
+        try:
+            for name in args.scenarios:
+                print(f"▶️ Running scenario: {name}", file=sys.stderr)
+                results[name] = await driver.run_scenario(name)
+        finally:
+            await application.shutdown()
+
+        return {
+            "version": args.label or git_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "parameters": {
+                "users": args.users, "actions": args.actions, "provider": args.provider,
+                "realtime": not args.no_realtime, "seed": args.seed, "replay": args.replay,
+                "llm_latency_ms": args.llm_latency_ms, "llm_sigma": args.llm_sigma, "llm_error_rate": args.llm_error_rate,
+                "telegram_latency_ms": args.telegram_latency_ms, "telegram_error_rate": args.telegram_error_rate
+            },
+            "scenarios": results,
+            "peak_rss_mb": round(peak_rss_mb(), 1)
+        }
+    finally:
+        await llm_server.stop()
+        await telegram_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bot against local LLM and Telegram stand-ins")
+    parser.add_argument("--users", type=int, default=20, help="simulated users")
+    parser.add_argument("--actions", type=int, default=5, help="actions per user per scenario")
+    parser.add_argument("--scenarios", type=lambda s: [x.strip() for x in s.split(",") if x.strip()], default=SCENARIOS,
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--provider", choices=["openai", "claude"], default="openai")
+    parser.add_argument("--no-realtime", action="store_true", help="serve stored conversations only")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0, help="median LLM response latency")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="log-normal spread of LLM latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-chunk-delay-ms", type=float, default=0.0, help="delay between streamed chunks")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0, help="median Bot API latency")
+    parser.add_argument("--telegram-sigma", type=float, default=0.3)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--record", default="", help="record LLM traffic to this log (.gz to compress)")
+    parser.add_argument("--replay", default="", help="serve LLM responses from a recorded log instead of the stand-in")
+    parser.add_argument("--replay-latency-scale", type=float, default=1.0, help="multiply recorded latencies when replaying")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="version label stored with the results (default: git describe)")
+    parser.add_argument("--output", default="", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"💾 Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import time
+from collections import deque
+
+class CircuitBreaker:
+    """Per-provider circuit breaker driven by error rate and latency.
+
+    Outcomes of the last `window_size` calls are kept; a call counts as bad
+    when it failed or took longer than its slow-call threshold. Once at least
+    `min_calls` outcomes are known and the bad ratio reaches `failure_rate`
+    the circuit opens and callers fail fast. After `open_seconds` the circuit
+    goes half-open and a single trial call (or health probe) decides whether
+    it closes again or re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window_size: int = 20,
+                 min_calls: int = 5, open_seconds: float = 30.0, on_state_change=None):
+        self.name = name
+        self.on_state_change = on_state_change
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=window_size)
+        self._trial_in_flight = False
+
+    def _transition(self, state: str):
+        if state != self.state:
+            print(f"🔌 Circuit '{self.name}': {self.state} → {state}")
+            self.state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+        elif state == self.CLOSED:
+            self._outcomes.clear()
+            self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """True while callers should not send traffic to the provider"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.open_seconds
+
+    def ready_for_probe(self) -> bool:
+        return self.state != self.CLOSED and not self.is_open() and not self._trial_in_flight
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.is_open():
+            return False
+        # Open period elapsed: let exactly one trial through
+        if self._trial_in_flight:
+            return False
+        self._transition(self.HALF_OPEN)
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self, latency: float, slow_threshold: float = None):
+        if slow_threshold is not None and latency > slow_threshold:
+            self.record_failure()
+            return
+        if self.state == self.HALF_OPEN:
+            self._transition(self.CLOSED)
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._transition(self.OPEN)
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.min_calls:
+            bad = sum(1 for ok in self._outcomes if not ok)
+            if bad / len(self._outcomes) >= self.failure_rate:
+                self._transition(self.OPEN)
+
+    def release_trial(self):
+        """Give back a half-open trial slot that ended without an outcome"""
+        self._trial_in_flight = False
+
+    def get_status(self) -> dict:
+        bad = sum(1 for ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window": len(self._outcomes),
+            "failure_rate": bad / len(self._outcomes) if self._outcomes else 0.0,
+            "open_for": max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)) if self.state == self.OPEN else 0.0
+        }
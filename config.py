@@ -1,5 +1,6 @@
 import os
 import json
+import re
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -13,6 +14,86 @@ class Config:
         self.admin_ids: list[int] = []
         self.timezone: str = "Asia/Seoul"
         self.daily_time: str = "09:00"
+        # Per-operation LLM timeouts in seconds
+        self.llm_timeouts: dict[str, float] = {
+            "generation": 60.0,
+            "realtime_generation": 8.0,
+            "evaluation": 10.0,
+            "furigana": 6.0
+        }
+        # Total time a user-facing handler may spend waiting on LLM calls
+        self.response_budget: float = 15.0
+        # Circuit breaker: open when this share of the last CIRCUIT_WINDOW calls failed or were slow
+        self.circuit_failure_rate: float = 0.5
+        self.circuit_window: int = 20
+        self.circuit_open_seconds: float = 30.0
+        self.circuit_probe_interval: float = 15.0
+        # Ordered provider pool; calls fail over down the list
+        self.llm_providers: list[str] = []
+        self.llm_api_keys: dict[str, str] = {}
+        # Hedged requests: operations allowed to hedge, share of calls that may
+        # hedge, and the delay used before a provider has latency history
+        self.hedge_operations: list[str] = ["evaluation", "furigana"]
+        self.hedge_budget: float = 0.1
+        self.hedge_delay: float = 2.0
+        # API endpoints, overridable to point at proxies or local stand-ins
+        self.openai_base_url: str = "https://api.openai.com"
+        self.claude_base_url: str = "https://api.anthropic.com"
+        self.telegram_base_url: str = "https://api.telegram.org"
+        # Record LLM traffic to a log, or replay a log instead of calling providers
+        self.llm_record_path: str = ""
+        self.llm_replay_path: str = ""
+        self.llm_replay_latency_scale: float = 1.0
+        # Local Prometheus endpoint; disabled while the port is 0
+        self.metrics_host: str = "127.0.0.1"
+        self.metrics_port: int = 0
+        # Webhook mode: receive updates at WEBHOOK_URL + WEBHOOK_PATH instead of long polling; disabled while the URL is empty
+        self.webhook_url: str = ""
+        self.webhook_path: str = "/telegram"
+        self.webhook_host: str = "0.0.0.0"
+        self.webhook_port: int = 8443
+        self.webhook_secret: str = ""
+        # Multi-process mode: worker processes behind a router, their local ports (base + index), and the leader lock file
+        self.workers: int = 1
+        self.worker_base_port: int = 8600
+        self.leader_lock_path: str = "bot_leader.lock"
+        # Per-update tracing: share of updates with a span breakdown, and the slow-update log threshold
+        self.trace_sample_rate: float = 0.1
+        self.slow_update_threshold: float = 3.0
+        # Event-loop lag monitor: log the blocking stack when the loop stalls longer than the threshold
+        self.loop_monitor: bool = False
+        self.loop_lag_threshold: float = 0.25
+        # Updates handled in parallel across chats; each chat's updates stay sequential
+        self.max_concurrent_updates: int = 32
+        # Per-user limit on actions that spend LLM/TTS time (/push and buttons): refill rate and burst
+        self.user_rate_per_minute: float = 10.0
+        self.user_burst: int = 5
+        # Admin /generate jobs: largest request, conversations per LLM call, calls in parallel, seconds between progress edits
+        self.generation_max_count: int = 1000
+        self.generation_chunk_size: int = 10
+        self.generation_chunk_concurrency: int = 3
+        self.generation_progress_interval: float = 3.0
+        # Hourly practice delivery: local hours (inclusive) and concurrent deliveries
+        self.delivery_start_hour: int = 9
+        self.delivery_end_hour: int = 23
+        self.delivery_concurrency: int = 8
+        # Seconds between status checks of a submitted OpenAI/Anthropic batch (run_mass_generation.py --batch)
+        self.batch_poll_interval: float = 30.0
+        # LLM scheduler: concurrent calls per provider, and seconds of waiting that promote a call one priority class
+        self.llm_max_concurrency: int = 8
+        self.llm_priority_aging: float = 10.0
+        # Serve the corpus from a memory-mapped binary snapshot of data.json (rebuilt when data.json changes); off while empty
+        self.corpus_snapshot_path: str = ""
+        # Shared SQLite state (rate-limit buckets, ...) used by the bot and the scripts
+        self.state_db_path: str = "bot_state.db"
+        # Per-provider requests/tokens per minute (0 = unlimited), and the pause after a 429 without Retry-After
+        self.llm_rate_limits: dict[str, dict] = {}
+        self.rate_limit_backoff: float = 5.0
+        # Real-time generation: target share of fresh conversations, and the load limits that shed it
+        self.realtime_ratio: float = 0.8
+        self.realtime_p95_target: float = 4.0
+        self.realtime_max_error_rate: float = 0.2
+        self.realtime_max_queue: int = 8
         
         self._load_config()
     
@@ -28,6 +109,56 @@ class Config:
                 self.admin_ids = config_data.get("ADMIN_IDS", [])
                 self.timezone = config_data.get("TIMEZONE", "Asia/Seoul")
                 self.daily_time = config_data.get("DAILY_TIME", "09:00")
+                self.llm_timeouts.update({k: float(v) for k, v in config_data.get("LLM_TIMEOUTS", {}).items()})
+                self.response_budget = float(config_data.get("RESPONSE_BUDGET", self.response_budget))
+                self.circuit_failure_rate = float(config_data.get("CIRCUIT_FAILURE_RATE", self.circuit_failure_rate))
+                self.circuit_window = int(config_data.get("CIRCUIT_WINDOW", self.circuit_window))
+                self.circuit_open_seconds = float(config_data.get("CIRCUIT_OPEN_SECONDS", self.circuit_open_seconds))
+                self.circuit_probe_interval = float(config_data.get("CIRCUIT_PROBE_INTERVAL", self.circuit_probe_interval))
+                self.hedge_operations = config_data.get("HEDGE_OPERATIONS", self.hedge_operations)
+                self.hedge_budget = float(config_data.get("HEDGE_BUDGET", self.hedge_budget))
+                self.hedge_delay = float(config_data.get("HEDGE_DELAY", self.hedge_delay))
+                self.openai_base_url = config_data.get("OPENAI_BASE_URL", self.openai_base_url)
+                self.claude_base_url = config_data.get("CLAUDE_BASE_URL", self.claude_base_url)
+                self.telegram_base_url = config_data.get("TELEGRAM_BASE_URL", self.telegram_base_url)
+                self.llm_record_path = config_data.get("LLM_RECORD_PATH", os.getenv("LLM_RECORD_PATH", ""))
+                self.llm_replay_path = config_data.get("LLM_REPLAY_PATH", os.getenv("LLM_REPLAY_PATH", ""))
+                self.llm_replay_latency_scale = float(config_data.get("LLM_REPLAY_LATENCY_SCALE", self.llm_replay_latency_scale))
+                self.metrics_host = config_data.get("METRICS_HOST", self.metrics_host)
+                self.metrics_port = int(config_data.get("METRICS_PORT", self.metrics_port))
+                self.webhook_url = config_data.get("WEBHOOK_URL", self.webhook_url)
+                self.webhook_path = config_data.get("WEBHOOK_PATH", self.webhook_path)
+                self.webhook_host = config_data.get("WEBHOOK_HOST", self.webhook_host)
+                self.webhook_port = int(config_data.get("WEBHOOK_PORT", self.webhook_port))
+                self.webhook_secret = config_data.get("WEBHOOK_SECRET", self.webhook_secret)
+                self.workers = int(config_data.get("WORKERS", self.workers))
+                self.worker_base_port = int(config_data.get("WORKER_BASE_PORT", self.worker_base_port))
+                self.leader_lock_path = config_data.get("LEADER_LOCK_PATH", self.leader_lock_path)
+                self.trace_sample_rate = float(config_data.get("TRACE_SAMPLE_RATE", self.trace_sample_rate))
+                self.slow_update_threshold = float(config_data.get("SLOW_UPDATE_THRESHOLD", self.slow_update_threshold))
+                self.loop_monitor = str(config_data.get("LOOP_MONITOR", self.loop_monitor)).lower() in ("1", "true", "yes")
+                self.loop_lag_threshold = float(config_data.get("LOOP_LAG_THRESHOLD", self.loop_lag_threshold))
+                self.max_concurrent_updates = int(config_data.get("MAX_CONCURRENT_UPDATES", self.max_concurrent_updates))
+                self.user_rate_per_minute = float(config_data.get("USER_RATE_PER_MINUTE", self.user_rate_per_minute))
+                self.user_burst = int(config_data.get("USER_BURST", self.user_burst))
+                self.generation_max_count = int(config_data.get("GENERATION_MAX_COUNT", self.generation_max_count))
+                self.generation_chunk_size = int(config_data.get("GENERATION_CHUNK_SIZE", self.generation_chunk_size))
+                self.generation_chunk_concurrency = int(config_data.get("GENERATION_CHUNK_CONCURRENCY", self.generation_chunk_concurrency))
+                self.generation_progress_interval = float(config_data.get("GENERATION_PROGRESS_INTERVAL", self.generation_progress_interval))
+                self.corpus_snapshot_path = config_data.get("CORPUS_SNAPSHOT_PATH", self.corpus_snapshot_path)
+                self.batch_poll_interval = float(config_data.get("BATCH_POLL_INTERVAL", self.batch_poll_interval))
+                self.delivery_start_hour = int(config_data.get("DELIVERY_START_HOUR", self.delivery_start_hour))
+                self.delivery_end_hour = int(config_data.get("DELIVERY_END_HOUR", self.delivery_end_hour))
+                self.delivery_concurrency = int(config_data.get("DELIVERY_CONCURRENCY", self.delivery_concurrency))
+                self.llm_max_concurrency = int(config_data.get("LLM_MAX_CONCURRENCY", self.llm_max_concurrency))
+                self.llm_priority_aging = float(config_data.get("LLM_PRIORITY_AGING", self.llm_priority_aging))
+                self.state_db_path = config_data.get("STATE_DB_PATH", os.getenv("STATE_DB_PATH", self.state_db_path))
+                self.rate_limit_backoff = float(config_data.get("RATE_LIMIT_BACKOFF", self.rate_limit_backoff))
+                self.realtime_ratio = float(config_data.get("REALTIME_RATIO", self.realtime_ratio))
+                self.realtime_p95_target = float(config_data.get("REALTIME_P95_TARGET", self.realtime_p95_target))
+                self.realtime_max_error_rate = float(config_data.get("REALTIME_MAX_ERROR_RATE", self.realtime_max_error_rate))
+                self.realtime_max_queue = int(config_data.get("REALTIME_MAX_QUEUE", self.realtime_max_queue))
+                self._load_provider_pool(config_data)
         else:
             self.bot_token = os.getenv("BOT_TOKEN", "")
             self.llm_provider = os.getenv("LLM_PROVIDER", "gemini")
@@ -36,14 +167,105 @@ class Config:
             self.admin_ids = [int(id.strip()) for id in admin_ids_str.split(",") if id.strip()]
             self.timezone = os.getenv("TIMEZONE", "Asia/Seoul")
             self.daily_time = os.getenv("DAILY_TIME", "09:00")
+            for operation in self.llm_timeouts:
+                env_value = os.getenv(f"LLM_TIMEOUT_{operation.upper()}")
+                if env_value:
+                    self.llm_timeouts[operation] = float(env_value)
+            self.response_budget = float(os.getenv("RESPONSE_BUDGET", self.response_budget))
+            self.circuit_failure_rate = float(os.getenv("CIRCUIT_FAILURE_RATE", self.circuit_failure_rate))
+            self.circuit_window = int(os.getenv("CIRCUIT_WINDOW", self.circuit_window))
+            self.circuit_open_seconds = float(os.getenv("CIRCUIT_OPEN_SECONDS", self.circuit_open_seconds))
+            self.circuit_probe_interval = float(os.getenv("CIRCUIT_PROBE_INTERVAL", self.circuit_probe_interval))
+            hedge_operations_str = os.getenv("HEDGE_OPERATIONS")
+            if hedge_operations_str is not None:
+                self.hedge_operations = [op.strip() for op in hedge_operations_str.split(",") if op.strip()]
+            self.hedge_budget = float(os.getenv("HEDGE_BUDGET", self.hedge_budget))
+            self.hedge_delay = float(os.getenv("HEDGE_DELAY", self.hedge_delay))
+            self.openai_base_url = os.getenv("OPENAI_BASE_URL", self.openai_base_url)
+            self.claude_base_url = os.getenv("CLAUDE_BASE_URL", self.claude_base_url)
+            self.telegram_base_url = os.getenv("TELEGRAM_BASE_URL", self.telegram_base_url)
+            self.llm_record_path = os.getenv("LLM_RECORD_PATH", "")
+            self.llm_replay_path = os.getenv("LLM_REPLAY_PATH", "")
+            self.llm_replay_latency_scale = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", self.llm_replay_latency_scale))
+            self.metrics_host = os.getenv("METRICS_HOST", self.metrics_host)
+            self.metrics_port = int(os.getenv("METRICS_PORT", self.metrics_port))
+            self.webhook_url = os.getenv("WEBHOOK_URL", self.webhook_url)
+            self.webhook_path = os.getenv("WEBHOOK_PATH", self.webhook_path)
+            self.webhook_host = os.getenv("WEBHOOK_HOST", self.webhook_host)
+            self.webhook_port = int(os.getenv("WEBHOOK_PORT", self.webhook_port))
+            self.webhook_secret = os.getenv("WEBHOOK_SECRET", self.webhook_secret)
+            self.workers = int(os.getenv("WORKERS", self.workers))
+            self.worker_base_port = int(os.getenv("WORKER_BASE_PORT", self.worker_base_port))
+            self.leader_lock_path = os.getenv("LEADER_LOCK_PATH", self.leader_lock_path)
+            self.trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", self.trace_sample_rate))
+            self.slow_update_threshold = float(os.getenv("SLOW_UPDATE_THRESHOLD", self.slow_update_threshold))
+            self.loop_monitor = os.getenv("LOOP_MONITOR", "").lower() in ("1", "true", "yes")
+            self.loop_lag_threshold = float(os.getenv("LOOP_LAG_THRESHOLD", self.loop_lag_threshold))
+            self.max_concurrent_updates = int(os.getenv("MAX_CONCURRENT_UPDATES", self.max_concurrent_updates))
+            self.user_rate_per_minute = float(os.getenv("USER_RATE_PER_MINUTE", self.user_rate_per_minute))
+            self.user_burst = int(os.getenv("USER_BURST", self.user_burst))
+            self.generation_max_count = int(os.getenv("GENERATION_MAX_COUNT", self.generation_max_count))
+            self.generation_chunk_size = int(os.getenv("GENERATION_CHUNK_SIZE", self.generation_chunk_size))
+            self.generation_chunk_concurrency = int(os.getenv("GENERATION_CHUNK_CONCURRENCY", self.generation_chunk_concurrency))
+            self.generation_progress_interval = float(os.getenv("GENERATION_PROGRESS_INTERVAL", self.generation_progress_interval))
+            self.corpus_snapshot_path = os.getenv("CORPUS_SNAPSHOT_PATH", self.corpus_snapshot_path)
+            self.batch_poll_interval = float(os.getenv("BATCH_POLL_INTERVAL", self.batch_poll_interval))
+            self.delivery_start_hour = int(os.getenv("DELIVERY_START_HOUR", self.delivery_start_hour))
+            self.delivery_end_hour = int(os.getenv("DELIVERY_END_HOUR", self.delivery_end_hour))
+            self.delivery_concurrency = int(os.getenv("DELIVERY_CONCURRENCY", self.delivery_concurrency))
+            self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", self.llm_max_concurrency))
+            self.llm_priority_aging = float(os.getenv("LLM_PRIORITY_AGING", self.llm_priority_aging))
+            self.state_db_path = os.getenv("STATE_DB_PATH", self.state_db_path)
+            self.rate_limit_backoff = float(os.getenv("RATE_LIMIT_BACKOFF", self.rate_limit_backoff))
+            self.realtime_ratio = float(os.getenv("REALTIME_RATIO", self.realtime_ratio))
+            self.realtime_p95_target = float(os.getenv("REALTIME_P95_TARGET", self.realtime_p95_target))
+            self.realtime_max_error_rate = float(os.getenv("REALTIME_MAX_ERROR_RATE", self.realtime_max_error_rate))
+            self.realtime_max_queue = int(os.getenv("REALTIME_MAX_QUEUE", self.realtime_max_queue))
+            self._load_provider_pool({})
+    
+    def _load_provider_pool(self, config_data: dict):
+        """Resolve LLM_PROVIDERS (default: just LLM_PROVIDER) and each provider's API key"""
+        providers = config_data.get("LLM_PROVIDERS", os.getenv("LLM_PROVIDERS", ""))
+        if isinstance(providers, str):
+            providers = [name.strip() for name in providers.split(",") if name.strip()]
+        self.llm_providers = providers or [self.llm_provider]
+        self.llm_provider = self.llm_providers[0]
+        
+        for name in self.llm_providers:
+            key_name = f"{name.upper()}_API_KEY"
+            api_key = config_data.get(key_name, os.getenv(key_name, ""))
+            if not api_key and name == self.llm_providers[0]:
+                api_key = self.llm_api_key
+            self.llm_api_keys[name] = api_key
+            
+            # <NAME>_RPM / <NAME>_TPM, or RATE_LIMITS: {"openai": {"rpm": .., "tpm": ..}} in config.json
+            limits = dict(config_data.get("RATE_LIMITS", {}).get(name, {}))
+            for kind in ("rpm", "tpm"):
+                env_value = os.getenv(f"{name.upper()}_{kind.upper()}")
+                if env_value:
+                    limits[kind] = float(env_value)
+            self.llm_rate_limits[name] = {kind: float(limits.get(kind, 0)) for kind in ("rpm", "tpm")}
+        self.llm_api_key = self.llm_api_keys[self.llm_provider]
     
     def validate(self) -> tuple[bool, Optional[str]]:
         if not self.bot_token:
             return False, "BOT_TOKEN is required"
+        if self.workers < 1:
+            return False, "WORKERS must be at least 1"
+        if self.webhook_url and not self.webhook_path.startswith("/"):
+            return False, "WEBHOOK_PATH must start with /"
+        if self.webhook_secret and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", self.webhook_secret):
+            return False, "WEBHOOK_SECRET may only contain A-Z, a-z, 0-9, _ and - (1-256 characters)"
+        if self.llm_replay_path:
+            # Replayed responses need no provider credentials
+            return True, None
         if not self.llm_api_key:
             return False, "LLM_API_KEY is required"
-        if self.llm_provider not in ["openai", "claude", "gemini"]:
-            return False, f"Unsupported LLM_PROVIDER: {self.llm_provider}"
+        for name in self.llm_providers:
+            if name not in ["openai", "claude", "gemini"]:
+                return False, f"Unsupported LLM_PROVIDER: {name}"
+            if not self.llm_api_keys.get(name):
+                return False, f"{name.upper()}_API_KEY is required for the {name} provider"
         return True, None
 
 config = Config()
\ No newline at end of file
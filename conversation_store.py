@@ -0,0 +1,151 @@
+import bisect
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# Fields with a column of their own; others are kept per record in a sparse side table
+COLUMN_FIELDS = ("id", "level", "theme", "jp", "kr")
+
+class ConversationView(Mapping):
+    """Read-only dict-like view of one stored conversation.
+
+    Handlers read it exactly like the dicts they used to get (`conv["jp"]`,
+    `conv.get("is_realtime")`), but nothing is copied until they ask for a
+    real dict with `copy()` or `dict(view)`, e.g. to keep it in user_data.
+    """
+
+    __slots__ = ("_store", "_position")
+
+    def __init__(self, store: "ConversationStore", position: int):
+        self._store = store
+        self._position = position
+
+    def __getitem__(self, key):
+        return self._store.field(self._position, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.keys(self._position))
+
+    def __len__(self) -> int:
+        return len(self._store.keys(self._position))
+
+    def copy(self) -> Dict:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f"ConversationView({dict(self)!r})"
+
+class LevelView(Sequence):
+    """The conversations of one level, as views created on indexing (works with random.choice)"""
+
+    __slots__ = ("_store", "_positions")
+
+    def __init__(self, store: "ConversationStore", positions: array):
+        self._store = store
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ConversationView(self._store, position) for position in self._positions[index]]
+        return ConversationView(self._store, self._positions[index])
+
+class ConversationStore(Sequence):
+    """Column-oriented, read-only conversation corpus.
+
+    Ids and interned level/theme indexes live in typed arrays, and the
+    Japanese/Korean texts in one UTF-8 buffer with an offset array, so a
+    conversation costs a few dozen bytes plus its text instead of a dict with
+    five string objects. Records are sorted by id (lookups are a binary
+    search) and indexed by level; indexing returns a `ConversationView`.
+    """
+
+    def __init__(self, conversations: Iterable[Dict] = ()):
+        records = sorted(conversations, key=lambda conv: conv["id"])
+        self._names: List[str] = [""]
+        name_index: Dict[str, int] = {"": 0}
+        self._ids = array("q")
+        self._levels = array("H")
+        self._themes = array("H")
+        # Text i of record p: jp at 2p, kr at 2p + 1
+        self._offsets = array("Q", [0])
+        self._extra: Dict[int, Dict] = {}
+        self._by_level: Dict[str, array] = {}
+        text = bytearray()
+
+        def intern(value: str) -> int:
+            index = name_index.get(value)
+            if index is None:
+                index = name_index[value] = len(self._names)
+                self._names.append(value)
+            return index
+
+        for position, conv in enumerate(records):
+            level = conv.get("level") or ""
+            self._ids.append(int(conv["id"]))
+            self._levels.append(intern(level))
+            self._themes.append(intern(conv.get("theme") or ""))
+            for field in ("jp", "kr"):
+                text += (conv.get(field) or "").encode("utf-8")
+                self._offsets.append(len(text))
+            extra = {key: value for key, value in conv.items() if key not in COLUMN_FIELDS}
+            if extra:
+                self._extra[position] = extra
+            self._by_level.setdefault(level, array("I")).append(position)
+        self._text = bytes(text)
+
+    def _string(self, index: int) -> str:
+        return self._text[self._offsets[index]:self._offsets[index + 1]].decode("utf-8")
+
+    def field(self, position: int, key: str):
+        if key == "id":
+            return self._ids[position]
+        if key == "level":
+            return self._names[self._levels[position]]
+        if key == "jp":
+            return self._string(2 * position)
+        if key == "kr":
+            return self._string(2 * position + 1)
+        if key == "theme" and self._themes[position]:
+            return self._names[self._themes[position]]
+        extra = self._extra.get(position)
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def keys(self, position: int) -> List[str]:
+        keys = ["id", "level", "jp", "kr"]
+        if self._themes[position]:
+            keys.append("theme")
+        keys.extend(self._extra.get(position, ()))
+        return keys
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [ConversationView(self, i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("conversation index out of range")
+        return ConversationView(self, position)
+
+    def get(self, conv_id: int) -> Optional[ConversationView]:
+        position = bisect.bisect_left(self._ids, conv_id)
+        if position < len(self._ids) and self._ids[position] == conv_id:
+            return ConversationView(self, position)
+        return None
+
+    def by_level(self, level: str) -> "LevelView":
+        return LevelView(self, self._by_level.get(level, array("I")))
+
+    def to_dicts(self) -> List[Dict]:
+        """Plain dicts in data.json form"""
+        return [dict(view) for view in self]
+
+    def __repr__(self) -> str:
+        return f"<ConversationStore {len(self)} conversations, {len(self._text)} bytes of text>"
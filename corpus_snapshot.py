@@ -0,0 +1,257 @@
+"""
+Binary snapshot of the conversation corpus, loaded with mmap.
+
+Layout (little endian), version 1:
+
+    header      magic "JLCS", version, record size, record count, string
+                count, offsets of the record array and the string offset
+                table, and the mtime/size of the data.json it was built from
+    records     fixed-width, sorted by id: id, then string indexes for
+                level, theme, jp, kr and extra fields (JSON), and flags
+    offsets     string_count + 1 offsets into the string data
+    strings     UTF-8 blobs; index 0 is the empty string
+
+Level and theme strings are stored once however many records use them.
+Nothing is decoded up front: a record becomes a dict only when it is read,
+and since the file is mapped read-only, every worker process shares the
+same page-cache pages instead of holding its own copy of the corpus.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+MAGIC = b"JLCS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQQQQ")
+RECORD = struct.Struct("<qIIIIIB3x")
+OFFSET = struct.Struct("<Q")
+FLAG_REALTIME = 1
+
+# Fields with a column of their own; anything else (and is_realtime unless true) goes to the extra JSON
+CORE_FIELDS = ("id", "level", "theme", "jp", "kr")
+
+class SnapshotError(Exception):
+    pass
+
+def source_stamp(path: str) -> tuple:
+    """(mtime_ns, size) of the data.json a snapshot is built from"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def write_snapshot(conversations: Iterable[Dict], path: str, source: tuple = (0, 0)) -> int:
+    """Write conversations to `path` atomically; returns the number of records"""
+    strings: List[bytes] = [b""]
+    interned: Dict[str, int] = {"": 0}
+
+    def intern(value: str) -> int:
+        index = interned.get(value)
+        if index is None:
+            index = interned[value] = len(strings)
+            strings.append(value.encode("utf-8"))
+        return index
+
+    def add(value: str) -> int:
+        # jp/kr are nearly all distinct, so they skip the intern table
+        if not value:
+            return 0
+        strings.append(value.encode("utf-8"))
+        return len(strings) - 1
+
+    rows = []
+    for conv in conversations:
+        extra = {key: value for key, value in conv.items() if key not in CORE_FIELDS}
+        realtime = extra.get("is_realtime") is True
+        if realtime:
+            del extra["is_realtime"]
+        rows.append((
+            int(conv["id"]),
+            intern(conv.get("level") or ""),
+            intern(conv.get("theme") or ""),
+            add(conv.get("jp") or ""),
+            add(conv.get("kr") or ""),
+            add(json.dumps(extra, ensure_ascii=False)) if extra else 0,
+            FLAG_REALTIME if realtime else 0,
+        ))
+    rows.sort(key=lambda row: row[0])
+
+    records_offset = HEADER.size
+    offsets_offset = records_offset + RECORD.size * len(rows)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(rows), len(strings),
+                            records_offset, offsets_offset, source[0], source[1]))
+        for row in rows:
+            f.write(RECORD.pack(*row))
+        position = 0
+        for blob in strings:
+            f.write(OFFSET.pack(position))
+            position += len(blob)
+        f.write(OFFSET.pack(position))
+        for blob in strings:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+class LevelView(Sequence):
+    """Records of one level, materialized as they are indexed (works with random.choice)"""
+
+    def __init__(self, snapshot: "CorpusSnapshot", positions: array):
+        self._snapshot = snapshot
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._snapshot[position] for position in self._positions[index]]
+        return self._snapshot[self._positions[index]]
+
+class CorpusSnapshot(Sequence):
+    """Read-only, memory-mapped corpus; indexing and iteration yield plain conversation dicts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path}: empty file")
+        if len(self._mm) < HEADER.size:
+            raise SnapshotError(f"{path}: truncated header")
+        (magic, version, record_size, self._count, self._string_count,
+         self._records, self._offsets, mtime_ns, size) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a corpus snapshot")
+        if version != VERSION or record_size != RECORD.size:
+            raise SnapshotError(f"{path}: unsupported snapshot version {version}")
+        self._strings = self._offsets + OFFSET.size * (self._string_count + 1)
+        if len(self._mm) < self._strings:
+            raise SnapshotError(f"{path}: truncated")
+        self.source = (mtime_ns, size)
+        self._levels: Optional[Dict[str, array]] = None
+
+    def close(self):
+        self._mm.close()
+
+    def string(self, index: int) -> str:
+        start, end = struct.unpack_from("<QQ", self._mm, self._offsets + OFFSET.size * index)
+        return self._mm[self._strings + start:self._strings + end].decode("utf-8")
+
+    def _record(self, position: int) -> tuple:
+        return RECORD.unpack_from(self._mm, self._records + RECORD.size * position)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._count))]
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError("snapshot record out of range")
+        conv_id, level, theme, jp, kr, extra, flags = self._record(position)
+        conv = {"id": conv_id, "level": self.string(level), "jp": self.string(jp), "kr": self.string(kr)}
+        if theme:
+            conv["theme"] = self.string(theme)
+        if flags & FLAG_REALTIME:
+            conv["is_realtime"] = True
+        if extra:
+            conv.update(json.loads(self.string(extra)))
+        return conv
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(self._count):
+            yield self[position]
+
+    def get(self, conv_id: int) -> Optional[Dict]:
+        """Record by id, by binary search over the id-sorted records"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < conv_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._record(low)[0] == conv_id:
+            return self[low]
+        return None
+
+    def by_level(self, level: str) -> LevelView:
+        if self._levels is None:
+            # One pass over the fixed-width records; no strings are decoded
+            by_index: Dict[int, array] = {}
+            for position in range(self._count):
+                by_index.setdefault(self._record(position)[1], array("I")).append(position)
+            self._levels = {self.string(index): positions for index, positions in by_index.items()}
+        return LevelView(self, self._levels.get(level, array("I")))
+
+def json_to_snapshot(json_path: str, snapshot_path: str) -> int:
+    with open(json_path, "r", encoding="utf-8") as f:
+        conversations = json.load(f).get("conversations", [])
+    return write_snapshot(conversations, snapshot_path, source_stamp(json_path))
+
+def snapshot_to_json(snapshot_path: str, json_path: str) -> int:
+    snapshot = CorpusSnapshot(snapshot_path)
+    try:
+        conversations = list(snapshot)
+    finally:
+        snapshot.close()
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"conversations": conversations}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, json_path)
+    return len(conversations)
+
+def is_current(snapshot_path: str, json_path: str) -> bool:
+    """Whether the snapshot was built from the data.json currently on disk"""
+    try:
+        snapshot = CorpusSnapshot(snapshot_path)
+    except (OSError, SnapshotError):
+        return False
+    try:
+        return snapshot.source == source_stamp(json_path)
+    except FileNotFoundError:
+        return True
+    finally:
+        snapshot.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between data.json and the binary corpus snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="data.json -> snapshot")
+    build.add_argument("json_path", nargs="?", default="data.json")
+    build.add_argument("snapshot_path", nargs="?", default="data.snapshot")
+    export = commands.add_parser("export", help="snapshot -> data.json")
+    export.add_argument("snapshot_path", nargs="?", default="data.snapshot")
+    export.add_argument("json_path", nargs="?", default="data.json")
+    info = commands.add_parser("info", help="Describe a snapshot")
+    info.add_argument("snapshot_path", nargs="?", default="data.snapshot")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = json_to_snapshot(args.json_path, args.snapshot_path)
+        print(f"📦 Wrote {count} conversations to {args.snapshot_path} ({os.path.getsize(args.snapshot_path)} bytes)")
+    elif args.command == "export":
+        count = snapshot_to_json(args.snapshot_path, args.json_path)
+        print(f"📄 Wrote {count} conversations to {args.json_path}")
+    else:
+        snapshot = CorpusSnapshot(args.snapshot_path)
+        levels = {}
+        for position in range(len(snapshot)):
+            level = snapshot.string(snapshot._record(position)[1])
+            levels[level] = levels.get(level, 0) + 1
+        print(f"📦 {args.snapshot_path}: version {VERSION}, {len(snapshot)} conversations, "
+              f"{snapshot._string_count} strings, {os.path.getsize(args.snapshot_path)} bytes")
+        for level, count in sorted(levels.items()):
+            print(f"  {level or '-'}: {count}")
+        snapshot.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import pytz
+
+from config import config
+from delivery_ledger import DELIVERY_FAILED, DELIVERY_SENT, DeliveryLedger, hourly_run_id
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+
+delivery_subscribers = metrics.gauge("delivery_subscribers", "Users with a delivery slot")
+delivery_lag = metrics.histogram(
+    "delivery_slot_lag_seconds", "Delay between a user's slot and the start of the delivery",
+    buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+deliveries_skipped = metrics.counter("deliveries_skipped_total", "Slots that came up without a delivery", ("reason",))
+
+def default_slot(user_id: Hashable) -> int:
+    """Stable second of the hour for a user, spread uniformly over the hour"""
+    return zlib.crc32(str(user_id).encode("utf-8")) % SECONDS_PER_HOUR
+
+def user_slot(user_id: Hashable, user_data: Optional[dict]) -> int:
+    """The user's chosen minute (jittered within it) or their default slot"""
+    minute = (user_data or {}).get("delivery_minute")
+    if minute is None:
+        return default_slot(user_id)
+    # Users who pick the same minute are still spread over its 60 seconds
+    return int(minute) * 60 + default_slot(user_id) % 60
+
+def user_timezone(user_data: Optional[dict]):
+    name = (user_data or {}).get("timezone") or config.timezone
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(config.timezone)
+
+def in_delivery_hours(tz, now: float) -> bool:
+    hour = datetime.fromtimestamp(now, tz).hour
+    return config.delivery_start_hour <= hour <= config.delivery_end_hour
+
+def next_delivery(user_id: Hashable, user_data: Optional[dict], now: float = None) -> Optional[datetime]:
+    """Local time of the user's next delivery within delivery hours"""
+    now = time.time() if now is None else now
+    slot = user_slot(user_id, user_data)
+    tz = user_timezone(user_data)
+    hour_start = int(now) - int(now) % SECONDS_PER_HOUR
+    for hour in range(25):
+        candidate = hour_start + hour * SECONDS_PER_HOUR + slot
+        if candidate > now and in_delivery_hours(tz, candidate):
+            return datetime.fromtimestamp(candidate, tz)
+    return None
+
+class TimingWheel:
+    """Hashed timing wheel with one bucket per second of the hour.
+
+    Adding, moving and removing a key is O(1), and advancing the wheel only
+    touches the buckets whose second has passed, however many keys it holds.
+    """
+
+    def __init__(self, slots: int = SECONDS_PER_HOUR):
+        self.slots = slots
+        self._buckets: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._last_second: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, key: Hashable, slot: int):
+        current = self._slot_of.get(key)
+        if current == slot:
+            return
+        if current is not None:
+            self._buckets[current].discard(key)
+        self._buckets[slot % self.slots].add(key)
+        self._slot_of[key] = slot % self.slots
+
+    def seek(self, second: int):
+        """Continue from `second`: the next advance returns every slot after it"""
+        self._last_second = second
+
+    def remove(self, key: Hashable):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._buckets[slot].discard(key)
+
+    def advance(self, now: float) -> List[Tuple[float, Hashable]]:
+        """(slot time, key) for every slot passed since the previous call, oldest first.
+
+        The first call only sets the position, so a restart does not replay
+        the part of the hour that already went by.
+        """
+        second = int(now)
+        last, self._last_second = self._last_second, second
+        if last is None or second <= last:
+            return []
+        # After a stall longer than a full turn every slot is due once
+        first = max(last + 1, second - self.slots + 1)
+        due = []
+        for slot_second in range(first, second + 1):
+            for key in self._buckets[slot_second % self.slots]:
+                due.append((float(slot_second), key))
+        return due
+
+    def load(self) -> List[int]:
+        """Number of keys per minute of the hour"""
+        per_minute = [0] * (self.slots // 60 or 1)
+        for slot in self._slot_of.values():
+            per_minute[slot * len(per_minute) // self.slots] += 1
+        return per_minute
+
+class DeliveryScheduler:
+    """Hourly practice delivery, spread over the hour instead of all at :00.
+
+    Every subscriber has a stable slot within the hour (or a minute they
+    chose) on a timing wheel; `tick()` runs once a second and starts the
+    deliveries whose slot has come up, if it is within delivery hours in the
+    user's own timezone. Sends and the LLM calls behind them are therefore
+    spread evenly over the hour.
+
+    Each hour is one delivery run in the ledger. A user gets a run at most
+    once, whether through their slot or /test_broadcast on any worker, and a
+    restart resumes the current run from the start of the hour for the
+    users whose slot passed without a claimed delivery.
+    """
+
+    def __init__(self, send: Callable[[Hashable], Awaitable] = None, max_concurrent: int = None, ledger: DeliveryLedger = None):
+        # Coroutine sending one user their practice; returns the sent message
+        self.send = send
+        self.wheel = TimingWheel()
+        self.ledger = ledger or DeliveryLedger()
+        self._zones: Dict[Hashable, object] = {}
+        self._limit = asyncio.Semaphore(max_concurrent or config.delivery_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._run_id: Optional[str] = None
+
+    def subscribe(self, user_id: Hashable, user_data: Optional[dict] = None):
+        """Add the user, or move them after their delivery settings changed"""
+        self.wheel.add(user_id, user_slot(user_id, user_data))
+        self._zones[user_id] = user_timezone(user_data)
+        delivery_subscribers.set(len(self.wheel))
+
+    def unsubscribe(self, user_id: Hashable):
+        self.wheel.remove(user_id)
+        self._zones.pop(user_id, None)
+        delivery_subscribers.set(len(self.wheel))
+
+    def load(self, user_data: Dict[Hashable, dict]):
+        """Subscribe every user known to persistence"""
+        for user_id, data in user_data.items():
+            self.subscribe(user_id, data)
+        logger.info(f"Delivery slots assigned for {len(self.wheel)} users")
+
+    async def start(self, now: float = None):
+        """Start the ledger and resume the current hour's run if a previous process left it open"""
+        now = time.time() if now is None else now
+        self.ledger.start()
+        current = hourly_run_id(now)
+        for run_id in await self.ledger.unfinished_runs():
+            if run_id != current:
+                # An hour that has passed is not worth delivering late
+                await self.ledger.close_run(run_id)
+                logger.info(f"Closed interrupted delivery run {run_id}")
+                continue
+            await self._switch_run(run_id)
+            hour_start = int(now) - int(now) % SECONDS_PER_HOUR
+            self.wheel.seek(hour_start - 1)
+            logger.info(f"Resuming delivery run {run_id} for users whose slot passed while the bot was down")
+            in_doubt = await self.ledger.pending_count(run_id)
+            if in_doubt:
+                # Sent or not, their outcome was lost with the previous process; better missed than doubled
+                logger.warning(f"{in_doubt} deliveries of run {run_id} were in flight when it stopped; not resending them")
+
+    async def _switch_run(self, run_id: str):
+        if self._run_id == run_id:
+            return
+        if self._run_id is not None:
+            await self.ledger.close_run(self._run_id)
+        await self.ledger.open_run(run_id)
+        self._run_id = run_id
+
+    async def tick(self):
+        now = time.time()
+        due: Dict[str, List[Tuple[Hashable, float]]] = {}
+        for slot_time, user_id in self.wheel.advance(now):
+            run_id = hourly_run_id(slot_time)
+            await self._switch_run(run_id)
+            if not in_delivery_hours(self._zones.get(user_id) or user_timezone(None), slot_time):
+                deliveries_skipped.inc(reason="outside_hours")
+                continue
+            due.setdefault(run_id, []).append((user_id, slot_time))
+        for run_id, users in due.items():
+            # One committed claim per second's users, before any of them is sent
+            claimed = set(await self.ledger.claim(run_id, [user_id for user_id, _ in users]))
+            for user_id, slot_time in users:
+                if user_id not in claimed:
+                    deliveries_skipped.inc(reason="already_sent")
+                    continue
+                task = asyncio.create_task(self._deliver(user_id, run_id, slot_time))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, user_id: Hashable, run_id: str, slot_time: float = None) -> str:
+        async with self._limit:
+            if slot_time is not None:
+                delivery_lag.observe(max(0.0, time.time() - slot_time))
+            try:
+                message = await self.send(user_id)
+            except Exception as e:
+                logger.error(f"Delivery to user {user_id} failed: {e}")
+                self.ledger.record(run_id, user_id, DELIVERY_FAILED)
+                return DELIVERY_FAILED
+            self.ledger.record(run_id, user_id, DELIVERY_SENT, getattr(message, "message_id", None))
+            return DELIVERY_SENT
+
+    async def deliver_all(self, user_ids, run_id: str = None) -> Dict[str, int]:
+        """Deliver a run to every given user now, skipping those who already got it.
+
+        Defaults to the current hourly run, so a manual broadcast never
+        repeats a message a user's slot already delivered (or vice versa).
+        """
+        run_id = run_id or hourly_run_id(time.time())
+        await self.ledger.open_run(run_id)
+        user_ids = list(user_ids)
+        claimed = await self.ledger.claim(run_id, user_ids)
+        counts = {DELIVERY_SENT: 0, DELIVERY_FAILED: 0, "skipped": len(user_ids) - len(claimed)}
+        for status in await asyncio.gather(*(self._deliver(user_id, run_id) for user_id in claimed)):
+            counts[status] += 1
+        await self.ledger.flush()
+        return counts
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # The run stays open so the next start resumes it
+        await self.ledger.stop()
+
+    def get_status(self) -> dict:
+        per_minute = self.wheel.load()
+        return {
+            "subscribers": len(self.wheel),
+            "in_flight": len(self._tasks),
+            "max_per_minute": max(per_minute) if per_minute else 0,
+            "mean_per_minute": len(self.wheel) / len(per_minute) if per_minute else 0.0,
+        }
+
+delivery_scheduler = DeliveryScheduler()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Hashable, List, Optional, Set
+
+from metrics import metrics
+from state_db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS delivery_runs (
+    run_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    run_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    message_id INTEGER,
+    updated REAL NOT NULL,
+    PRIMARY KEY (run_id, user_id)
+);
+"""
+
+# Claimed and committed before the send; stays pending if the process dies before the outcome is written
+DELIVERY_PENDING = "pending"
+DELIVERY_SENT = "sent"
+DELIVERY_FAILED = "failed"
+
+ledger_flush_size = metrics.histogram(
+    "delivery_ledger_flush_records", "Delivery records written per ledger flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500)
+)
+
+def hourly_run_id(timestamp: float) -> str:
+    """Run id of the hourly delivery cycle `timestamp` falls in (UTC hour)"""
+    return time.strftime("hourly-%Y%m%dT%H", time.gmtime(timestamp))
+
+class DeliveryLedger:
+    """Persistent record of who got which delivery run, shared through SQLite.
+
+    A delivery is claimed with a `pending` row committed before anything is
+    sent; the claim only succeeds if the user has no row in the run yet (or
+    only a failed one), so every process sharing the state database, the
+    leader's slots as well as /test_broadcast on any worker, agrees on who
+    sends. Outcomes are buffered and written in batches (every `flush_size`
+    records or `flush_interval` seconds). A crash between a send and the
+    flush of its outcome leaves the row pending, and pending deliveries are
+    never sent again: at most once, not at least once.
+    """
+
+    def __init__(self, path: str = None, flush_size: int = 50, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._initialized = False
+        self._pending: List[tuple] = []
+        # run id -> users known to be claimed (pending or sent); claims themselves go to the database
+        self._sent: Dict[str, Set[Hashable]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # Size-triggered flushes in progress; held here so none is collected mid-write
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _open_run(self, run_id: str) -> Set[Hashable]:
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute("INSERT OR IGNORE INTO delivery_runs (run_id, started) VALUES (?, ?)", (run_id, time.time()))
+        rows = conn.execute(
+            "SELECT user_id FROM deliveries WHERE run_id = ? AND status IN (?, ?)", (run_id, DELIVERY_PENDING, DELIVERY_SENT)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def _claim(self, run_id: str, user_ids: List[Hashable]) -> List[Hashable]:
+        conn = self._conn()
+        now = time.time()
+        claimed = []
+        with transaction(conn):
+            for user_id in user_ids:
+                cursor = conn.execute(
+                    "INSERT INTO deliveries (run_id, user_id, status, message_id, updated) VALUES (?, ?, ?, NULL, ?) "
+                    "ON CONFLICT (run_id, user_id) DO UPDATE SET status = excluded.status, message_id = NULL, "
+                    "updated = excluded.updated WHERE deliveries.status = ?",
+                    (run_id, user_id, DELIVERY_PENDING, now, DELIVERY_FAILED)
+                )
+                if cursor.rowcount:
+                    claimed.append(user_id)
+        return claimed
+
+    def _count_pending(self, run_id: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM deliveries WHERE run_id = ? AND status = ?", (run_id, DELIVERY_PENDING)
+        ).fetchone()
+        return row[0]
+
+    def _close_run(self, run_id: str):
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute("UPDATE delivery_runs SET finished = ? WHERE run_id = ? AND finished IS NULL", (time.time(), run_id))
+
+    def _fetch_unfinished(self) -> List[str]:
+        rows = self._conn().execute("SELECT run_id FROM delivery_runs WHERE finished IS NULL ORDER BY started").fetchall()
+        return [row[0] for row in rows]
+
+    def _write(self, records: List[tuple]):
+        conn = self._conn()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO deliveries (run_id, user_id, status, message_id, updated) VALUES (?, ?, ?, ?, ?)",
+                records
+            )
+
+    async def open_run(self, run_id: str):
+        """Start (or rejoin) a run and load who already got it"""
+        if run_id not in self._sent:
+            self._sent[run_id] = await asyncio.to_thread(self._open_run, run_id)
+
+    async def close_run(self, run_id: str):
+        await self.flush()
+        await asyncio.to_thread(self._close_run, run_id)
+        self._sent.pop(run_id, None)
+
+    async def unfinished_runs(self) -> List[str]:
+        """Runs a previous process opened but never closed"""
+        return await asyncio.to_thread(self._fetch_unfinished)
+
+    async def claim(self, run_id: str, user_ids: List[Hashable]) -> List[Hashable]:
+        """Reserve deliveries in a run; returns the users this process may now send to.
+
+        The claims are committed before this returns, so a user another
+        process (or an earlier run of this one) already claimed is left out
+        even if its outcome was never written.
+        """
+        known = self._sent.setdefault(run_id, set())
+        candidates = [user_id for user_id in user_ids if user_id not in known]
+        if not candidates:
+            return []
+        claimed = await asyncio.to_thread(self._claim, run_id, candidates)
+        # Whoever did not get claimed here is pending or sent elsewhere
+        known.update(candidates)
+        return claimed
+
+    async def pending_count(self, run_id: str) -> int:
+        """Deliveries of a run that were claimed but never got an outcome"""
+        return await asyncio.to_thread(self._count_pending, run_id)
+
+    def record(self, run_id: str, user_id: Hashable, status: str, message_id: Optional[int] = None):
+        """Buffer the outcome of a claimed delivery; until it is flushed the claim stays pending"""
+        if status != DELIVERY_SENT:
+            # Failed deliveries may be retried within the run
+            self._sent.get(run_id, set()).discard(user_id)
+        self._pending.append((run_id, user_id, status, message_id, time.time()))
+        if len(self._pending) >= self.flush_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task):
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Delivery ledger flush failed: {task.exception()}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            records, self._pending = self._pending, []
+            if not records:
+                return
+            try:
+                await asyncio.to_thread(self._write, records)
+                ledger_flush_size.observe(len(records))
+            except Exception as e:
+                # Keep them for the next flush rather than forgetting who was served
+                self._pending[:0] = records
+                logger.error(f"Delivery ledger flush failed: {e}")
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        # Let size-triggered flushes finish, then write whatever is still buffered
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
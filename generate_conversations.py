@@ -7,6 +7,7 @@ This script generates thousands of conversations using LLM and saves them to dat
 import asyncio
 import json
 from llm import llm_manager
+from llm_scheduler import llm_priority, PRIORITY_BULK
 from utils import data_manager
 
 # Configuration
@@ -30,19 +31,9 @@ async def generate_conversations_batch():
     """Generate conversations in batches for all themes and levels."""
     print("🚀 Starting batch conversation generation...")
     
-    # Load existing data
-    try:
-        with open("data.json", "r", encoding="utf-8") as f:
-            existing_data = json.load(f)
-            conversations = existing_data.get("conversations", [])
-            next_id = max([c["id"] for c in conversations]) + 1 if conversations else 1
-    except FileNotFoundError:
-        conversations = []
-        next_id = 1
-    
     total_to_generate = len(THEMES) * len(LEVELS) * CONVERSATIONS_PER_THEME_LEVEL
     print(f"📊 Target: {total_to_generate} new conversations")
-    print(f"📊 Current conversations: {len(conversations)}")
+    print(f"📊 Current conversations: {len(data_manager.conversations)}")
     
     generated_count = 0
     
@@ -54,60 +45,41 @@ async def generate_conversations_batch():
             
             try:
                 # Generate conversations for this theme/level combination
-                new_conversations = await llm_manager.generate_conversations(
-                    level=level,
-                    theme=theme,
-                    count=CONVERSATIONS_PER_THEME_LEVEL
-                )
+                with llm_priority(PRIORITY_BULK):
+                    new_conversations = await llm_manager.generate_conversations(
+                        level=level,
+                        theme=theme,
+                        count=CONVERSATIONS_PER_THEME_LEVEL
+                    )
                 
                 if new_conversations:
-                    # Add IDs and level to each conversation
-                    for conv in new_conversations:
-                        conv["id"] = next_id
-                        conv["level"] = level
-                        conversations.append(conv)
-                        next_id += 1
-                        generated_count += 1
+                    # Ids, level and a locked, atomic append to data.json, so a running bot's additions are kept
+                    await data_manager.add_conversations(new_conversations, level)
+                    generated_count += len(new_conversations)
                     
                     print(f"  ✅ Generated {len(new_conversations)} conversations for {level} {theme}")
                 else:
                     print(f"  ❌ Failed to generate conversations for {level} {theme}")
                 
-                # Save progress periodically
-                if generated_count % 100 == 0:
-                    save_data(conversations)
-                    print(f"  💾 Saved progress: {generated_count}/{total_to_generate}")
-                
             except Exception as e:
                 print(f"  ❌ Error generating {level} {theme}: {e}")
                 continue
     
-    # Final save
-    save_data(conversations)
-    
     print(f"\n🎉 Generation complete!")
     print(f"📊 Total conversations generated: {generated_count}")
-    print(f"📊 Total conversations in database: {len(conversations)}")
+    print(f"📊 Total conversations in database: {len(data_manager.conversations)}")
     print(f"💾 Data saved to data.json")
 
-def save_data(conversations):
-    """Save conversations to data.json file."""
-    data = {
-        "conversations": conversations
-    }
-    
-    with open("data.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 async def generate_sample():
     """Generate a small sample to test the system."""
     print("🧪 Generating sample conversations...")
     
-    sample_conversations = await llm_manager.generate_conversations(
-        level="N5",
-        theme="daily_life", 
-        count=5
-    )
+    with llm_priority(PRIORITY_BULK):
+        sample_conversations = await llm_manager.generate_conversations(
+            level="N5",
+            theme="daily_life", 
+            count=5
+        )
     
     if sample_conversations:
         print("✅ Sample generation successful!")
@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from config import config
+from metrics import metrics
+from state_db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    level TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    requested INTEGER NOT NULL,
+    generated INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    chat_id INTEGER,
+    message_id INTEGER,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+# Job states; queued and running jobs are picked up again after a restart
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = {JOB_DONE, JOB_FAILED, JOB_CANCELLED}
+
+# Seconds between checks for jobs submitted or cancelled by other worker processes
+WATCH_INTERVAL = 2.0
+
+STATUS_LABELS = {
+    JOB_QUEUED: "⏳ 대기 중",
+    JOB_RUNNING: "🤖 생성 중",
+    JOB_DONE: "✅ 완료",
+    JOB_FAILED: "❌ 실패",
+    JOB_CANCELLED: "🛑 취소됨",
+}
+
+jobs_finished = metrics.counter("generation_jobs_total", "Finished /generate jobs by final status", ("status",))
+jobs_queued = metrics.gauge("generation_jobs_queued", "/generate jobs waiting for the worker")
+job_conversations = metrics.counter("generation_job_conversations_total", "Conversations added by /generate jobs", ("level",))
+
+def format_job(job: Dict) -> str:
+    """One-line summary of a job for status messages and /job_status"""
+    return (
+        f"{STATUS_LABELS.get(job['status'], job['status'])} 작업 #{job['id']}: "
+        f"{job['level']} {job['theme']} {job['generated']}/{job['requested']}개"
+    )
+
+class GenerationJobs:
+    """Background queue for admin /generate requests.
+
+    Jobs are recorded in the shared state database, so their status survives
+    restarts and unfinished jobs resume with the conversations still missing.
+    A single worker runs one job at a time, splitting it into chunks that
+    are generated concurrently at bulk priority; the LLM scheduler and rate
+    limiter keep them from crowding out interactive calls. Progress is
+    reported by editing the message the job was submitted with.
+
+    With several worker processes only the leader runs the worker; the
+    others just record jobs and cancellations, which the leader picks up
+    from the database.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._initialized = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._queued = set()
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancelled = set()
+        self._bot = None
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _row(self, row) -> Optional[Dict]:
+        if row is None:
+            return None
+        keys = ("id", "level", "theme", "requested", "generated", "status", "chat_id", "message_id", "error", "created", "updated")
+        return dict(zip(keys, row))
+
+    def _insert(self, level: str, theme: str, count: int, chat_id: int, message_id: int) -> int:
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            cursor = conn.execute(
+                "INSERT INTO generation_jobs (level, theme, requested, status, chat_id, message_id, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (level, theme, count, JOB_QUEUED, chat_id, message_id, now, now)
+            )
+            return cursor.lastrowid
+
+    def _fetch(self, job_id: int) -> Optional[Dict]:
+        return self._row(self._conn().execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def _fetch_recent(self, limit: int) -> List[Dict]:
+        rows = self._conn().execute("SELECT * FROM generation_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def _fetch_unfinished(self) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT * FROM generation_jobs WHERE status IN (?, ?) ORDER BY id", (JOB_QUEUED, JOB_RUNNING)
+        ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def _update(self, job_id: int, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(f"UPDATE generation_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _fetch_statuses(self, job_ids: List[int]) -> Dict[int, str]:
+        placeholders = ", ".join("?" for _ in job_ids)
+        rows = self._conn().execute(f"SELECT id, status FROM generation_jobs WHERE id IN ({placeholders})", job_ids).fetchall()
+        return dict(rows)
+
+    def _finish_unfinished(self, job_id: int, status: str) -> bool:
+        conn = self._conn()
+        with transaction(conn):
+            return conn.execute(
+                "UPDATE generation_jobs SET status = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+                (status, time.time(), job_id, JOB_QUEUED, JOB_RUNNING)
+            ).rowcount > 0
+
+    async def start(self, bot):
+        """Start the worker and re-queue jobs a previous run left unfinished"""
+        self._bot = bot
+        self._queue = asyncio.Queue()
+        for job in await asyncio.to_thread(self._fetch_unfinished):
+            logger.info(f"Resuming generation job #{job['id']} ({job['generated']}/{job['requested']})")
+            self._enqueue(job["id"])
+        self._worker = asyncio.create_task(self._work())
+        if config.workers > 1:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        for task in (self._watcher, self._worker):
+            if task:
+                # Running jobs stay marked as running and resume on the next start
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._worker = self._watcher = None
+
+    def _enqueue(self, job_id: int):
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+        jobs_queued.set(self._queue.qsize())
+
+    async def submit(self, level: str, theme: str, count: int, chat_id: int, message_id: int) -> int:
+        """Record a job and queue it; returns the job id"""
+        job_id = await asyncio.to_thread(self._insert, level, theme, count, chat_id, message_id)
+        if self._queue is not None:
+            self._enqueue(job_id)
+        # Otherwise this process is not the leader, whose watcher picks the job up
+        return job_id
+
+    async def get(self, job_id: int) -> Optional[Dict]:
+        return await asyncio.to_thread(self._fetch, job_id)
+
+    async def recent(self, limit: int = 5) -> List[Dict]:
+        return await asyncio.to_thread(self._fetch_recent, limit)
+
+    async def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; False if it is unknown or already finished"""
+        job = await self.get(job_id)
+        if job is None or not await asyncio.to_thread(self._finish_unfinished, job_id, JOB_CANCELLED):
+            return False
+        task = self._running.get(job_id)
+        if task:
+            self._cancelled.add(job_id)
+            task.cancel()
+        elif job["status"] == JOB_QUEUED:
+            # The worker skips it, but nobody else updates its message
+            job["status"] = JOB_CANCELLED
+            await self._report(job, force=True)
+            jobs_finished.inc(status=JOB_CANCELLED)
+        # A job running in the leader process is stopped by its watcher
+        return True
+
+    async def _watch(self):
+        """Leader side of the other workers' submit() and cancel()"""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                for job in await asyncio.to_thread(self._fetch_unfinished):
+                    if job["id"] not in self._queued and job["id"] not in self._running:
+                        self._enqueue(job["id"])
+                if self._running:
+                    statuses = await asyncio.to_thread(self._fetch_statuses, list(self._running))
+                    for job_id, status in statuses.items():
+                        task = self._running.get(job_id)
+                        if status == JOB_CANCELLED and task and job_id not in self._cancelled:
+                            self._cancelled.add(job_id)
+                            task.cancel()
+            except Exception as e:
+                logger.error(f"Checking for generation jobs failed: {e}")
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            jobs_queued.set(self._queue.qsize())
+            job = await self.get(job_id)
+            self._queued.discard(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running[job_id] = task
+            try:
+                await task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise  # The worker itself is stopping
+            except Exception as e:
+                logger.error(f"Generation job #{job_id} crashed: {e}")
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+
+    async def _run(self, job: Dict):
+        from llm import llm_manager
+        from llm_scheduler import llm_priority, PRIORITY_BULK
+        from utils import data_manager
+
+        job_id = job["id"]
+        await asyncio.to_thread(self._update, job_id, status=JOB_RUNNING)
+        job["status"] = JOB_RUNNING
+        await self._report(job, force=True)
+
+        remaining = job["requested"] - job["generated"]
+        chunk_size = max(1, config.generation_chunk_size)
+        chunks = [min(chunk_size, remaining - start) for start in range(0, remaining, chunk_size)]
+        slots = asyncio.Semaphore(max(1, config.generation_chunk_concurrency))
+        sample = None
+        failed_chunks = 0
+        # Counts conversations in flight as well as stored ones, so concurrent chunks never over-fill the job
+        reserved = job["generated"]
+
+        async def run_chunk(count: int):
+            nonlocal sample, failed_chunks, reserved
+            async with slots:
+                with llm_priority(PRIORITY_BULK):
+                    conversations = await llm_manager.generate_conversations(job["level"], job["theme"], count)
+            if not conversations:
+                failed_chunks += 1
+                return
+            # Never add more than was asked for, even if a chunk over-delivers
+            conversations = conversations[:job["requested"] - reserved]
+            if not conversations:
+                return
+            reserved += len(conversations)
+            try:
+                await data_manager.add_conversations(conversations, job["level"])
+            except BaseException:
+                # Give the reservation back; the job only counts what was written
+                reserved -= len(conversations)
+                raise
+            job["generated"] += len(conversations)
+            sample = sample or conversations[0]
+            job_conversations.inc(len(conversations), level=job["level"])
+            await asyncio.to_thread(self._update, job_id, generated=job["generated"])
+            await self._report(job)
+
+        tasks = [asyncio.create_task(run_chunk(count)) for count in chunks]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # On shutdown the job stays running in the database and resumes on the next start
+            if job_id in self._cancelled:
+                job["status"] = JOB_CANCELLED
+                jobs_finished.inc(status=JOB_CANCELLED)
+                await self._report(job, force=True)
+            raise
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            job["status"] = JOB_FAILED
+            await asyncio.to_thread(self._update, job_id, status=JOB_FAILED, error=str(e))
+            jobs_finished.inc(status=JOB_FAILED)
+            await self._report(job, force=True, extra=f"\n오류: {e}")
+            return
+
+        job["status"] = JOB_DONE if job["generated"] else JOB_FAILED
+        error = f"{failed_chunks}/{len(chunks)} chunks returned nothing" if failed_chunks else None
+        await asyncio.to_thread(self._update, job_id, status=job["status"], error=error)
+        jobs_finished.inc(status=job["status"])
+        extra = f"\n총 대화 수: {len(data_manager.conversations)}개"
+        if sample:
+            extra += f"\n\n생성된 샘플:\n🇯🇵 {sample['jp']}\n🇰🇷 {sample['kr']}"
+        await self._report(job, force=True, extra=extra)
+
+    async def _report(self, job: Dict, force: bool = False, extra: str = ""):
+        """Edit the job's status message, at most every couple of seconds unless forced"""
+        now = time.monotonic()
+        if not force and now - job.get("_reported", 0.0) < config.generation_progress_interval:
+            return
+        job["_reported"] = now
+        if not self._bot or not job.get("chat_id") or not job.get("message_id"):
+            return
+        try:
+            await self._bot.edit_message_text(
+                chat_id=job["chat_id"], message_id=job["message_id"], text=format_job(job) + extra
+            )
+        except Exception as e:
+            # "Message is not modified" and deleted messages must not fail the job
+            logger.warning(f"Could not update status of generation job #{job['id']}: {e}")
+
+generation_jobs = GenerationJobs()
@@ -1,13 +1,41 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from utils import data_manager, wordbook_manager, audio_generator, user_data_manager
-from llm import llm_manager
+from llm import llm_manager, deadline_scope
+from llm_scheduler import llm_priority, PRIORITY_INTERACTIVE
 from config import config
+from monitoring import format_stats
+from realtime_controller import realtime_controller
+from user_throttle import user_throttle
+from generation_jobs import generation_jobs, format_job
+from delivery import delivery_scheduler, next_delivery
+import pytz
+import functools
 import os
 import asyncio
 
 SELECTING_LEVEL, QUIZ_MODE = range(2)
 
+def with_response_budget(handler):
+    """Run a handler under the user-visible LLM deadline from config, at interactive priority"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        # A caller that already tagged the work (the broadcast) keeps its own priority
+        with deadline_scope(config.response_budget), llm_priority(PRIORITY_INTERACTIVE, override=False):
+            return await handler(*args, **kwargs)
+    return wrapper
+
+# Callback actions that spend LLM or TTS time and count against the per-user limit
+THROTTLED_ACTIONS = {"new_quiz", "show", "listen", "replay"}
+
+def slow_down_text(user_id: int) -> str:
+    wait = max(1, round(user_throttle.retry_after(user_id)))
+    return f"⏳ 요청이 너무 많습니다. {wait}초 후에 다시 시도해주세요."
+
+def is_admin(user_id: int) -> bool:
+    """ADMIN_IDS may hold ints (env) or strings (config.json)"""
+    return str(user_id) in {str(admin_id) for admin_id in config.admin_ids}
+
 def get_question_and_answer(conversation: dict, language_direction: str) -> tuple:
     """Get question and answer based on language direction"""
     if language_direction == "kr_to_jp":
@@ -43,7 +71,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"안녕하세요 {user.first_name}님! 👋\n\n"
         "저는 언어 학습을 도와드리는 봇입니다.\n"
         "현재 일본어를 지원하며, 곧 더 많은 언어가 추가될 예정입니다.\n\n"
-        "오전 9시부터 오후 11시까지 매시간 학습 문장을 보내드려요.\n"
+        f"{config.delivery_start_hour}시부터 {config.delivery_end_hour}시까지 매시간 학습 문장을 보내드려요.\n"
+        "/delivery 로 받는 시각(분), /timezone 으로 시간대를 바꿀 수 있어요.\n"
         "먼저 일본어 레벨을 선택해주세요:"
     )
     
@@ -69,21 +98,21 @@ async def level_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.edit_message_text(
         f"일본어 레벨 {level}을 선택하셨습니다! ✅\n\n"
-        "이제 매일 아침 9시에 학습 문장을 받아보실 수 있습니다.\n"
+        f"이제 매일 {config.delivery_start_hour}시부터 {config.delivery_end_hour}시까지 매시간 학습 문장을 받아보실 수 있습니다.\n"
         "바로 연습을 시작하려면 /push 명령어를 사용해주세요."
     )
     
     return ConversationHandler.END
 
+@with_response_budget
 async def send_daily_practice_to_user(bot, user_id: int, level: str = "N3"):
     conversation = await data_manager.get_conversation_by_level(level)
     
     if not conversation:
-        await bot.send_message(
+        return await bot.send_message(
             chat_id=user_id,
             text=f"죄송합니다. {level} 레벨의 문장을 찾을 수 없습니다."
         )
-        return
     
     # Store conversation without context for button usage
     # Note: This is a special case for broadcast where we don't have context
@@ -111,7 +140,7 @@ async def send_daily_practice_to_user(bot, user_id: int, level: str = "N3"):
     
     message_text += "버튼을 눌러 한국어 뜻을 보거나 음성을 들어보세요!"
     
-    await bot.send_message(
+    return await bot.send_message(
         chat_id=user_id,
         text=message_text,
         reply_markup=reply_markup
@@ -166,6 +195,7 @@ async def send_daily_practice(context: ContextTypes.DEFAULT_TYPE, user_id: int):
         reply_markup=reply_markup
     )
 
+@with_response_budget
 async def push_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
@@ -173,6 +203,10 @@ async def push_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("권한이 없습니다.")
         return
     
+    if not user_throttle.allow(user_id, "push"):
+        await update.message.reply_text(slow_down_text(user_id))
+        return
+    
     # Send loading message
     loading_msg = await update.message.reply_text("🔄 학습 문장을 준비하고 있습니다...")
     
@@ -180,16 +214,17 @@ async def push_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_daily_practice(context, user_id)
         # Delete loading message after successful send
         await loading_msg.delete()
+    except asyncio.CancelledError:
+        # Superseded by a newer /push, which sends its own loading message
+        await loading_msg.delete()
+        raise
     except Exception as e:
         await loading_msg.edit_text(f"❌ 오류가 발생했습니다: {str(e)}")
         raise
 
 async def generate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to generate new conversations"""
-    user_id = str(update.effective_user.id)
-    admin_ids = config.admin_ids.split(',') if config.admin_ids else []
-    
-    if user_id not in admin_ids:
+    if not is_admin(update.effective_user.id):
         await update.message.reply_text("권한이 없습니다.")
         return
     
@@ -216,67 +251,65 @@ async def generate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("유효하지 않은 레벨입니다. N5, N4, N3, N2, N1 중 선택하세요.")
         return
     
-    if count > 50:
-        await update.message.reply_text("한 번에 최대 50개까지만 생성할 수 있습니다.")
+    if count < 1 or count > config.generation_max_count:
+        await update.message.reply_text(f"Count는 1에서 {config.generation_max_count} 사이여야 합니다.")
+        return
+    
+    # Generation runs in the background; the job edits this message as it progresses
+    status_msg = await update.message.reply_text(f"⏳ {level} {theme} 주제로 {count}개 대화 생성 작업을 등록하는 중입니다...")
+    job_id = await generation_jobs.submit(level, theme, count, status_msg.chat_id, status_msg.message_id)
+    await status_msg.edit_text(
+        f"⏳ 대기 중 작업 #{job_id}: {level} {theme} 0/{count}개\n"
+        f"/job_status {job_id} 로 확인, /job_cancel {job_id} 로 취소할 수 있습니다."
+    )
+
+async def job_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command to show one generation job, or the most recent ones"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("권한이 없습니다.")
+        return
+    
+    if context.args:
+        try:
+            job = await generation_jobs.get(int(context.args[0]))
+        except ValueError:
+            await update.message.reply_text("사용법: /job_status [작업 번호]")
+            return
+        if not job:
+            await update.message.reply_text("해당 작업을 찾을 수 없습니다.")
+            return
+        text = format_job(job)
+        if job["error"]:
+            text += f"\n오류: {job['error']}"
+        await update.message.reply_text(text)
         return
     
-    await update.message.reply_text(f"🤖 {level} {theme} 주제로 {count}개 대화를 생성 중입니다...")
+    jobs = await generation_jobs.recent()
+    if not jobs:
+        await update.message.reply_text("생성 작업이 없습니다.")
+        return
+    await update.message.reply_text("📋 최근 생성 작업\n\n" + "\n".join(format_job(job) for job in jobs))
+
+async def job_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command to cancel a queued or running generation job"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("권한이 없습니다.")
+        return
     
     try:
-        # Generate conversations
-        conversations = await llm_manager.generate_conversations(level, theme, count)
-        
-        if conversations:
-            # Add to data.json
-            import json
-            try:
-                with open("data.json", "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except FileNotFoundError:
-                data = {"conversations": []}
-            
-            existing_conversations = data.get("conversations", [])
-            next_id = max([c["id"] for c in existing_conversations]) + 1 if existing_conversations else 1
-            
-            # Add IDs and level to new conversations
-            for conv in conversations:
-                conv["id"] = next_id
-                conv["level"] = level
-                existing_conversations.append(conv)
-                next_id += 1
-            
-            # Save back to file
-            data["conversations"] = existing_conversations
-            with open("data.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # Reload data manager
-            data_manager.load_data()
-            
-            await update.message.reply_text(
-                f"✅ {len(conversations)}개 대화가 성공적으로 생성되었습니다!\n"
-                f"총 대화 수: {len(existing_conversations)}개"
-            )
-            
-            # Show sample
-            if conversations:
-                sample = conversations[0]
-                await update.message.reply_text(
-                    f"생성된 샘플:\n🇯🇵 {sample['jp']}\n🇰🇷 {sample['kr']}"
-                )
-        else:
-            await update.message.reply_text("❌ 대화 생성에 실패했습니다.")
-            
-    except Exception as e:
-        await update.message.reply_text(f"❌ 오류가 발생했습니다: {str(e)}")
-        print(f"Generate command error: {e}")
+        job_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("사용법: /job_cancel <작업 번호>")
+        return
+    
+    if await generation_jobs.cancel(job_id):
+        await update.message.reply_text(f"🛑 작업 #{job_id}을(를) 취소했습니다. 이미 생성된 대화는 유지됩니다.")
+    else:
+        await update.message.reply_text("취소할 수 있는 작업이 아닙니다 (없거나 이미 끝난 작업).")
 
 async def toggle_realtime_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to toggle real-time generation mode"""
-    user_id = str(update.effective_user.id)
-    admin_ids = config.admin_ids.split(',') if config.admin_ids else []
-    
-    if user_id not in admin_ids:
+    if not is_admin(update.effective_user.id):
         await update.message.reply_text("권한이 없습니다.")
         return
     
@@ -289,46 +322,124 @@ async def toggle_realtime_command(update: Update, context: ContextTypes.DEFAULT_
         f"{'✅ 새로운 대화를 실시간으로 생성합니다' if current_mode else '📚 저장된 대화에서 선택합니다'}"
     )
 
+async def realtime_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command to show the adaptive real-time ratio and the load it reacts to"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("권한이 없습니다.")
+        return
+    
+    status = realtime_controller.get_status()
+    p95 = f"{status['p95']:.1f}s" if status["p95"] is not None else "-"
+    mode_text = "활성화" if data_manager.realtime_generation else "비활성화"
+    await update.message.reply_text(
+        f"🔄 실시간 생성 모드: {mode_text}\n"
+        f"📈 실시간 비율: {status['ratio']:.0%} (목표 {status['target_ratio']:.0%})\n"
+        f"{'🛑 과부하: 저장된 대화만 사용 중' if status['pressure'] >= 1.0 else '✅ 정상'}\n\n"
+        f"• 부하 지수: {status['pressure']:.2f}\n"
+        f"• p95 지연: {p95} (목표 {config.realtime_p95_target:.1f}s)\n"
+        f"• 오류율: {status['error_rate']:.0%} (한도 {config.realtime_max_error_rate:.0%})\n"
+        f"• LLM 대기열: {status['queue_depth']} (한도 {config.realtime_max_queue})\n"
+        f"• 최근 표본: {status['samples']}개"
+    )
+
 async def test_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to test the broadcast function"""
-    user_id = str(update.effective_user.id)
-    admin_ids = config.admin_ids.split(',') if config.admin_ids else []
-    
-    if user_id not in admin_ids:
+    if not is_admin(update.effective_user.id):
         await update.message.reply_text("권한이 없습니다.")
         return
     
     await update.message.reply_text("🧪 브로드캐스트 테스트를 시작합니다...")
     
-    # Manually trigger broadcast logic
-    app = context.application
-    persistence = app.persistence
-    if persistence:
-        user_data = await persistence.get_user_data()
-        if user_data:
-            for uid in user_data:
-                try:
-                    user_info = user_data[uid]
-                    if user_info and hasattr(user_info, 'get'):
-                        level = user_info.get('level', 'N3')
-                    else:
-                        level = 'N3'
-                    await send_daily_practice_to_user(app.bot, uid, level)
-                except Exception as e:
-                    await update.message.reply_text(f"❌ 사용자 {uid} 전송 실패: {e}")
-                    return
-            await update.message.reply_text("✅ 브로드캐스트 테스트 완료!")
-        else:
-            await update.message.reply_text("❌ 사용자 데이터가 없습니다.")
+    # Delivers this hour's run to everyone who hasn't got it yet; users whose
+    # slot already passed are skipped by the delivery ledger
+    user_ids = list(context.application.user_data)
+    if not user_ids:
+        await update.message.reply_text("❌ 사용자 데이터가 없습니다.")
+        return
+    
+    counts = await delivery_scheduler.deliver_all(user_ids)
+    await update.message.reply_text(
+        f"✅ 브로드캐스트 테스트 완료!\n"
+        f"전송 {counts['sent']}명, 실패 {counts['failed']}명, 이번 시간에 이미 받은 사용자 {counts['skipped']}명"
+    )
+
+def format_next_delivery(user_id: int, user_data: dict) -> str:
+    upcoming = next_delivery(user_id, user_data)
+    if upcoming is None:
+        return ""
+    return f"\n다음 학습 문장: {upcoming.strftime('%H:%M')} ({upcoming.tzinfo.zone})"
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show or set the timezone hourly practice follows"""
+    if not context.args:
+        current = context.user_data.get("timezone") or config.timezone
+        await update.message.reply_text(
+            f"🕒 현재 시간대: {current}\n"
+            "변경: /timezone <지역/도시> (예: /timezone Asia/Tokyo, /timezone Europe/London)"
+            + format_next_delivery(update.effective_user.id, context.user_data)
+        )
+        return
+    
+    name = context.args[0]
+    try:
+        name = pytz.timezone(name).zone
+    except pytz.UnknownTimeZoneError:
+        await update.message.reply_text(f"알 수 없는 시간대입니다: {name}\n예: Asia/Seoul, Asia/Tokyo, America/New_York")
+        return
+    
+    context.user_data["timezone"] = name
+    await update.message.reply_text(
+        f"✅ 시간대를 {name}(으)로 설정했습니다.\n"
+        f"현지 시각 {config.delivery_start_hour}시부터 {config.delivery_end_hour}시까지 학습 문장을 보내드려요."
+        + format_next_delivery(update.effective_user.id, context.user_data)
+    )
+
+async def delivery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Choose the minute of the hour hourly practice arrives at, or go back to the assigned one"""
+    if not context.args:
+        minute = context.user_data.get("delivery_minute")
+        current = f"매시 {minute}분" if minute is not None else "자동 배정"
+        await update.message.reply_text(
+            f"⏰ 학습 문장 받는 시각: {current}\n"
+            "변경: /delivery <0-59> (예: /delivery 30), 자동 배정: /delivery auto"
+            + format_next_delivery(update.effective_user.id, context.user_data)
+        )
+        return
+    
+    if context.args[0].lower() == "auto":
+        context.user_data.pop("delivery_minute", None)
+        text = "✅ 받는 시각을 자동 배정으로 되돌렸습니다."
     else:
-        await update.message.reply_text("❌ 지속성 데이터에 접근할 수 없습니다.")
+        try:
+            minute = int(context.args[0])
+        except ValueError:
+            minute = -1
+        if not 0 <= minute <= 59:
+            await update.message.reply_text("0에서 59 사이의 분을 입력해주세요. 예: /delivery 30")
+            return
+        context.user_data["delivery_minute"] = minute
+        text = f"✅ 매시 {minute}분쯤 학습 문장을 보내드릴게요."
+    await update.message.reply_text(text + format_next_delivery(update.effective_user.id, context.user_data))
 
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command to show latency, cache and delivery metrics"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("권한이 없습니다.")
+        return
+    
+    await update.message.reply_text(format_stats())
+
+@with_response_budget
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    
     data = query.data
     
+    action = "new_quiz" if data == "new_quiz" else data.split("_")[0]
+    if action in THROTTLED_ACTIONS and not user_throttle.allow(query.from_user.id, action):
+        await query.answer(slow_down_text(query.from_user.id))
+        return
+    await query.answer()
+    
     if data == "new_quiz":
         # Start a new quiz with a random conversation
         level = user_data_manager.get_user_level(context)
@@ -339,7 +450,12 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text="새로운 퀴즈를 준비 중입니다... ⏳"
         )
         
-        new_conversation = await data_manager.get_conversation_by_level(level)
+        try:
+            new_conversation = await data_manager.get_conversation_by_level(level)
+        except asyncio.CancelledError:
+            # Superseded by a newer "new quiz" press, which sends its own waiting message
+            await context.bot.delete_message(chat_id=query.message.chat_id, message_id=waiting_msg.message_id)
+            raise
         
         if not new_conversation:
             await context.bot.edit_message_text(
@@ -635,6 +751,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=reply_markup
             )
 
+@with_response_budget
 async def quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_translation = update.message.text
     quiz_data = user_data_manager.get_quiz_data(context)
@@ -716,6 +833,7 @@ async def quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_data_manager.clear_quiz_data(context)
     return ConversationHandler.END
 
+@with_response_budget
 async def quiz_text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages when user is in quiz mode"""
     quiz_data = user_data_manager.get_quiz_data(context)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from typing import Callable, List, Optional
+
+from metrics import metrics
+from state_db import get_connection, transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS id_counters (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+)
+"""
+
+id_blocks_reserved = metrics.counter("id_blocks_reserved_total", "Id blocks reserved from the state database", ("counter",))
+
+class IdAllocator:
+    """Unique, increasing ids shared by every process, from a counter in the state database.
+
+    A process reserves a block of `block_size` ids in one transaction and
+    hands them out from memory, so an id costs O(1) and the database is only
+    written once per block. Ids are never reused, but they are not gap-free:
+    the rest of a block is lost when its process exits. The counter starts
+    at `floor()` (e.g. one past the largest id already in data.json) the
+    first time it is used with a state database that does not have it yet.
+    """
+
+    def __init__(self, name: str, floor: Callable[[], int] = lambda: 1, path: str = None, block_size: int = 100):
+        self.name = name
+        self.floor = floor
+        self.path = path
+        self.block_size = block_size
+        self._initialized = False
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _reserve(self, count: int) -> int:
+        """Claim ids [start, start + count) in the database; returns start"""
+        conn = self._conn()
+        with transaction(conn):
+            row = conn.execute("SELECT next_id FROM id_counters WHERE name = ?", (self.name,)).fetchone()
+            start = row[0] if row else self.floor()
+            conn.execute(
+                "INSERT OR REPLACE INTO id_counters (name, next_id) VALUES (?, ?)", (self.name, start + count)
+            )
+        id_blocks_reserved.inc(counter=self.name)
+        return start
+
+    def _take(self, count: int) -> Optional[List[int]]:
+        # From the current block only; None if it does not hold `count` more ids
+        with self._lock:
+            if self._end - self._next < count:
+                return None
+            ids = list(range(self._next, self._next + count))
+            self._next += count
+            return ids
+
+    def allocate(self, count: int = 1) -> List[int]:
+        """`count` new ids; touches the database only when the current block runs out"""
+        ids = self._take(count)
+        if ids is not None:
+            return ids
+        with self._lock:
+            ids = list(range(self._next, self._end))
+            needed = count - len(ids)
+            # Large requests get a block of their own size
+            size = max(self.block_size, needed)
+            start = self._reserve(size)
+            ids.extend(range(start, start + needed))
+            self._next, self._end = start + needed, start + size
+            return ids
+
+    async def allocate_async(self, count: int = 1) -> List[int]:
+        """As allocate(); a block reservation runs in a worker thread instead of on the event loop"""
+        ids = self._take(count)
+        if ids is not None:
+            return ids
+        return await asyncio.to_thread(self.allocate, count)
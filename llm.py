@@ -1,8 +1,20 @@
 import aiohttp
+import asyncio
+import email.utils
+import gzip
+import hashlib
 import json
-from typing import Optional
+import time
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
 from config import config
-import google.generativeai as genai
+from metrics import metrics
+from circuit_breaker import CircuitBreaker
+from llm_scheduler import LLMScheduler, current_priority
+from rate_limiter import RateLimiter, estimate_tokens
+from services import LazyService
+from tracing import current_trace_id, record_span, span
 import re
 
 def is_hiragana_only(text: str) -> bool:
@@ -11,23 +23,31 @@ def is_hiragana_only(text: str) -> bool:
     allowed_pattern = r'^[\u3040-\u309F\u30A0-\u30FF\s\u3000、。！？～ー]+$'
     return bool(re.match(allowed_pattern, text))
 
-class LLMProvider:
-    async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어") -> str:
-        raise NotImplementedError
-    
-    async def generate_conversations(self, level: str, theme: str, count: int = 10) -> list:
-        raise NotImplementedError
-    
-    async def generate_furigana(self, japanese_text: str) -> str:
-        raise NotImplementedError
+LEVEL_DESCRIPTIONS = {
+    "N5": "가장 기본적인 일본어 (기본 인사, 숫자, 간단한 질문)",
+    "N4": "초급 일본어 (일상 대화, 서비스 상황, 간단한 요청)",
+    "N3": "중급 일본어 (정중한 표현, 비즈니스 기초, 복잡한 문장)",
+    "N2": "상급 일본어 (정식 비즈니스 표현, 복잡한 경어)",
+    "N1": "최고급 일본어 (고급 경어, 공식적인 표현, 복잡한 문법)"
+}
 
-class OpenAIProvider(LLMProvider):
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.api_url = "https://api.openai.com/v1/chat/completions"
-    
-    async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어") -> str:
-        prompt = f"""Evaluate this translation:
+THEME_DESCRIPTIONS = {
+    "daily_life": "일상생활 (인사, 식사, 쇼핑, 교통)",
+    "restaurant": "식당 (주문, 예약, 계산, 서비스)",
+    "business": "비즈니스 (회의, 이메일, 전화, 프레젠테이션)",
+    "travel": "여행 (호텔, 공항, 관광, 길 찾기)",
+    "shopping": "쇼핑 (가격 문의, 교환/환불, 결제)",
+    "emergency": "응급상황 (병원, 경찰, 도움 요청)",
+    "education": "교육 (학교, 수업, 시험, 학습)",
+    "work": "직장 (면접, 업무, 동료, 상사)"
+}
+
+EVALUATION_SYSTEM_PROMPT = "당신은 언어 번역을 평가하는 선생님입니다."
+GENERATION_SYSTEM_PROMPT = "당신은 일본어 교육 전문가입니다. JLPT 수준에 맞는 정확한 일본어-한국어 대화 쌍을 생성합니다."
+FURIGANA_SYSTEM_PROMPT = "당신은 일본어 후리가나 생성 전문가입니다. 정확한 히라가나 읽기를 제공합니다."
+
+def build_evaluation_prompt(source_text: str, user_translation: str, correct_translation: str, source_lang: str) -> str:
+    return f"""Evaluate this translation:
 Source ({source_lang}): {source_text}
 User translation: {user_translation}
 Correct translation: {correct_translation}
@@ -40,59 +60,13 @@ Scoring:
 Format:
 Stars: ⭐⭐⭐⭐⭐ (1-5)
 Feedback: 1-2 Korean words only (e.g. "좋아요", "맞아요", "어색함", "틀림", "애매함")"""
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": "당신은 언어 번역을 평가하는 선생님입니다."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 150
-        }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result["choices"][0]["message"]["content"]
-                    else:
-                        return "평가 중 오류가 발생했습니다."
-        except Exception as e:
-            print(f"OpenAI API error: {e}")
-            return "평가 중 오류가 발생했습니다."
-    
-    async def generate_conversations(self, level: str, theme: str, count: int = 10) -> list:
-        level_descriptions = {
-            "N5": "가장 기본적인 일본어 (기본 인사, 숫자, 간단한 질문)",
-            "N4": "초급 일본어 (일상 대화, 서비스 상황, 간단한 요청)",
-            "N3": "중급 일본어 (정중한 표현, 비즈니스 기초, 복잡한 문장)",
-            "N2": "상급 일본어 (정식 비즈니스 표현, 복잡한 경어)",
-            "N1": "최고급 일본어 (고급 경어, 공식적인 표현, 복잡한 문법)"
-        }
-        
-        theme_descriptions = {
-            "daily_life": "일상생활 (인사, 식사, 쇼핑, 교통)",
-            "restaurant": "식당 (주문, 예약, 계산, 서비스)",
-            "business": "비즈니스 (회의, 이메일, 전화, 프레젠테이션)",
-            "travel": "여행 (호텔, 공항, 관광, 길 찾기)",
-            "shopping": "쇼핑 (가격 문의, 교환/환불, 결제)",
-            "emergency": "응급상황 (병원, 경찰, 도움 요청)",
-            "education": "교육 (학교, 수업, 시험, 학습)",
-            "work": "직장 (면접, 업무, 동료, 상사)"
-        }
-        
-        prompt = f"""일본어-한국어 학습용 대화 쌍을 {count}개 생성해주세요.
+
+def build_generation_prompt(level: str, theme: str, count: int) -> str:
+    return f"""일본어-한국어 학습용 대화 쌍을 {count}개 생성해주세요.
 
 조건:
-- JLPT {level} 수준: {level_descriptions.get(level, '')}
-- 주제: {theme} - {theme_descriptions.get(theme, theme)}
+- JLPT {level} 수준: {LEVEL_DESCRIPTIONS.get(level, '')}
+- 주제: {theme} - {THEME_DESCRIPTIONS.get(theme, theme)}
 - 각 대화는 일본어 문장과 자연스러운 한국어 번역으로 구성
 - 실제 대화에서 자주 사용되는 실용적인 표현
 - 문법과 어휘가 {level} 수준에 적합해야 함
@@ -104,46 +78,8 @@ Feedback: 1-2 Korean words only (e.g. "좋아요", "맞아요", "어색함", "
 
 {count}개의 서로 다른 대화를 생성해주세요."""
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": "당신은 일본어 교육 전문가입니다. JLPT 수준에 맞는 정확한 일본어-한국어 대화 쌍을 생성합니다."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8,
-            "max_tokens": 2000
-        }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result["choices"][0]["message"]["content"]
-                        
-                        # Extract JSON from the response
-                        import re
-                        json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                        if json_match:
-                            conversations = json.loads(json_match.group())
-                            return conversations
-                        else:
-                            print("Failed to extract JSON from OpenAI response")
-                            return []
-                    else:
-                        print(f"OpenAI API error: {response.status}")
-                        return []
-        except Exception as e:
-            print(f"OpenAI conversation generation error: {e}")
-            return []
-    
-    async def generate_furigana(self, japanese_text: str) -> str:
-        prompt = f"""Convert this Japanese text to hiragana reading (furigana):
+def build_furigana_prompt(japanese_text: str) -> str:
+    return f"""Convert this Japanese text to hiragana reading (furigana):
 
 Japanese: {japanese_text}
 
@@ -162,369 +98,961 @@ Input: 私は学校に行きます
 Output: わたし は がっこう に いき ます
 
 Hiragana reading:"""
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": "당신은 일본어 후리가나 생성 전문가입니다. 정확한 히라가나 읽기를 제공합니다."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.3,
-            "max_tokens": 300
-        }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result["choices"][0]["message"]["content"].strip()
-                        # Extract just the hiragana line
-                        lines = content.split('\n')
-                        for line in lines:
-                            line = line.strip()
-                            if line and is_hiragana_only(line):
-                                return line
-                        # If no pure hiragana line found, return empty string
-                        return ""
-                    else:
-                        return ""
-        except Exception as e:
-            print(f"OpenAI furigana error: {e}")
-            return ""
 
-class ClaudeProvider(LLMProvider):
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.api_url = "https://api.anthropic.com/v1/messages"
-    
-    async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어") -> str:
-        prompt = f"""Evaluate this translation:
-Source ({source_lang}): {source_text}
-User translation: {user_translation}
-Correct translation: {correct_translation}
+def extract_hiragana_line(content: str) -> str:
+    """Return the first line of a furigana response that is pure kana"""
+    for line in content.strip().split('\n'):
+        line = line.strip()
+        if line and is_hiragana_only(line):
+            return line
+    # If no pure hiragana line found, return empty string
+    return ""
 
-Scoring:
-- Correct meaning, different style: 4-5 stars, feedback "좋아요" or "맞아요"
-- Correct but unnatural: 3 stars
-- Partially correct: 1-2 stars
+def is_valid_conversation(item) -> bool:
+    """Check that a generated item has non-empty jp/kr text"""
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get("jp"), str) and item["jp"].strip() != ""
+        and isinstance(item.get("kr"), str) and item["kr"].strip() != ""
+    )
 
-Format:
-Stars: ⭐⭐⭐⭐⭐ (1-5)
-Feedback: 1-2 Korean words only (e.g. "좋아요", "맞아요", "어색함", "틀림", "애매함")"""
-        
-        headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "claude-3-5-haiku-20241022",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": 150
-        }
-        
+class JSONArrayStreamParser:
+    """Incrementally extract objects from a streamed JSON array.
+
+    Text is fed in arbitrary chunks; each top-level object is decoded as soon
+    as its closing brace arrives. Anything before the opening '[' (prose,
+    code fences) is skipped, and a stream that is cut off mid-array still
+    yields every object that was completed before the cut.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._in_string = False
+        self._escape = False
+        self._depth = 0
+        self._object_start = None
+        self.done = False
+
+    def feed(self, chunk: str) -> list:
+        self._buffer += chunk
+        buffer = self._buffer
+        objects = []
+        i = self._pos
+
+        while i < len(buffer) and not self.done:
+            ch = buffer[i]
+            if not self._in_array:
+                if ch == '[':
+                    self._in_array = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{' or ch == '[':
+                if self._depth == 0 and ch == '{':
+                    self._object_start = i
+                self._depth += 1
+            elif ch == '}' or ch == ']':
+                if self._depth == 0:
+                    # Closing bracket of the top-level array
+                    self.done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            objects.append(json.loads(buffer[self._object_start:i + 1]))
+                        except json.JSONDecodeError:
+                            pass
+                        self._object_start = None
+            i += 1
+
+        # Drop consumed text so the buffer only holds the open object
+        if self._object_start is not None:
+            self._buffer = buffer[self._object_start:]
+            i -= self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = ""
+            i = 0
+        self._pos = i
+        return objects
+
+class LLMProviderError(Exception):
+    """Raised when a provider returns an error response"""
+
+class LLMTimeoutError(LLMProviderError):
+    """Raised when an LLM call does not finish within its deadline"""
+
+class LLMUnavailableError(LLMProviderError):
+    """Raised without calling the provider while its circuit is open"""
+
+class LLMRateLimitError(LLMProviderError):
+    """Raised on a 429 from the provider, or when the local rate limit needs a longer wait than allowed"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse "20", "1.5s", "6m0s" or "250ms" into seconds"""
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)?", value.strip()):
+        total += float(amount) * {"ms": 0.001, "h": 3600, "m": 60, "s": 1, "": 1}[unit]
+    return total or None
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds to back off after a 429, from Retry-After or the providers' reset headers"""
+    value = headers.get("retry-after")
+    if value:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result["content"][0]["text"]
-                    else:
-                        return "평가 중 오류가 발생했습니다."
-        except Exception as e:
-            print(f"Claude API error: {e}")
-            return "평가 중 오류가 발생했습니다."
-    
-    async def generate_conversations(self, level: str, theme: str, count: int = 10) -> list:
-        level_descriptions = {
-            "N5": "가장 기본적인 일본어 (기본 인사, 숫자, 간단한 질문)",
-            "N4": "초급 일본어 (일상 대화, 서비스 상황, 간단한 요청)",
-            "N3": "중급 일본어 (정중한 표현, 비즈니스 기초, 복잡한 문장)",
-            "N2": "상급 일본어 (정식 비즈니스 표현, 복잡한 경어)",
-            "N1": "최고급 일본어 (고급 경어, 공식적인 표현, 복잡한 문법)"
-        }
-        
-        theme_descriptions = {
-            "daily_life": "일상생활 (인사, 식사, 쇼핑, 교통)",
-            "restaurant": "식당 (주문, 예약, 계산, 서비스)",
-            "business": "비즈니스 (회의, 이메일, 전화, 프레젠테이션)",
-            "travel": "여행 (호텔, 공항, 관광, 길 찾기)",
-            "shopping": "쇼핑 (가격 문의, 교환/환불, 결제)",
-            "emergency": "응급상황 (병원, 경찰, 도움 요청)",
-            "education": "교육 (학교, 수업, 시험, 학습)",
-            "work": "직장 (면접, 업무, 동료, 상사)"
-        }
-        
-        prompt = f"""일본어-한국어 학습용 대화 쌍을 {count}개 생성해주세요.
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if headers.get(name):
+            return _parse_duration(headers[name])
+    return None
 
-조건:
-- JLPT {level} 수준: {level_descriptions.get(level, '')}
-- 주제: {theme} - {theme_descriptions.get(theme, theme)}
-- 각 대화는 일본어 문장과 자연스러운 한국어 번역으로 구성
-- 실제 대화에서 자주 사용되는 실용적인 표현
-- 문법과 어휘가 {level} 수준에 적합해야 함
+def _raise_for_status(response: aiohttp.ClientResponse, provider: str):
+    if response.status == 429:
+        raise LLMRateLimitError(f"{provider} API rate limited", retry_after=_retry_after(response.headers))
+    if response.status != 200:
+        raise LLMProviderError(f"{provider} API error: {response.status}")
 
-출력 형식 (JSON):
-[
-  {{"jp": "일본어 문장", "kr": "한국어 번역"}}
-]
+_current_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
 
-{count}개의 서로 다른 대화를 생성해주세요."""
+@contextmanager
+def deadline_scope(seconds: float):
+    """Bound every LLM call made inside the block by a shared deadline.
+
+    Nested scopes can only shorten the deadline, so a handler's user-visible
+    budget is never exceeded by the calls it makes further down.
+    """
+    deadline = time.monotonic() + seconds
+    current = _current_deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+def remaining_deadline() -> Optional[float]:
+    """Seconds left in the current deadline scope, or None outside any scope"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+async def _iter_sse_data(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """Yield the payload of each `data:` line of a server-sent event stream"""
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        yield payload
+
+_token_usage = metrics.counter(
+    "llm_tokens_total", "Tokens billed by LLM providers", ("provider", "operation", "kind")
+)
+
+def record_token_usage(provider: str, operation: str, input_tokens: Optional[int], output_tokens: Optional[int]):
+    """Count the usage a provider reported for one call"""
+    if input_tokens:
+        _token_usage.inc(input_tokens, provider=provider, operation=operation, kind="input")
+    if output_tokens:
+        _token_usage.inc(output_tokens, provider=provider, operation=operation, kind="output")
+
+class LLMProvider:
+    name = "base"
 
+    @property
+    def rate_key(self) -> str:
+        """Rate-limit bucket: quotas are per provider and model"""
+        return f"{self.name}:{self.model}"
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        raise NotImplementedError
+
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        """Yield text deltas of a streamed completion"""
+        raise NotImplementedError
+        yield ""
+
+    async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어", timeout: float = 30.0) -> str:
+        prompt = build_evaluation_prompt(source_text, user_translation, correct_translation, source_lang)
+        return await self.complete(EVALUATION_SYSTEM_PROMPT, prompt, max_tokens=150, temperature=0.7, timeout=timeout, operation="evaluation")
+
+    async def generate_conversations_stream(self, level: str, theme: str, count: int = 10, timeout: float = 60.0) -> AsyncIterator[dict]:
+        """Yield each generated conversation as soon as its JSON object closes"""
+        prompt = build_generation_prompt(level, theme, count)
+        parser = JSONArrayStreamParser()
+        stream = self.stream(GENERATION_SYSTEM_PROMPT, prompt, max_tokens=2000, temperature=0.8, timeout=timeout, operation="generation")
+        async with aclosing(stream):
+            async for delta in stream:
+                for item in parser.feed(delta):
+                    if is_valid_conversation(item):
+                        yield {"jp": item["jp"], "kr": item["kr"]}
+                if parser.done:
+                    return
+
+    async def generate_furigana(self, japanese_text: str, timeout: float = 30.0) -> str:
+        prompt = build_furigana_prompt(japanese_text)
+        content = await self.complete(FURIGANA_SYSTEM_PROMPT, prompt, max_tokens=300, temperature=0.3, timeout=timeout, operation="furigana")
+        return extract_hiragana_line(content)
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.api_url = f"{config.openai_base_url.rstrip('/')}/v1/chat/completions"
+        self.model = "gpt-4o-mini"
+
+    def _build_request(self, system: str, prompt: str, max_tokens: int, temperature: float) -> tuple:
         headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
+            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
         data = {
-            "model": "claude-3-5-haiku-20241022",
+            "model": self.model,
             "messages": [
-                {
-                    "role": "user",
-                    "content": f"당신은 일본어 교육 전문가입니다. JLPT 수준에 맞는 정확한 일본어-한국어 대화 쌍을 생성합니다.\n\n{prompt}"
-                }
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
             ],
-            "max_tokens": 2000
+            "temperature": temperature,
+            "max_tokens": max_tokens
         }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result["content"][0]["text"]
-                        
-                        # Extract JSON from the response
-                        import re
-                        json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                        if json_match:
-                            conversations = json.loads(json_match.group())
-                            return conversations
-                        else:
-                            print("Failed to extract JSON from Claude response")
-                            return []
-                    else:
-                        print(f"Claude API error: {response.status}")
-                        return []
-        except Exception as e:
-            print(f"Claude conversation generation error: {e}")
-            return []
-    
-    async def generate_furigana(self, japanese_text: str) -> str:
-        prompt = f"""Convert this Japanese text to hiragana reading (furigana):
+        return headers, data
 
-Japanese: {japanese_text}
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        headers, data = self._build_request(system, prompt, max_tokens, temperature)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            async with session.post(self.api_url, headers=headers, json=data) as response:
+                _raise_for_status(response, "OpenAI")
+                result = await response.json()
+                usage = result.get("usage") or {}
+                record_token_usage(self.name, operation, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                return result["choices"][0]["message"]["content"]
 
-Rules:
-- Convert ALL kanji to hiragana
-- Keep existing hiragana as-is
-- Add spaces between words for readability
-- Separate particles (は, を, に, で, etc.) with spaces
-- Output ONLY the hiragana reading, nothing else
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        headers, data = self._build_request(system, prompt, max_tokens, temperature)
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            async with session.post(self.api_url, headers=headers, json=data) as response:
+                _raise_for_status(response, "OpenAI")
+                async for payload in _iter_sse_data(response):
+                    event = json.loads(payload)
+                    usage = event.get("usage")
+                    if usage:
+                        # Sent in a final chunk with no choices
+                        record_token_usage(self.name, operation, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                    choices = event.get("choices") or []
+                    if choices:
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            yield delta
 
-Examples:
-Input: 今日は良い天気ですね
-Output: きょう は よい てんき です ね
+class ClaudeProvider(LLMProvider):
+    name = "claude"
 
-Input: 私は学校に行きます
-Output: わたし は がっこう に いき ます
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.api_url = f"{config.claude_base_url.rstrip('/')}/v1/messages"
+        self.model = "claude-3-5-haiku-20241022"
 
-Hiragana reading:"""
-        
+    def _build_request(self, system: str, prompt: str, max_tokens: int, temperature: float) -> tuple:
         headers = {
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01",
             "Content-Type": "application/json"
         }
-        
         data = {
-            "model": "claude-3-5-haiku-20241022",
+            "model": self.model,
             "messages": [
                 {
                     "role": "user",
-                    "content": f"당신은 일본어 후리가나 생성 전문가입니다. 정확한 히라가나 읽기를 제공합니다.\n\n{prompt}"
+                    "content": f"{system}\n\n{prompt}" if system else prompt
                 }
             ],
-            "max_tokens": 300
+            "temperature": temperature,
+            "max_tokens": max_tokens
         }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result["content"][0]["text"].strip()
-                        # Extract just the hiragana line
-                        lines = content.split('\n')
-                        for line in lines:
-                            line = line.strip()
-                            if line and is_hiragana_only(line):
-                                return line
-                        # If no pure hiragana line found, return empty string
-                        return ""
-                    else:
-                        return ""
-        except Exception as e:
-            print(f"Claude furigana error: {e}")
-            return ""
+        return headers, data
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        headers, data = self._build_request(system, prompt, max_tokens, temperature)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            async with session.post(self.api_url, headers=headers, json=data) as response:
+                _raise_for_status(response, "Claude")
+                result = await response.json()
+                usage = result.get("usage") or {}
+                record_token_usage(self.name, operation, usage.get("input_tokens"), usage.get("output_tokens"))
+                return result["content"][0]["text"]
+
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        headers, data = self._build_request(system, prompt, max_tokens, temperature)
+        data["stream"] = True
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            async with session.post(self.api_url, headers=headers, json=data) as response:
+                _raise_for_status(response, "Claude")
+                async for payload in _iter_sse_data(response):
+                    event = json.loads(payload)
+                    if event.get("type") == "content_block_delta":
+                        delta = event.get("delta", {}).get("text")
+                        if delta:
+                            yield delta
+                    elif event.get("type") == "message_start":
+                        usage = event.get("message", {}).get("usage") or {}
+                        record_token_usage(self.name, operation, usage.get("input_tokens"), None)
+                    elif event.get("type") == "message_delta":
+                        usage = event.get("usage") or {}
+                        record_token_usage(self.name, operation, None, usage.get("output_tokens"))
+                    elif event.get("type") == "message_stop":
+                        return
+                    elif event.get("type") == "error":
+                        raise LLMProviderError(f"Claude stream error: {event.get('error')}")
 
 class GeminiProvider(LLMProvider):
+    name = "gemini"
+
     def __init__(self, api_key: str):
         self.api_key = api_key
+        # The Gemini SDK takes a while to import; only pay for it when Gemini is configured
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-    
-    async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어") -> str:
-        prompt = f"""Evaluate this translation:
-Source ({source_lang}): {source_text}
-User translation: {user_translation}
-Correct translation: {correct_translation}
+        self.model_name = 'gemini-1.5-flash'
+        self.model = genai.GenerativeModel(self.model_name)
 
-Scoring:
-- Correct meaning, different style: 4-5 stars, feedback "좋아요" or "맞아요"
-- Correct but unnatural: 3 stars
-- Partially correct: 1-2 stars
+    @property
+    def rate_key(self) -> str:
+        return f"{self.name}:{self.model_name}"
 
-Format:
-Stars: ⭐⭐⭐⭐⭐ (1-5)
-Feedback: 1-2 Korean words only (e.g. "좋아요", "맞아요", "어색함", "틀림", "애매함")"""
-        
+    @staticmethod
+    def _translate_error(error: Exception):
+        # google.api_core reports HTTP 429 as ResourceExhausted
+        if type(error).__name__ == "ResourceExhausted":
+            raise LLMRateLimitError(f"Gemini API rate limited: {error}") from error
+
+    def _build_request(self, system: str, prompt: str, max_tokens: int, temperature: float) -> tuple:
+        contents = f"{system}\n\n{prompt}" if system else prompt
+        generation_config = {"max_output_tokens": max_tokens, "temperature": temperature}
+        return contents, generation_config
+
+    def _record_usage(self, response, operation: str):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_token_usage(self.name, operation, getattr(usage, "prompt_token_count", None),
+                               getattr(usage, "candidates_token_count", None))
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        contents, generation_config = self._build_request(system, prompt, max_tokens, temperature)
         try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
+            response = await self.model.generate_content_async(
+                contents,
+                generation_config=generation_config,
+                request_options={"timeout": timeout}
+            )
         except Exception as e:
-            print(f"Gemini API error: {e}")
-            return "평가 중 오류가 발생했습니다."
-    
-    async def generate_conversations(self, level: str, theme: str, count: int = 10) -> list:
-        level_descriptions = {
-            "N5": "가장 기본적인 일본어 (기본 인사, 숫자, 간단한 질문)",
-            "N4": "초급 일본어 (일상 대화, 서비스 상황, 간단한 요청)",
-            "N3": "중급 일본어 (정중한 표현, 비즈니스 기초, 복잡한 문장)",
-            "N2": "상급 일본어 (정식 비즈니스 표현, 복잡한 경어)",
-            "N1": "최고급 일본어 (고급 경어, 공식적인 표현, 복잡한 문법)"
-        }
-        
-        theme_descriptions = {
-            "daily_life": "일상생활 (인사, 식사, 쇼핑, 교통)",
-            "restaurant": "식당 (주문, 예약, 계산, 서비스)",
-            "business": "비즈니스 (회의, 이메일, 전화, 프레젠테이션)",
-            "travel": "여행 (호텔, 공항, 관광, 길 찾기)",
-            "shopping": "쇼핑 (가격 문의, 교환/환불, 결제)",
-            "emergency": "응급상황 (병원, 경찰, 도움 요청)",
-            "education": "교육 (학교, 수업, 시험, 학습)",
-            "work": "직장 (면접, 업무, 동료, 상사)"
-        }
-        
-        prompt = f"""일본어-한국어 학습용 대화 쌍을 {count}개 생성해주세요.
+            self._translate_error(e)
+            raise
+        self._record_usage(response, operation)
+        return response.text
 
-조건:
-- JLPT {level} 수준: {level_descriptions.get(level, '')}
-- 주제: {theme} - {theme_descriptions.get(theme, theme)}
-- 각 대화는 일본어 문장과 자연스러운 한국어 번역으로 구성
-- 실제 대화에서 자주 사용되는 실용적인 표현
-- 문법과 어휘가 {level} 수준에 적합해야 함
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        contents, generation_config = self._build_request(system, prompt, max_tokens, temperature)
+        try:
+            response = await self.model.generate_content_async(
+                contents,
+                generation_config=generation_config,
+                request_options={"timeout": timeout},
+                stream=True
+            )
+        except Exception as e:
+            self._translate_error(e)
+            raise
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            if chunk.text:
+                yield chunk.text
+        if last_chunk is not None:
+            self._record_usage(last_chunk, operation)
 
-출력 형식 (JSON):
-[
-  {{"jp": "일본어 문장", "kr": "한국어 번역"}}
-]
+def prompt_hash(system: str, prompt: str, max_tokens: int) -> str:
+    """Stable key identifying a request for record/replay"""
+    return hashlib.sha256(f"{system}\x00{prompt}\x00{max_tokens}".encode("utf-8")).hexdigest()[:16]
 
-{count}개의 서로 다른 대화를 생성해주세요."""
+def _open_log(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class LLMRecorder:
+    """Append every request/response pair to a JSON-lines log (gzipped if the path ends in .gz)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open_log(path, "a")
+
+    def record(self, operation: str, key: str, provider: str, latency: float, body: str, partial: bool = False):
+        entry = {"op": operation, "key": key, "provider": provider, "latency": round(latency, 4), "body": body}
+        if partial:
+            entry["partial"] = True
+        trace_id = current_trace_id()
+        if trace_id:
+            entry["trace"] = trace_id
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def load_recording(path: str) -> list:
+    with _open_log(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
 
+class RecordingProvider(LLMProvider):
+    """Wraps a provider and logs each response it returns"""
+
+    def __init__(self, inner: LLMProvider, recorder: LLMRecorder):
+        self.inner = inner
+        self.recorder = recorder
+        self.name = inner.name
+
+    @property
+    def rate_key(self) -> str:
+        return self.inner.rate_key
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        start = time.monotonic()
+        body = await self.inner.complete(system, prompt, max_tokens, temperature, timeout, operation=operation)
+        self.recorder.record(operation, prompt_hash(system, prompt, max_tokens), self.name, time.monotonic() - start, body)
+        return body
+
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        start = time.monotonic()
+        parts = []
+        failed = False
         try:
-            response = await self.model.generate_content_async(prompt)
-            content = response.text
-            
-            # Extract JSON from the response
-            import re
-            json_match = re.search(r'\[.*\]', content, re.DOTALL)
-            if json_match:
-                conversations = json.loads(json_match.group())
-                return conversations
-            else:
-                print("Failed to extract JSON from Gemini response")
-                return []
-        except Exception as e:
-            print(f"Gemini conversation generation error: {e}")
-            return []
-    
-    async def generate_furigana(self, japanese_text: str) -> str:
-        prompt = f"""Convert this Japanese text to hiragana reading (furigana):
+            async with aclosing(self.inner.stream(system, prompt, max_tokens, temperature, timeout, operation=operation)) as stream:
+                async for delta in stream:
+                    parts.append(delta)
+                    yield delta
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Also reached when the consumer stops early, e.g. after the first item
+            if parts:
+                self.recorder.record(operation, prompt_hash(system, prompt, max_tokens), self.name,
+                                     time.monotonic() - start, "".join(parts), partial=failed)
 
-Japanese: {japanese_text}
+class ReplayProvider(LLMProvider):
+    """Serves recorded responses offline with the original (or scaled) latency.
 
-Rules:
-- Convert ALL kanji to hiragana
-- Keep existing hiragana as-is
-- Add spaces between words for readability
-- Separate particles (は, を, に, で, etc.) with spaces
-- Output ONLY the hiragana reading, nothing else
+    Requests are matched by prompt hash; prompts that were never recorded
+    (random themes, different quiz answers) get the next recorded response
+    of the same operation, so a replay never needs the network.
+    """
 
-Examples:
-Input: 今日は良い天気ですね
-Output: きょう は よい てんき です ね
+    name = "replay"
 
-Input: 私は学校に行きます
-Output: わたし は がっこう に いき ます
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._by_key = {}
+        self._by_operation = {}
+        self._cursors = {}
+        for entry in load_recording(path):
+            self._by_key.setdefault(entry["key"], []).append(entry)
+            self._by_operation.setdefault(entry["op"], []).append(entry)
+        print(f"📼 Loaded {sum(len(v) for v in self._by_key.values())} recorded LLM responses from {path}")
 
-Hiragana reading:"""
-        
+    def _lookup(self, operation: str, key: str) -> dict:
+        if key in self._by_key:
+            cursor_key, candidates = key, self._by_key[key]
+        elif operation in self._by_operation:
+            cursor_key, candidates = operation, self._by_operation[operation]
+        else:
+            raise LLMProviderError(f"No recorded response for {operation or 'request'} ({key})")
+        index = self._cursors.get(cursor_key, 0)
+        self._cursors[cursor_key] = index + 1
+        return candidates[index % len(candidates)]
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        entry = self._lookup(operation, prompt_hash(system, prompt, max_tokens))
+        await asyncio.sleep(entry["latency"] * self.latency_scale)
+        return entry["body"]
+
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        entry = self._lookup(operation, prompt_hash(system, prompt, max_tokens))
+        body = entry["body"]
+        chunks = [body[i:i + 32] for i in range(0, len(body), 32)] or [""]
+        delay = entry["latency"] * self.latency_scale / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+class RateLimitedProvider(LLMProvider):
+    """Wraps a provider with the RPM/TPM buckets shared by every process on this host"""
+
+    def __init__(self, inner: LLMProvider, limiter: RateLimiter, rpm: float, tpm: float):
+        self.inner = inner
+        self.limiter = limiter
+        self.rpm = rpm
+        self.tpm = tpm
+        self.name = inner.name
+
+    @property
+    def rate_key(self) -> str:
+        return self.inner.rate_key
+
+    async def _admit(self, system: str, prompt: str, max_tokens: int, timeout: float) -> float:
+        """Wait for capacity and return the part of `timeout` that is left for the call"""
         try:
-            response = await self.model.generate_content_async(prompt)
-            content = response.text.strip()
-            # Extract just the hiragana line
-            lines = content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line and is_hiragana_only(line):
-                    return line
-            # If no pure hiragana line found, return empty string
-            return ""
-        except Exception as e:
-            print(f"Gemini furigana error: {e}")
-            return ""
+            waited = await self.limiter.acquire(
+                self.rate_key, self.rpm, self.tpm, estimate_tokens(system, prompt, max_tokens), max_wait=timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise LLMRateLimitError(f"{self.rate_key} is over its rate limit", retry_after=e.args[0] if e.args else None)
+        return max(0.0, timeout - waited)
+
+    async def _on_rate_limited(self, error: LLMRateLimitError):
+        seconds = error.retry_after if error.retry_after is not None else config.rate_limit_backoff
+        print(f"🚦 {self.rate_key} rate limited by the provider, pausing it for {seconds:.1f}s")
+        await self.limiter.block(self.rate_key, seconds)
+
+    async def complete(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> str:
+        timeout = await self._admit(system, prompt, max_tokens, timeout)
+        try:
+            return await self.inner.complete(system, prompt, max_tokens, temperature, timeout, operation=operation)
+        except LLMRateLimitError as e:
+            await self._on_rate_limited(e)
+            raise
+
+    async def stream(self, system: str, prompt: str, max_tokens: int, temperature: float, timeout: float, operation: str = "") -> AsyncIterator[str]:
+        timeout = await self._admit(system, prompt, max_tokens, timeout)
+        try:
+            async with aclosing(self.inner.stream(system, prompt, max_tokens, temperature, timeout, operation=operation)) as stream:
+                async for delta in stream:
+                    yield delta
+        except LLMRateLimitError as e:
+            await self._on_rate_limited(e)
+            raise
+
+class PooledProvider:
+    """A configured provider together with its own circuit breaker"""
+
+    def __init__(self, provider: LLMProvider, breaker: CircuitBreaker):
+        self.provider = provider
+        self.breaker = breaker
+        self.name = provider.name
 
 class LLMManager:
     def __init__(self):
-        self.provider = self._create_provider()
-    
-    def _create_provider(self) -> Optional[LLMProvider]:
-        if config.llm_provider == "openai":
-            return OpenAIProvider(config.llm_api_key)
-        elif config.llm_provider == "claude":
-            return ClaudeProvider(config.llm_api_key)
-        elif config.llm_provider == "gemini":
-            return GeminiProvider(config.llm_api_key)
+        self.latency = metrics.histogram(
+            "llm_request_duration_seconds", "LLM call latency", ("provider", "operation")
+        )
+        self.timeouts = metrics.counter(
+            "llm_timeouts_total", "LLM calls that hit their deadline", ("provider", "operation")
+        )
+        self.errors = metrics.counter(
+            "llm_errors_total", "LLM calls that failed with an error", ("provider", "operation")
+        )
+        self.failovers = metrics.counter(
+            "llm_failovers_total", "Calls retried on the next provider in the pool", ("provider", "operation")
+        )
+        self.hedges = metrics.counter(
+            "llm_hedged_requests_total", "Backup requests sent to a second provider", ("operation",)
+        )
+        self.hedge_wins = metrics.counter(
+            "llm_hedge_wins_total", "Hedged calls answered first by the backup provider", ("provider", "operation")
+        )
+        self.circuit_state = metrics.gauge(
+            "llm_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("provider",)
+        )
+        self.inflight = metrics.gauge(
+            "llm_inflight_requests", "LLM calls currently waiting on a provider", ("provider",)
+        )
+        self.scheduler = LLMScheduler(config.llm_max_concurrency, config.llm_priority_aging)
+        self.providers = self._create_pool()
+        # Each primary call earns `hedge_budget` tokens and each hedge spends one,
+        # so at most that share of calls is ever duplicated
+        self._hedge_tokens = 1.0
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _create_provider(self, name: str, api_key: str) -> Optional[LLMProvider]:
+        if name == "openai":
+            return OpenAIProvider(api_key)
+        elif name == "claude":
+            return ClaudeProvider(api_key)
+        elif name == "gemini":
+            return GeminiProvider(api_key)
         else:
             return None
-    
+
+    def _create_breaker(self, name: str) -> CircuitBreaker:
+        return CircuitBreaker(
+            name,
+            failure_rate=config.circuit_failure_rate,
+            window_size=config.circuit_window,
+            open_seconds=config.circuit_open_seconds,
+            on_state_change=lambda state: self._on_circuit_change(name, state)
+        )
+
+    def _create_pool(self) -> list:
+        if config.llm_replay_path:
+            provider = ReplayProvider(config.llm_replay_path, config.llm_replay_latency_scale)
+            return [PooledProvider(provider, self._create_breaker(provider.name))]
+
+        recorder = LLMRecorder(config.llm_record_path) if config.llm_record_path else None
+        limiter = RateLimiter() if any(config.llm_rate_limits.values()) else None
+        pool = []
+        for name in config.llm_providers:
+            api_key = config.llm_api_keys.get(name)
+            provider = self._create_provider(name, api_key) if api_key else None
+            if not provider:
+                print(f"⚠️ Skipping LLM provider '{name}': unsupported or missing API key")
+                continue
+            if recorder:
+                provider = RecordingProvider(provider, recorder)
+            limits = config.llm_rate_limits.get(name) or {}
+            if limiter and (limits.get("rpm") or limits.get("tpm")):
+                provider = RateLimitedProvider(provider, limiter, limits.get("rpm", 0), limits.get("tpm", 0))
+            pool.append(PooledProvider(provider, self._create_breaker(name)))
+        if recorder:
+            print(f"📼 Recording LLM traffic to {config.llm_record_path}")
+        return pool
+
+    @property
+    def provider(self) -> Optional[LLMProvider]:
+        """Primary provider, or None when nothing is configured"""
+        return self.providers[0].provider if self.providers else None
+
+    def _on_circuit_change(self, name: str, state: str):
+        value = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[state]
+        self.circuit_state.set(value, provider=name)
+
+    def is_available(self) -> bool:
+        """True when at least one provider in the pool has a usable circuit"""
+        return any(not entry.breaker.is_open() for entry in self.providers)
+
+    def _operation_timeout(self, operation: str) -> float:
+        return config.llm_timeouts.get(operation, config.llm_timeouts["generation"])
+
+    def _timeout_for(self, operation: str, queued: float = 0.0) -> float:
+        """Operation timeout less the time spent queued for a slot, shortened to whatever is left of the caller's deadline"""
+        # Without a deadline scope nothing else counts the queue wait against the operation
+        timeout = self._operation_timeout(operation) - queued
+        remaining = remaining_deadline()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def _acquire(self, entry: PooledProvider, operation: str, queued: float = 0.0) -> float:
+        """Check the deadline and circuit before a call and return its timeout"""
+        timeout = self._timeout_for(operation, queued)
+        if timeout <= 0:
+            self.timeouts.inc(provider=entry.name, operation=operation)
+            raise LLMTimeoutError(f"No time left for {operation}")
+        if not entry.breaker.allow_request():
+            raise LLMUnavailableError(f"{entry.name} circuit is open")
+        return timeout
+
+    @asynccontextmanager
+    async def _slot(self, entry: PooledProvider, operation: str):
+        """Hold one of the provider's concurrency slots, queued by the caller's priority; yields the seconds spent queued"""
+        if entry.breaker.is_open():
+            raise LLMUnavailableError(f"{entry.name} circuit is open")
+        try:
+            queued = await self.scheduler.acquire(entry.name, current_priority(), self._timeout_for(operation))
+        except asyncio.TimeoutError:
+            self.timeouts.inc(provider=entry.name, operation=operation)
+            raise LLMTimeoutError(f"{operation} timed out waiting for a {entry.name} slot")
+        try:
+            yield queued
+        finally:
+            self.scheduler.release(entry.name)
+
+    def _record_timeout(self, entry: PooledProvider, operation: str, timeout: float):
+        self.timeouts.inc(provider=entry.name, operation=operation)
+        if timeout < self._operation_timeout(operation):
+            # Cut short by the caller's budget rather than the provider being slow
+            entry.breaker.release_trial()
+        else:
+            entry.breaker.record_failure()
+
+    def _record_success(self, entry: PooledProvider, operation: str, latency: float):
+        # A call that used most of its timeout counts against the provider too
+        entry.breaker.record_success(latency, slow_threshold=self._operation_timeout(operation) * 0.8)
+
+    async def _call_entry(self, entry: PooledProvider, operation: str, make_call):
+        """Run make_call(provider, timeout) on one provider and record metrics"""
+        async with self._slot(entry, operation) as queued:
+            timeout = self._acquire(entry, operation, queued)
+
+            start = time.monotonic()
+            self.inflight.inc(provider=entry.name)
+            try:
+                with span(f"llm.{operation}"):
+                    result = await asyncio.wait_for(make_call(entry.provider, timeout), timeout)
+                self._record_success(entry, operation, time.monotonic() - start)
+                return result
+            except asyncio.TimeoutError:
+                self._record_timeout(entry, operation, timeout)
+                raise LLMTimeoutError(f"{operation} timed out after {timeout:.1f}s")
+            except asyncio.CancelledError:
+                entry.breaker.release_trial()
+                raise
+            except LLMRateLimitError:
+                # Quota pressure, not a broken provider: fail over without tripping the circuit
+                entry.breaker.release_trial()
+                raise
+            except Exception:
+                self.errors.inc(provider=entry.name, operation=operation)
+                entry.breaker.record_failure()
+                raise
+            finally:
+                self.inflight.dec(provider=entry.name)
+                self.latency.observe(time.monotonic() - start, provider=entry.name, operation=operation)
+
+    def _hedge_delay(self, entry: PooledProvider, operation: str) -> float:
+        """Wait for the provider's observed p95 before sending a backup request"""
+        if self.latency.count(provider=entry.name, operation=operation) >= 20:
+            return self.latency.quantile(0.95, provider=entry.name, operation=operation)
+        return config.hedge_delay
+
+    def _take_hedge_token(self) -> bool:
+        if self._hedge_tokens >= 1.0:
+            self._hedge_tokens -= 1.0
+            return True
+        return False
+
+    async def _hedged_call(self, primary: PooledProvider, backup: PooledProvider, operation: str, make_call, is_valid, tried: set):
+        """Call primary; if it is slower than its p95, race a backup and take the first valid answer"""
+        primary_task = asyncio.create_task(self._call_entry(primary, operation, make_call))
+        done, _ = await asyncio.wait({primary_task}, timeout=self._hedge_delay(primary, operation))
+        if done or backup.breaker.is_open() or not self._take_hedge_token():
+            return await primary_task
+
+        self.hedges.inc(operation=operation)
+        tried.add(backup.name)
+        backup_task = asyncio.create_task(self._call_entry(backup, operation, make_call))
+        pending = {primary_task, backup_task}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception():
+                        last_error = task.exception()
+                        continue
+                    if is_valid(task.result()) or not pending:
+                        if task is backup_task:
+                            self.hedge_wins.inc(provider=backup.name, operation=operation)
+                        return task.result()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, operation: str, make_call, is_valid=bool):
+        """Call the pool in order, failing over on errors and hedging where configured"""
+        if not self.providers:
+            raise LLMUnavailableError("No LLM provider configured")
+
+        hedging = operation in config.hedge_operations
+        if hedging:
+            self._hedge_tokens = min(self._hedge_tokens + config.hedge_budget, 10.0)
+
+        candidates = [entry for entry in self.providers if not entry.breaker.is_open()] or self.providers[:1]
+        tried = set()
+        last_error = None
+        for i, entry in enumerate(candidates):
+            if entry.name in tried:
+                continue  # Already raced as a hedge backup
+            tried.add(entry.name)
+            backup = next((c for c in candidates[i + 1:] if c.name not in tried), None) if hedging else None
+            try:
+                if backup:
+                    return await self._hedged_call(entry, backup, operation, make_call, is_valid, tried)
+                return await self._call_entry(entry, operation, make_call)
+            except LLMTimeoutError as e:
+                last_error = e
+                if remaining_deadline() == 0.0:
+                    break  # The caller's budget is spent; no time to fail over
+            except Exception as e:
+                last_error = e
+            if any(c.name not in tried for c in candidates):
+                self.failovers.inc(provider=entry.name, operation=operation)
+                print(f"↪️ {entry.name} failed for {operation} ({last_error}), failing over [trace {current_trace_id() or '-'}]")
+        raise last_error
+
+    async def _call_stream(self, operation: str, make_stream) -> AsyncIterator:
+        """Stream from the pool in order; fail over only while nothing has been yielded"""
+        if not self.providers:
+            return
+
+        candidates = [entry for entry in self.providers if not entry.breaker.is_open()] or self.providers[:1]
+        for i, entry in enumerate(candidates):
+            yielded = False
+            stream = self._call_entry_stream(entry, operation, make_stream)
+            try:
+                async for item in stream:
+                    yielded = True
+                    yield item
+                return
+            except LLMProviderError as e:
+                if yielded or i + 1 == len(candidates) or remaining_deadline() == 0.0:
+                    raise
+                self.failovers.inc(provider=entry.name, operation=operation)
+                print(f"↪️ {entry.name} failed for {operation} ({e}), failing over [trace {current_trace_id() or '-'}]")
+            finally:
+                await stream.aclose()
+
+    async def _call_entry_stream(self, entry: PooledProvider, operation: str, make_stream) -> AsyncIterator:
+        """Iterate make_stream(provider, timeout), enforcing the deadline across the whole stream"""
+        async with self._slot(entry, operation) as queued:
+            timeout = self._acquire(entry, operation, queued)
+
+            start = time.monotonic()
+            deadline = start + timeout
+            stream = make_stream(entry.provider, timeout)
+            self.inflight.inc(provider=entry.name)
+            # Only time spent waiting on the provider, not on the consumer between items
+            waited = 0.0
+            try:
+                while True:
+                    wait_start = time.monotonic()
+                    try:
+                        item = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.monotonic()))
+                    except StopAsyncIteration:
+                        self._record_success(entry, operation, time.monotonic() - start)
+                        return
+                    finally:
+                        waited += time.monotonic() - wait_start
+                    yield item
+            except asyncio.TimeoutError:
+                self._record_timeout(entry, operation, timeout)
+                raise LLMTimeoutError(f"{operation} timed out after {timeout:.1f}s")
+            except GeneratorExit:
+                # Consumer stopped early after receiving what it needed
+                self._record_success(entry, operation, time.monotonic() - start)
+                raise
+            except asyncio.CancelledError:
+                entry.breaker.release_trial()
+                raise
+            except LLMRateLimitError:
+                entry.breaker.release_trial()
+                raise
+            except Exception as e:
+                self.errors.inc(provider=entry.name, operation=operation)
+                entry.breaker.record_failure()
+                raise LLMProviderError(f"{entry.name} stream error: {type(e).__name__}: {e}") from e
+            finally:
+                self.inflight.dec(provider=entry.name)
+                record_span(f"llm.{operation}", waited)
+                await stream.aclose()
+                self.latency.observe(time.monotonic() - start, provider=entry.name, operation=operation)
+
     async def evaluate_translation(self, source_text: str, user_translation: str, correct_translation: str, source_lang: str = "일본어") -> str:
-        if self.provider:
-            return await self.provider.evaluate_translation(source_text, user_translation, correct_translation, source_lang)
-        return "LLM 제공자가 설정되지 않았습니다."
-    
+        if not self.providers:
+            return "LLM 제공자가 설정되지 않았습니다."
+        try:
+            return await self._call("evaluation", lambda provider, timeout: provider.evaluate_translation(
+                source_text, user_translation, correct_translation, source_lang, timeout=timeout
+            ))
+        except LLMTimeoutError as e:
+            print(f"Evaluation timeout: {e}")
+            return "평가 시간이 초과되었습니다. 잠시 후 다시 시도해주세요."
+        except Exception as e:
+            print(f"Evaluation API error: {e}")
+            return "평가 중 오류가 발생했습니다."
+
     async def generate_conversations(self, level: str, theme: str, count: int = 10) -> list:
-        if self.provider:
-            return await self.provider.generate_conversations(level, theme, count)
-        return []
-    
+        conversations = []
+        try:
+            async for conv in self.stream_conversations(level, theme, count):
+                conversations.append(conv)
+        except Exception as e:
+            # Keep every object that completed before the stream broke
+            print(f"Conversation generation error: {e} (salvaged {len(conversations)})")
+        if self.providers and not conversations:
+            print("Failed to extract JSON from LLM response")
+        return conversations
+
+    async def stream_conversations(self, level: str, theme: str, count: int = 10, operation: str = "generation") -> AsyncIterator[dict]:
+        """Yield generated conversations one at a time while the response streams in"""
+        stream = self._call_stream(operation, lambda provider, timeout: provider.generate_conversations_stream(
+            level, theme, count, timeout=timeout
+        ))
+        async with aclosing(stream):
+            async for conv in stream:
+                yield conv
+
     async def generate_furigana(self, japanese_text: str) -> str:
-        if self.provider:
-            return await self.provider.generate_furigana(japanese_text)
-        return ""
+        if not self.providers:
+            return ""
+        try:
+            return await self._call("furigana", lambda provider, timeout: provider.generate_furigana(japanese_text, timeout=timeout))
+        except Exception as e:
+            print(f"Furigana error: {e}")
+            return ""
+
+    def start_health_probes(self):
+        """Start the background task that probes open circuits for recovery"""
+        if self.providers and self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(config.circuit_probe_interval)
+            for entry in self.providers:
+                if entry.breaker.ready_for_probe() and entry.breaker.allow_request():
+                    await self._probe(entry)
+
+    async def _probe(self, entry: PooledProvider):
+        """Send a minimal completion; success closes the circuit, failure re-opens it"""
+        timeout = self._operation_timeout("furigana")
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                entry.provider.complete("", "ping", max_tokens=1, temperature=0.0, timeout=timeout, operation="probe"),
+                timeout
+            )
+            entry.breaker.record_success(time.monotonic() - start)
+            print(f"✅ {entry.name} probe succeeded, provider back in rotation")
+        except Exception as e:
+            entry.breaker.record_failure()
+            print(f"⚠️ {entry.name} probe failed: {type(e).__name__}: {e}")
+
+    def get_stats(self) -> dict:
+        """Latency percentiles, timeout/error/hedge counts and circuit state per provider"""
+        return {
+            "latency": self.latency.snapshot(),
+            "timeouts": self.timeouts.snapshot(),
+            "errors": self.errors.snapshot(),
+            "failovers": self.failovers.snapshot(),
+            "hedges": self.hedges.snapshot(),
+            "hedge_wins": self.hedge_wins.snapshot(),
+            "tokens": _token_usage.snapshot(),
+            "circuits": {entry.name: entry.breaker.get_status() for entry in self.providers},
+            "queues": self.scheduler.get_status()
+        }
 
-llm_manager = LLMManager()
\ No newline at end of file
+llm_manager = LazyService("llm_manager", LLMManager)
@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = "interactive"  # a user is waiting: quiz evaluation, /push, buttons
+PRIORITY_BROADCAST = "broadcast"      # scheduled practice delivery
+PRIORITY_BULK = "bulk"                # /generate, mass generation scripts, prefetching
+PRIORITY_RANKS = {PRIORITY_INTERACTIVE: 0, PRIORITY_BROADCAST: 1, PRIORITY_BULK: 2}
+
+_current_priority: ContextVar[Optional[str]] = ContextVar("llm_priority", default=None)
+
+@contextmanager
+def llm_priority(priority: str, override: bool = True):
+    """Tag LLM calls made inside the block with a priority class.
+
+    With override=False an outer tag wins, so e.g. a practice message sent
+    by the broadcast stays at broadcast priority even though the same code
+    is interactive when triggered by /push.
+    """
+    if priority not in PRIORITY_RANKS:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    if not override and _current_priority.get() is not None:
+        yield
+        return
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def current_priority() -> str:
+    """Priority of the current call; untagged work is treated as bulk"""
+    return _current_priority.get() or PRIORITY_BULK
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "future", "granted")
+
+    def __init__(self, priority: str, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+        self.granted = False
+
+class _ProviderQueue:
+    __slots__ = ("active", "waiters")
+
+    def __init__(self):
+        self.active = 0
+        self.waiters: List[_Waiter] = []
+
+class LLMScheduler:
+    """Caps concurrent calls per provider and hands free slots out by priority.
+
+    Waiting raises a request's effective priority by one class every
+    `aging_seconds`, so bulk work still makes progress under a steady
+    stream of interactive calls.
+    """
+
+    def __init__(self, max_concurrency: int = 8, aging_seconds: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.aging_seconds = aging_seconds
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._seq = itertools.count()
+        self.wait_time = metrics.histogram(
+            "llm_queue_wait_seconds", "Time LLM calls waited for a provider slot", ("priority",),
+            buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+        )
+        self.depth = metrics.gauge("llm_queue_depth", "LLM calls waiting for a provider slot", ("provider", "priority"))
+
+    def _effective_rank(self, waiter: _Waiter, now: float) -> tuple:
+        aged = (now - waiter.enqueued) / self.aging_seconds if self.aging_seconds > 0 else 0.0
+        return PRIORITY_RANKS[waiter.priority] - aged, waiter.seq
+
+    def _dispatch(self, provider: str, queue: _ProviderQueue):
+        now = time.monotonic()
+        while queue.active < self.max_concurrency and queue.waiters:
+            waiter = min(queue.waiters, key=lambda w: self._effective_rank(w, now))
+            queue.waiters.remove(waiter)
+            self.depth.dec(provider=provider, priority=waiter.priority)
+            if waiter.future.done():
+                continue  # Gave up (timeout or cancellation) before its turn
+            waiter.granted = True
+            queue.active += 1
+            waiter.future.set_result(None)
+
+    async def acquire(self, provider: str, priority: str, timeout: Optional[float] = None):
+        """Wait for a slot on `provider` and return the seconds spent queued; raises asyncio.TimeoutError after `timeout` seconds"""
+        queue = self._queues.setdefault(provider, _ProviderQueue())
+        if queue.active < self.max_concurrency and not queue.waiters:
+            queue.active += 1
+            self.wait_time.observe(0.0, priority=priority)
+            return 0.0
+
+        waiter = _Waiter(priority, next(self._seq))
+        queue.waiters.append(waiter)
+        self.depth.inc(provider=provider, priority=priority)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+            return time.monotonic() - waiter.enqueued
+        except BaseException:
+            if waiter.granted:
+                self.release(provider)  # Slot arrived just as we gave up
+            elif waiter in queue.waiters:
+                queue.waiters.remove(waiter)
+                self.depth.dec(provider=provider, priority=priority)
+            raise
+        finally:
+            self.wait_time.observe(time.monotonic() - waiter.enqueued, priority=priority)
+
+    def release(self, provider: str):
+        queue = self._queues[provider]
+        queue.active -= 1
+        self._dispatch(provider, queue)
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: str, timeout: Optional[float] = None):
+        await self.acquire(provider, priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(provider)
+
+    def get_status(self) -> dict:
+        return {
+            provider: {"active": queue.active, "waiting": len(queue.waiters)}
+            for provider, queue in self._queues.items()
+        }
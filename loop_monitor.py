@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "Delay between when a loop callback was due and when it ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+loop_stalls = metrics.counter("event_loop_stalls_total", "Times the loop was blocked longer than LOOP_LAG_THRESHOLD")
+
+class LoopMonitor:
+    """Measures event-loop scheduling delay and reports what blocked it.
+
+    A task sleeps for `interval` and records how late it woke up. Separately,
+    a watchdog thread notices when that task has not run for `threshold`
+    seconds and logs the loop thread's stack while it is still stuck, which
+    points at the blocking call rather than at whatever ran after it.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25):
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        print(f"🩺 Event loop monitor started (stall threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            loop_lag.observe(max(0.0, now - expected))
+            self._heartbeat = now
+
+    @staticmethod
+    def _format_stack(frame) -> str:
+        """Stack of the blocked code, starting below the asyncio loop machinery"""
+        entries = traceback.extract_stack(frame)
+        for i in range(len(entries) - 1, -1, -1):
+            if f"asyncio{os.sep}" in entries[i].filename:
+                entries = entries[i + 1:] or entries
+                break
+        return "".join(traceback.format_list(entries))
+
+    def _watch(self):
+        reported = 0.0  # heartbeat of the stall already logged
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            loop_stalls.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = self._format_stack(frame) if frame else "  <stack unavailable>\n"
+            logger.warning(f"🧱 Event loop blocked for {stalled_for * 1000:.0f}ms+, loop thread is at:\n{stack}")
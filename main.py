@@ -1,18 +1,42 @@
+import argparse
 import logging
 import asyncio
+import os
+import signal
+import time
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, PicklePersistence, MessageHandler, filters
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, PicklePersistence, MessageHandler, TypeHandler, filters
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-import pytz
+from apscheduler.triggers.interval import IntervalTrigger
 
 from config import config
+from llm import llm_manager
+from metrics import metrics
+from monitoring import InstrumentedRequest, MetricsServer
+from loop_monitor import LoopMonitor
+from update_processor import PerChatUpdateProcessor
+from user_throttle import coalesce_key
+from generation_jobs import generation_jobs
+from delivery import delivery_scheduler
+from llm_scheduler import llm_priority, PRIORITY_BROADCAST
+from tracing import current_trace_id, describe_update, finish_trace, start_trace
+from webhook import WebhookHandler, application_feed, webhook_secret, webhook_url
+from file_lock import LeaderLock
+from sqlite_persistence import SQLitePersistence
+from utils import data_manager
+from workers import WORKER_SECRET_ENV, UpdateRouter, worker_port
 from handlers import (
     get_conversation_handler,
     push_command,
     generate_command,
+    job_status_command,
+    job_cancel_command,
+    stats_command,
+    realtime_status_command,
     toggle_realtime_command,
     test_broadcast_command,
+    timezone_command,
+    delivery_command,
     button_callback,
     send_daily_practice,
     send_daily_practice_to_user,
@@ -25,15 +49,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Handler group that runs after every other group, closing the trace opened in group -1
+TRACE_FINISH_GROUP = 100
+# Runs after the command handlers, so /timezone and /delivery changes move the user's slot right away
+SUBSCRIBER_GROUP = 99
+# Worker processes: how often a follower tries to take over leadership, the leader
+# picks up subscribers other workers saw, and everyone reloads a changed data.json
+LEADER_RETRY_SECONDS = 5.0
+SUBSCRIBER_SYNC_SECONDS = 30
+DATA_REFRESH_SECONDS = 2.0
+
+broadcast_duration = metrics.histogram(
+    "broadcast_duration_seconds", "Wall time of a full broadcast run",
+    buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+)
+broadcast_messages = metrics.counter("broadcast_messages_total", "Broadcast deliveries by result", ("result",))
+broadcast_send_rate = metrics.gauge("broadcast_send_rate", "Deliveries per second during the last broadcast")
+
 class JapaneseLearningBot:
     def __init__(self):
         self.application = None
         self.scheduler = AsyncIOScheduler()
+        self.metrics_server = None
+        self.webhook_server = None
+        self.loop_monitor = None
+        self.delivery = delivery_scheduler
+        self.delivery.send = self.deliver_practice
+        # Index of this process in a multi-worker deployment, None when running alone
+        self.worker_index = None
+        self.leader = None
+        self._background = []
+        self._subscribers_synced = 0.0
     
     async def error_handler(self, update: Update, context):
-        logger.error(f"Update {update} caused error {context.error}")
+        logger.error(f"Update {update} caused error {context.error} [trace {current_trace_id() or '-'}]")
     
-    async def daily_broadcast(self):
+    async def daily_broadcast(self, run_id: str = None):
+        """Send the practice to every user at once (the benchmark's broadcast scenario).
+
+        Goes through the delivery ledger, so users who already got this hour's
+        run through their slot are skipped.
+        """
         logger.info("Daily broadcast triggered!")
         if not self.application:
             logger.error("Application not available for broadcast")
@@ -45,68 +101,185 @@ class JapaneseLearningBot:
             user_data = await persistence.get_user_data()
             logger.info(f"Found user data: {list(user_data.keys()) if user_data else 'None'}")
             if user_data:
-                for user_id in user_data:
-                    try:
-                        user_info = user_data[user_id]
-                        if user_info and hasattr(user_info, 'get'):
-                            level = user_info.get('level', 'N3')
-                        else:
-                            level = 'N3'  # Default level
-                        logger.info(f"Sending daily practice to user {user_id} with level {level}")
-                        await send_daily_practice_to_user(self.application.bot, user_id, level)
-                        logger.info(f"Successfully sent daily practice to user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Failed to send daily practice to user {user_id}: {e}")
+                start = time.monotonic()
+                counts = await self.delivery.deliver_all(list(user_data), run_id)
+                duration = time.monotonic() - start
+                broadcast_duration.observe(duration)
+                broadcast_send_rate.set(counts["sent"] / duration if duration else 0.0)
+                logger.info(
+                    f"Broadcast finished: {counts['sent']}/{len(user_data)} sent, {counts['failed']} failed, "
+                    f"{counts['skipped']} already delivered, in {duration:.1f}s"
+                )
             else:
                 logger.warning("No user data found for broadcast")
         else:
             logger.error("No persistence available for broadcast")
     
-    def track_user(self, update: Update, context):
-        # User tracking is now handled by persistence
-        pass
+    async def deliver_practice(self, user_id: int):
+        """Send one user their hourly practice when their delivery slot comes up"""
+        if self.worker_index is not None:
+            # The user may be served by another worker; read what it last stored
+            user_info = await self.application.persistence.load_user_data(user_id)
+        else:
+            user_info = self.application.user_data.get(user_id)
+        level = user_info.get('level', 'N3') if user_info and hasattr(user_info, 'get') else 'N3'
+        try:
+            with llm_priority(PRIORITY_BROADCAST):
+                message = await send_daily_practice_to_user(self.application.bot, user_id, level)
+        except Exception:
+            broadcast_messages.inc(result="failed")
+            raise
+        broadcast_messages.inc(result="sent")
+        return message
     
-    async def post_init(self, application: Application):
-        # Schedule hourly broadcasts from 9 AM to 11 PM
-        trigger = CronTrigger(
-            hour='9-23',  # 9 AM to 11 PM
-            minute=0,     # At the start of each hour
-            timezone=pytz.timezone(config.timezone)
-        )
+    async def track_subscriber(self, update: Update, context):
+        # Every user who talks to the bot gets a delivery slot, as with the old broadcast over persistence
+        if update.effective_user and context.user_data is not None:
+            self.delivery.subscribe(update.effective_user.id, context.user_data)
+    
+    async def start_update_trace(self, update: Update, context):
+        # User tracking is handled by persistence; this hook only opens the trace
+        start_trace(describe_update(update))
+    
+    async def finish_update_trace(self, update: Update, context):
+        finish_trace()
+    
+    async def start_scheduled_work(self, application: Application):
+        """Hourly delivery and /generate jobs; run by exactly one process"""
+        if self.worker_index is not None:
+            # A new leader may take over long after start; load everyone other workers stored
+            self._subscribers_synced = time.time()
+            self.delivery.load(await application.persistence.get_user_data())
+            self.scheduler.add_job(
+                self.sync_subscribers,
+                trigger=IntervalTrigger(seconds=SUBSCRIBER_SYNC_SECONDS),
+                id="subscriber_sync",
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
+        else:
+            self.delivery.load(application.user_data)
         
+        # Hourly practice: each user has their own slot within the hour, so the
+        # sends and LLM calls are spread out instead of all firing at :00
+        await self.delivery.start()
         self.scheduler.add_job(
-            self.daily_broadcast,
-            trigger=trigger,
-            id="hourly_broadcast",
+            self.delivery.tick,
+            trigger=IntervalTrigger(seconds=1),
+            id="delivery_tick",
+            max_instances=1,
+            coalesce=True,
             replace_existing=True
         )
         
         self.scheduler.start()
-        logger.info(f"Scheduler started. Hourly broadcasts from 9 AM to 11 PM {config.timezone}")
+        logger.info(
+            f"Scheduler started. Hourly practice from {config.delivery_start_hour}:00 to "
+            f"{config.delivery_end_hour}:59 in each user's timezone (default {config.timezone})"
+        )
+        
+        # Admin /generate jobs run in the background; resume any a restart interrupted
+        await generation_jobs.start(application.bot)
     
-    def run(self):
-        is_valid, error_msg = config.validate()
-        if not is_valid:
-            logger.error(f"Configuration error: {error_msg}")
-            return
+    async def sync_subscribers(self):
+        """Leader: give delivery slots to users other workers served or moved since the last sync"""
+        since, self._subscribers_synced = self._subscribers_synced, time.time()
+        for user_id, data in (await self.application.persistence.user_data_since(since)).items():
+            self.delivery.subscribe(user_id, data)
+    
+    async def contend_for_leadership(self, application: Application):
+        """Followers keep trying the leader lock, so one of them takes over when the leader exits"""
+        while not self.leader.try_acquire():
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+        logger.info(f"Worker {self.worker_index} is the leader and runs the scheduled work")
+        await self.start_scheduled_work(application)
+    
+    async def refresh_data(self):
+        while True:
+            await asyncio.sleep(DATA_REFRESH_SECONDS)
+            try:
+                if await data_manager.refresh():
+                    logger.info(f"Reloaded data.json: {len(data_manager.conversations)} conversations")
+            except Exception as e:
+                logger.error(f"Reloading data.json failed: {e}")
+    
+    async def post_init(self, application: Application):
+        if self.worker_index is None:
+            await self.start_scheduled_work(application)
+        else:
+            self.leader = LeaderLock(config.leader_lock_path)
+            self._background.append(asyncio.create_task(self.contend_for_leadership(application)))
+            self._background.append(asyncio.create_task(self.refresh_data()))
+        
+        # Probe the LLM provider while its circuit is open so real-time generation recovers on its own
+        llm_manager.start_health_probes()
         
-        persistence = PicklePersistence(filepath="bot_data.pickle")
+        metrics.gauge("telegram_update_queue_depth", "Updates fetched but not yet processed").set_function(
+            application.update_queue.qsize
+        )
+        # Workers serve /metrics on their local endpoint; in webhook mode with
+        # METRICS_PORT = WEBHOOK_PORT it is served by the webhook server instead
+        if config.metrics_port and self.worker_index is None and not (config.webhook_url and config.metrics_port == config.webhook_port):
+            self.metrics_server = MetricsServer()
+            await self.metrics_server.start(config.metrics_host, config.metrics_port)
         
-        self.application = (
+        if config.loop_monitor:
+            self.loop_monitor = LoopMonitor(threshold=config.loop_lag_threshold)
+            self.loop_monitor.start()
+    
+    async def post_shutdown(self, application: Application):
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await self.delivery.stop()
+        await generation_jobs.stop()
+        if self.leader:
+            self.leader.release()
+        if self.loop_monitor:
+            await self.loop_monitor.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+    
+    def build_application(self, persistence=None) -> Application:
+        """Create the Application with all handlers registered"""
+        if persistence is None and self.worker_index is not None:
+            # Workers share user data through the state database instead of one pickle file
+            persistence = SQLitePersistence(import_pickle="bot_data.pickle")
+        elif persistence is None:
+            persistence = PicklePersistence(filepath="bot_data.pickle")
+        
+        builder = (
             Application.builder()
             .token(config.bot_token)
+            .base_url(f"{config.telegram_base_url.rstrip('/')}/bot")
+            .base_file_url(f"{config.telegram_base_url.rstrip('/')}/file/bot")
+            .request(InstrumentedRequest())
+            .concurrent_updates(PerChatUpdateProcessor(config.max_concurrent_updates, coalesce_key=coalesce_key))
             .persistence(persistence)
             .post_init(self.post_init)
-            .build()
+            .post_shutdown(self.post_shutdown)
         )
+        if config.webhook_url or self.worker_index is not None:
+            # Updates arrive through the webhook server, so no polling Updater is needed
+            builder = builder.updater(None)
+        self.application = builder.build()
         
         conv_handler = get_conversation_handler()
         self.application.add_handler(conv_handler)
         
         self.application.add_handler(CommandHandler("push", push_command))
         self.application.add_handler(CommandHandler("generate", generate_command))
+        self.application.add_handler(CommandHandler("job_status", job_status_command))
+        self.application.add_handler(CommandHandler("job_cancel", job_cancel_command))
         self.application.add_handler(CommandHandler("toggle_realtime", toggle_realtime_command))
         self.application.add_handler(CommandHandler("test_broadcast", test_broadcast_command))
+        self.application.add_handler(CommandHandler("stats", stats_command))
+        self.application.add_handler(CommandHandler("realtime", realtime_status_command))
+        self.application.add_handler(CommandHandler("timezone", timezone_command))
+        self.application.add_handler(CommandHandler("delivery", delivery_command))
         
         self.application.add_handler(
             CallbackQueryHandler(button_callback, pattern="^(show_|listen_|replay_|save_|quiz_|back_|change_level|new_quiz)")
@@ -119,17 +292,87 @@ class JapaneseLearningBot:
         
         self.application.add_error_handler(self.error_handler)
         
-        # Add a pre-process handler to track users
-        async def track_user_handler(update: Update, context):
-            self.track_user(update, context)
+        # Time every update end to end: group -1 runs before and the last group after all handlers
+        self.application.add_handler(TypeHandler(Update, self.start_update_trace), group=-1)
+        self.application.add_handler(TypeHandler(Update, self.finish_update_trace), group=TRACE_FINISH_GROUP)
+        self.application.add_handler(TypeHandler(Update, self.track_subscriber), group=SUBSCRIBER_GROUP)
+        
+        return self.application
+    
+    def run(self):
+        is_valid, error_msg = config.validate()
+        if not is_valid:
+            logger.error(f"Configuration error: {error_msg}")
+            return
+        
+        if config.workers > 1 and self.worker_index is None:
+            # This process only routes updates; the workers it starts run the bot
+            asyncio.run(UpdateRouter().run())
+            return
+        
+        self.build_application()
+        
+        logger.info("Bot started!" if self.worker_index is None else f"Worker {self.worker_index} started!")
+        if self.worker_index is not None:
+            secret = os.environ[WORKER_SECRET_ENV]
+            asyncio.run(self.serve_webhook("127.0.0.1", worker_port(self.worker_index), secret))
+        elif config.webhook_url:
+            asyncio.run(self.serve_webhook(config.webhook_host, config.webhook_port, webhook_secret(), register=True))
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    async def serve_webhook(self, host: str, port: int, secret: str, register: bool = False):
+        """Receive updates through a webhook on the embedded aiohttp server instead of long polling.
+
+        Mirrors the lifecycle `run_polling` drives: initialize, post_init,
+        start, then stop, shutdown and post_shutdown on SIGINT/SIGTERM. With
+        `register` the webhook is set with Telegram; it stays registered on
+        exit, so Telegram holds the updates that arrive during a restart.
+        Workers are not registered: the router forwards their updates.
+        """
+        application = self.application
+        # A worker's endpoint is local, so it also serves that worker's /metrics
+        serve_metrics = self.worker_index is not None or config.metrics_port == config.webhook_port
+        self.webhook_server = MetricsServer(serve_metrics=serve_metrics)
+        self.webhook_server.add_route("POST", config.webhook_path, WebhookHandler(secret, application_feed(application)).handle)
         
-        self.application.add_handler(MessageHandler(filters.ALL, track_user_handler), group=-1)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
         
-        logger.info("Bot started!")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        await application.initialize()
+        try:
+            await self.post_init(application)
+        except Exception:
+            await application.shutdown()
+            raise
+        try:
+            await self.webhook_server.start(host, port)
+            await application.start()
+            if register:
+                await application.bot.set_webhook(webhook_url(), secret_token=secret, allowed_updates=Update.ALL_TYPES)
+                logger.info(f"Webhook registered at {webhook_url()}, listening on {host}:{port}")
+            await stop.wait()
+        finally:
+            await self.webhook_server.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
 
 def main():
+    parser = argparse.ArgumentParser(description="Japanese learning Telegram bot")
+    # Set by the router for the worker processes it starts (WORKERS > 1)
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import and initialisation time breakdown and exit")
+    args = parser.parse_args()
     bot = JapaneseLearningBot()
+    if args.profile_startup:
+        from startup_profile import profile_startup
+        profile_startup(bot)
+        return
+    bot.worker_index = args.worker
     bot.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import time
+from aiohttp import web
+from telegram.request import HTTPXRequest
+
+from metrics import metrics
+from tracing import span
+
+telegram_latency = metrics.histogram(
+    "telegram_api_request_seconds", "Bot API call latency", ("method",)
+)
+telegram_errors = metrics.counter(
+    "telegram_api_errors_total", "Bot API calls that returned a non-200 status", ("method", "status")
+)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and status of every Bot API call"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with span(f"telegram.{api_method}"):
+                status, payload = await super().do_request(url, method, *args, **kwargs)
+            return status, payload
+        finally:
+            telegram_latency.observe(time.perf_counter() - start, method=api_method)
+            if status != 200:
+                telegram_errors.inc(method=api_method, status=str(status))
+
+class MetricsServer:
+    """Embedded aiohttp server; serves the metrics registry at `/metrics` in the Prometheus text format.
+
+    In webhook mode the Telegram webhook is routed through the same server,
+    and `/metrics` is only added when it is meant to share the port.
+    """
+
+    def __init__(self, serve_metrics: bool = True):
+        self.app = web.Application()
+        self.serve_metrics = serve_metrics
+        if serve_metrics:
+            self.app.router.add_get("/metrics", self._metrics)
+        self._runner = None
+
+    def add_route(self, method: str, path: str, handler):
+        """Route another endpoint through this server; only before `start()`"""
+        self.app.router.add_route(method, path, handler)
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if self.serve_metrics:
+            print(f"📈 Metrics available at http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+def _series(name: str) -> dict:
+    metric = metrics.get(name)
+    return metric.snapshot() if metric else {}
+
+def _ms(seconds) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+
+def _ratio(hits: float, total: float) -> str:
+    return f"{hits / total:.0%}" if total else "-"
+
+def format_stats() -> str:
+    """Render the key numbers of the metrics registry for the admin /stats command"""
+    lines = ["📊 봇 상태"]
+
+    lines.append("\n🤖 LLM (p50 / p95 / 호출 수)")
+    latency = _series("llm_request_duration_seconds")
+    for (provider, operation), series in sorted(latency.items()):
+        lines.append(f"• {provider} {operation}: {_ms(series['p50'])} / {_ms(series['p95'])} / {series['count']}")
+    if not latency:
+        lines.append("• 기록 없음")
+    for metric_name, label in (("llm_timeouts_total", "타임아웃"), ("llm_errors_total", "오류"), ("llm_failovers_total", "페일오버")):
+        total = sum(_series(metric_name).values())
+        if total:
+            lines.append(f"• {label}: {total:.0f}")
+    tokens = {}
+    for (provider, operation, kind), value in _series("llm_tokens_total").items():
+        tokens[kind] = tokens.get(kind, 0) + value
+    if tokens:
+        lines.append(f"• 토큰: 입력 {tokens.get('input', 0):.0f} / 출력 {tokens.get('output', 0):.0f}")
+    inflight = sum(_series("llm_inflight_requests").values())
+    lines.append(f"• 진행 중 요청: {inflight:.0f}")
+    queued = _series("llm_queue_depth")
+    for (priority,), series in sorted(_series("llm_queue_wait_seconds").items()):
+        waiting = sum(value for (provider, p), value in queued.items() if p == priority)
+        lines.append(f"• 대기 ({priority}): {waiting:.0f}건, p95 {_ms(series['p95'])}")
+
+    lines.append("\n⏱ 업데이트 처리 (p95 / 건수)")
+    updates = _series("update_duration_seconds")
+    for (handler,), series in sorted(updates.items(), key=lambda item: -(item[1]["p95"] or 0))[:5]:
+        lines.append(f"• {handler}: {_ms(series['p95'])} / {series['count']}")
+    slow = sum(_series("slow_updates_total").values())
+    if slow:
+        lines.append(f"• 느린 업데이트: {slow:.0f}")
+
+    lines.append("\n💾 캐시 / 저장소")
+    cache = _series("cache_requests_total")
+    for cache_name in sorted({key[0] for key in cache}):
+        hits = cache.get((cache_name, "hit"), 0)
+        total = hits + cache.get((cache_name, "miss"), 0)
+        lines.append(f"• {cache_name} 캐시 적중률: {_ratio(hits, total)} ({total:.0f}회)")
+    served = _series("conversations_served_total")
+    realtime, stored = served.get(("realtime",), 0), served.get(("stored",), 0)
+    lines.append(f"• 실시간 생성 비율: {_ratio(realtime, realtime + stored)} ({realtime + stored:.0f}회)")
+    audio = _series("audio_generation_seconds")
+    for (lang,), series in sorted(audio.items()):
+        lines.append(f"• 음성 생성 ({lang}) p95: {_ms(series['p95'])}")
+    for (store,), series in sorted(_series("storage_write_seconds").items()):
+        lines.append(f"• {store} 쓰기 p95: {_ms(series['p95'])} ({series['count']}회)")
+
+    lines.append("\n📨 텔레그램")
+    broadcast = _series("broadcast_duration_seconds")
+    if broadcast:
+        last_rate = _series("broadcast_send_rate").get((), 0)
+        lines.append(f"• 브로드캐스트: {broadcast[()]['count']}회, p50 {broadcast[()]['p50']:.1f}s, 최근 {last_rate:.1f}건/초")
+    sent = _series("broadcast_messages_total")
+    if sent:
+        lines.append(f"• 브로드캐스트 전송: 성공 {sent.get(('sent',), 0):.0f} / 실패 {sent.get(('failed',), 0):.0f}")
+    subscribers = _series("delivery_subscribers").get(())
+    if subscribers is not None:
+        lag = _series("delivery_slot_lag_seconds").get(())
+        lines.append(f"• 매시간 배달 대상: {subscribers:.0f}명" + (f", 슬롯 대비 지연 p95 {_ms(lag['p95'])}" if lag else ""))
+    api = _series("telegram_api_request_seconds")
+    calls = sum(series["count"] for series in api.values())
+    errors = sum(_series("telegram_api_errors_total").values())
+    lines.append(f"• Bot API 호출: {calls}회, 오류 {errors:.0f}")
+    for (method,), series in sorted(api.items(), key=lambda item: -item[1]["count"])[:3]:
+        lines.append(f"  - {method}: p95 {_ms(series['p95'])}")
+    queue = _series("telegram_update_queue_depth")
+    if queue:
+        lines.append(f"• 업데이트 대기열: {queue.get((), 0):.0f}")
+    active, waiting = _series("updates_active").get((), 0), _series("updates_waiting").get((), 0)
+    wait = _series("update_wait_seconds").get(())
+    lines.append(f"• 처리 중 / 대기 중 업데이트: {active:.0f} / {waiting:.0f}" + (f" (대기 p95 {_ms(wait['p95'])})" if wait else ""))
+
+    lag = _series("event_loop_lag_seconds").get(())
+    if lag:
+        stalls = sum(_series("event_loop_stalls_total").values())
+        lines.append("\n🩺 이벤트 루프")
+        lines.append(f"• 지연 p50 / p95 / p99: {_ms(lag['p50'])} / {_ms(lag['p95'])} / {_ms(lag['p99'])}")
+        lines.append(f"• 블로킹 감지: {stalls:.0f}회")
+
+    return "\n".join(lines)
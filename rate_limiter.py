@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Optional
+
+from metrics import metrics
+from state_db import get_connection, transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+def estimate_tokens(system: str, prompt: str, max_tokens: int) -> int:
+    """Rough upper bound of a call's token cost: prompt length plus the completion budget"""
+    # Japanese/Korean text runs close to one token per character or two
+    return (len(system) + len(prompt) + 1) // 2 + max_tokens
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared through SQLite.
+
+    Every process using the same state database (the bot and the generation
+    scripts) draws from the same buckets, so together they stay under the
+    provider's quota. A 429 blocks the bucket for the advertised Retry-After.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._initialized = False
+        self.waits = metrics.histogram(
+            "llm_rate_limit_wait_seconds", "Time spent waiting for rate-limit capacity", ("key",),
+            buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+        )
+        self.limited = metrics.counter(
+            "llm_rate_limited_total", "Calls delayed or rejected by rate limits", ("key", "source")
+        )
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _try_take(self, key: str, rpm: float, tpm: float, cost: float) -> float:
+        """Take one request and `cost` tokens if available; otherwise return seconds to wait"""
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT requests, tokens, updated, blocked_until FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                requests, tokens, blocked_until = float(rpm or 1), float(tpm or cost), 0.0
+            else:
+                requests, tokens, updated, blocked_until = row
+                elapsed = max(0.0, now - updated)
+                requests = min(float(rpm), requests + elapsed * rpm / 60.0) if rpm else 1.0
+                tokens = min(float(tpm), tokens + elapsed * tpm / 60.0) if tpm else cost
+            # A single call larger than the whole minute budget may still run once the bucket is full
+            cost = min(cost, tpm) if tpm else 0.0
+
+            wait = 0.0
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif rpm and requests < 1.0:
+                wait = (1.0 - requests) * 60.0 / rpm
+            elif tpm and tokens < cost:
+                wait = (cost - tokens) * 60.0 / tpm
+            else:
+                requests -= 1.0 if rpm else 0.0
+                tokens -= cost
+
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (key, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, ?)",
+                (key, requests, tokens, now, blocked_until)
+            )
+            return wait
+
+    async def acquire(self, key: str, rpm: float, tpm: float, cost: float, max_wait: Optional[float] = None) -> float:
+        """Wait until the call fits the budget. Returns the time waited.
+
+        Raises asyncio.TimeoutError with the required wait when that is longer
+        than `max_wait`, so callers can fail over instead of sleeping.
+        """
+        if not rpm and not tpm:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            wait = await asyncio.to_thread(self._try_take, key, rpm, tpm, cost)
+            if wait <= 0:
+                waited = time.monotonic() - start
+                if waited > 0.001:
+                    self.waits.observe(waited, key=key)
+                return waited
+            if max_wait is not None and time.monotonic() - start + wait > max_wait:
+                self.limited.inc(key=key, source="local")
+                raise asyncio.TimeoutError(wait)
+            await asyncio.sleep(wait)
+
+    def _block(self, key: str, seconds: float):
+        until = time.time() + seconds
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                "INSERT INTO rate_buckets (key, requests, tokens, updated, blocked_until) VALUES (?, 0, 0, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET requests = 0, blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (key, time.time(), until)
+            )
+
+    async def block(self, key: str, seconds: float):
+        """Stop all processes from calling `key` for `seconds` (after a 429)"""
+        self.limited.inc(key=key, source="upstream")
+        await asyncio.to_thread(self._block, key, seconds)
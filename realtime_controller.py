@@ -0,0 +1,103 @@
+import random
+import time
+from collections import deque
+from typing import Optional
+
+from config import config
+from metrics import metrics
+
+realtime_ratio = metrics.gauge("realtime_ratio", "Current probability of generating a conversation in real time")
+realtime_decisions = metrics.counter("realtime_decisions_total", "Real-time vs stored decisions", ("decision", "reason"))
+
+class RealtimeController:
+    """Feedback controller for the share of conversations generated in real time.
+
+    Every `interval` seconds it compares the recent real-time p95 latency,
+    error rate and LLM queue depth against their targets. When any of them is
+    over target (pressure >= 1) the ratio is halved; otherwise it climbs back
+    towards the configured ratio by `recovery_step`. Halving sheds load fast
+    when the providers struggle, the additive climb avoids oscillating back
+    into overload as soon as they recover.
+    """
+
+    def __init__(self, window: int = 50, window_seconds: float = 120.0, interval: float = 5.0, recovery_step: float = 0.05):
+        self.ratio = config.realtime_ratio
+        self.window_seconds = window_seconds
+        self.interval = interval
+        self.recovery_step = recovery_step
+        # (timestamp, latency, ok) of recent real-time attempts
+        self._outcomes = deque(maxlen=window)
+        self._last_update = 0.0
+        self.inputs = {"p95": None, "error_rate": 0.0, "queue_depth": 0, "pressure": 0.0}
+        realtime_ratio.set(self.ratio)
+
+    def record(self, latency: float, ok: bool):
+        """Report how a real-time generation attempt went"""
+        self._outcomes.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        return [outcome for outcome in self._outcomes if outcome[0] >= cutoff]
+
+    def _p95(self, recent: list) -> Optional[float]:
+        latencies = sorted(latency for _, latency, _ in recent)
+        if len(latencies) < 5:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _queue_depth(self) -> int:
+        from llm import llm_manager
+        return sum(status["waiting"] for status in llm_manager.scheduler.get_status().values())
+
+    def update(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_update < self.interval:
+            return
+        self._last_update = now
+
+        recent = self._recent()
+        p95 = self._p95(recent)
+        error_rate = sum(1 for _, _, ok in recent if not ok) / len(recent) if recent else 0.0
+        queue_depth = self._queue_depth()
+        pressure = max(
+            (p95 or 0.0) / config.realtime_p95_target,
+            error_rate / config.realtime_max_error_rate,
+            queue_depth / config.realtime_max_queue
+        )
+        self.inputs = {"p95": p95, "error_rate": error_rate, "queue_depth": queue_depth, "pressure": pressure}
+
+        if pressure >= 1.0:
+            self.ratio = self.ratio / 2 if self.ratio > 0.02 else 0.0
+        else:
+            self.ratio = min(config.realtime_ratio, self.ratio + self.recovery_step)
+        realtime_ratio.set(self.ratio)
+
+    @property
+    def saturated(self) -> bool:
+        return self.inputs["pressure"] >= 1.0
+
+    def should_generate(self, stored_count: int, remaining_budget: Optional[float] = None) -> bool:
+        """Decide whether this request gets a freshly generated conversation"""
+        self.update()
+        if stored_count == 0:
+            return self._decide(True, "no_stored")
+        # Not enough time left in the caller's budget for a typical generation
+        p95 = self.inputs["p95"]
+        if remaining_budget is not None and p95 is not None and remaining_budget < p95:
+            return self._decide(False, "budget")
+        if self.saturated:
+            return self._decide(False, "saturated")
+        # Levels with few stored conversations always get fresh ones while healthy
+        if stored_count < 10:
+            return self._decide(True, "few_stored")
+        return self._decide(random.random() < self.ratio, "ratio")
+
+    def _decide(self, generate: bool, reason: str) -> bool:
+        realtime_decisions.inc(decision="realtime" if generate else "stored", reason=reason)
+        return generate
+
+    def get_status(self) -> dict:
+        self.update()
+        return {"ratio": self.ratio, "target_ratio": config.realtime_ratio, "samples": len(self._recent()), **self.inputs}
+
+realtime_controller = RealtimeController()
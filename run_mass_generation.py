@@ -3,9 +3,11 @@
 Direct mass conversation generation - no interaction needed.
 """
 
+import argparse
 import asyncio
-import json
 from llm import llm_manager
+from llm_scheduler import llm_priority, PRIORITY_BULK
+from utils import data_manager
 
 # Configuration
 THEMES = [
@@ -21,6 +23,7 @@ THEMES = [
 
 LEVELS = ["N5", "N4", "N3", "N2", "N1"]
 CONVERSATIONS_PER_THEME_LEVEL = 25  # 25 * 8 themes * 5 levels = 1000 conversations
+BATCH_SAVE_EVERY = 200
 
 async def mass_generate():
     """Generate conversations for all themes and levels."""
@@ -28,17 +31,7 @@ async def mass_generate():
     print("🎯 Target: 1000+ conversations")
     print("⚡ Going full throttle - no stopping!")
     
-    # Load existing data
-    try:
-        with open("data.json", "r", encoding="utf-8") as f:
-            existing_data = json.load(f)
-            conversations = existing_data.get("conversations", [])
-            next_id = max([c["id"] for c in conversations]) + 1 if conversations else 1
-    except FileNotFoundError:
-        conversations = []
-        next_id = 1
-    
-    print(f"📊 Starting with {len(conversations)} existing conversations")
+    print(f"📊 Starting with {len(data_manager.conversations)} existing conversations")
     
     generated_count = 0
     total_target = len(THEMES) * len(LEVELS) * CONVERSATIONS_PER_THEME_LEVEL
@@ -51,52 +44,71 @@ async def mass_generate():
             
             try:
                 # Generate conversations
-                new_conversations = await llm_manager.generate_conversations(
-                    level=level,
-                    theme=theme,
-                    count=CONVERSATIONS_PER_THEME_LEVEL
-                )
+                with llm_priority(PRIORITY_BULK):
+                    new_conversations = await llm_manager.generate_conversations(
+                        level=level,
+                        theme=theme,
+                        count=CONVERSATIONS_PER_THEME_LEVEL
+                    )
                 
                 if new_conversations:
-                    # Add IDs and level to each conversation
-                    for conv in new_conversations:
-                        conv["id"] = next_id
-                        conv["level"] = level
-                        conversations.append(conv)
-                        next_id += 1
-                        generated_count += 1
+                    # Ids, level and a locked, atomic append to data.json, so a running bot's additions are kept
+                    await data_manager.add_conversations(new_conversations, level)
+                    generated_count += len(new_conversations)
                     
                     progress = (generated_count / total_target) * 100
                     print(f"  ✅ SUCCESS! Generated {len(new_conversations)} | Progress: {generated_count}/{total_target} ({progress:.1f}%)")
                 else:
                     print(f"  ❌ FAILED for {level} {theme}")
                 
-                # Save every 50 conversations
-                if generated_count % 50 == 0:
-                    save_data(conversations)
-                    print(f"  💾 SAVED CHECKPOINT: {generated_count} conversations")
-                
             except Exception as e:
                 print(f"  💥 ERROR {level} {theme}: {e}")
                 continue
     
-    # Final save
-    save_data(conversations)
-    
     print(f"\n🎉🎉🎉 MASS GENERATION COMPLETE! 🎉🎉🎉")
     print(f"📊 Generated: {generated_count} new conversations")
-    print(f"📊 Total in database: {len(conversations)} conversations")
+    print(f"📊 Total in database: {len(data_manager.conversations)} conversations")
     print(f"💾 Saved to data.json")
     print(f"🚀 Your bot now has MASSIVE conversation power!")
 
-def save_data(conversations):
-    """Save conversations to data.json file."""
-    data = {
-        "conversations": conversations
-    }
+async def batch_generate(provider: str = None):
+    """Generate the same level x theme corpus through a provider batch API."""
+    from batch_generation import BatchGeneration, create_batch_client
+    
+    client = create_batch_client(provider)
+    print(f"📦 Starting batch generation via {client.name}...")
+    
+    print(f"📊 Starting with {len(data_manager.conversations)} existing conversations")
     
-    with open("data.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    jobs = [(level, theme, CONVERSATIONS_PER_THEME_LEVEL) for level in LEVELS for theme in THEMES]
+    existing = [dict(conv) for conv in data_manager.conversations]
+    generated_count = 0
+    pending = []
+    async for conv in BatchGeneration(client).run(jobs, existing=existing):
+        pending.append(conv)
+        
+        # Append every 200 conversations while results stream in, through the
+        # same locked, atomic path the running bot uses
+        if len(pending) >= BATCH_SAVE_EVERY:
+            generated_count += len(await data_manager.add_conversations(pending))
+            pending = []
+            print(f"  💾 SAVED CHECKPOINT: {generated_count} conversations")
+    
+    if pending:
+        generated_count += len(await data_manager.add_conversations(pending))
+    print("\n🎉 BATCH GENERATION COMPLETE!")
+    print(f"📊 Generated: {generated_count} new conversations")
+    print(f"📊 Total in database: {len(data_manager.conversations)} conversations")
 
 if __name__ == "__main__":
-    asyncio.run(mass_generate())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate conversations for every level and theme")
+    parser.add_argument("--batch", action="store_true",
+                        help="Use the OpenAI/Anthropic batch API (cheaper, separate quota, results within 24h)")
+    parser.add_argument("--provider", choices=["openai", "claude"],
+                        help="Batch provider (default: first configured one that supports batches)")
+    args = parser.parse_args()
+    
+    if args.batch:
+        asyncio.run(batch_generate(args.provider))
+    else:
+        asyncio.run(mass_generate())
\ No newline at end of file
@@ -0,0 +1,52 @@
+import threading
+import time
+from typing import Callable, Dict
+
+# Every lazily built service by name, for --profile-startup
+SERVICES: Dict[str, "LazyService"] = {}
+
+class LazyService:
+    """Module-level handle to a service that is built on first use.
+
+    Modules keep exposing their service under the usual name (`llm_manager`,
+    `data_manager`), but importing them no longer builds it: the factory
+    runs the first time an attribute is used. Startup only pays for what it
+    touches, and a process that never uses a service never builds it.
+    """
+
+    __slots__ = ("name", "_factory", "_instance", "_lock", "init_seconds")
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "init_seconds", None)
+        SERVICES[name] = self
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        """The service, built on the first call"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    object.__setattr__(self, "init_seconds", time.perf_counter() - start)
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.get(), attr, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self.initialized else "not initialized"
+        return f"<LazyService {self.name} ({state})>"
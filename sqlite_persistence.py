@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import time
+from typing import Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from state_db import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS persisted_data (
+    kind TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS persisted_conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+USER = "user"
+CHAT = "chat"
+BOT = "bot"
+
+class SQLitePersistence(BasePersistence):
+    """python-telegram-bot persistence in the shared state database, one row per user and chat.
+
+    PicklePersistence rewrites one file holding everybody's data, so two
+    processes sharing it overwrite each other. Here each process writes only
+    the rows of the users it touched, which lets the workers of a
+    multi-process deployment share one store. On first use an existing
+    `bot_data.pickle` is imported, so switching over keeps every user.
+    """
+
+    def __init__(self, path: str = None, import_pickle: str = None, update_interval: float = 5):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.path = path
+        self.import_pickle = import_pickle
+        self._initialized = False
+
+    def _conn(self):
+        conn = get_connection(self.path)
+        if not self._initialized:
+            conn.executescript(_SCHEMA)
+            self._import_pickle(conn)
+            self._initialized = True
+        return conn
+
+    def _import_pickle(self, conn):
+        if not self.import_pickle or not os.path.exists(self.import_pickle):
+            return
+        with transaction(conn):
+            # Every worker starts at once; only the first one to get here imports
+            if conn.execute("SELECT 1 FROM persisted_data LIMIT 1").fetchone():
+                return
+            with open(self.import_pickle, "rb") as f:
+                data = pickle.load(f)
+            now = time.time()
+            rows = [(USER, key, pickle.dumps(value), now) for key, value in (data.get("user_data") or {}).items()]
+            rows += [(CHAT, key, pickle.dumps(value), now) for key, value in (data.get("chat_data") or {}).items()]
+            if data.get("bot_data"):
+                rows.append((BOT, 0, pickle.dumps(data["bot_data"]), now))
+            conn.executemany("INSERT INTO persisted_data (kind, key, data, updated) VALUES (?, ?, ?, ?)", rows)
+        logger.info(f"Imported {len(rows)} records from {self.import_pickle}")
+
+    def _fetch_all(self, kind: str, since: float = 0.0) -> Dict[int, dict]:
+        rows = self._conn().execute(
+            "SELECT key, data FROM persisted_data WHERE kind = ? AND updated > ?", (kind, since)
+        ).fetchall()
+        return {key: pickle.loads(data) for key, data in rows}
+
+    def _fetch_one(self, kind: str, key: int) -> Optional[dict]:
+        row = self._conn().execute("SELECT data FROM persisted_data WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def _store(self, kind: str, key: int, value):
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO persisted_data (kind, key, data, updated) VALUES (?, ?, ?, ?)",
+                (kind, key, pickle.dumps(value), time.time())
+            )
+
+    def _delete(self, kind: str, key: int):
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute("DELETE FROM persisted_data WHERE kind = ? AND key = ?", (kind, key))
+
+    def _fetch_conversations(self, name: str) -> dict:
+        rows = self._conn().execute("SELECT key, state FROM persisted_conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    def _store_conversation(self, name: str, key: tuple, state):
+        conn = self._conn()
+        with transaction(conn):
+            if state is None:
+                conn.execute("DELETE FROM persisted_conversations WHERE name = ? AND key = ?", (name, json.dumps(key)))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO persisted_conversations (name, key, state) VALUES (?, ?, ?)",
+                    (name, json.dumps(key), pickle.dumps(state))
+                )
+
+    async def load_user_data(self, user_id: int) -> Optional[dict]:
+        """One user's stored data, as last written by whichever worker serves them"""
+        return await asyncio.to_thread(self._fetch_one, USER, user_id)
+
+    async def user_data_since(self, since: float) -> Dict[int, dict]:
+        """Users whose data changed after `since` (a time.time() timestamp)"""
+        return await asyncio.to_thread(self._fetch_all, USER, since)
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return await asyncio.to_thread(self._fetch_all, USER)
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return await asyncio.to_thread(self._fetch_all, CHAT)
+
+    async def get_bot_data(self) -> dict:
+        return await asyncio.to_thread(self._fetch_one, BOT, 0) or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return await asyncio.to_thread(self._fetch_conversations, name)
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        await asyncio.to_thread(self._store_conversation, name, key, new_state)
+
+    async def update_user_data(self, user_id: int, data: dict):
+        await asyncio.to_thread(self._store, USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        await asyncio.to_thread(self._store, CHAT, chat_id, data)
+
+    async def update_bot_data(self, data: dict):
+        await asyncio.to_thread(self._store, BOT, 0, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        await asyncio.to_thread(self._delete, USER, user_id)
+
+    async def drop_chat_data(self, chat_id: int):
+        await asyncio.to_thread(self._delete, CHAT, chat_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        # Updates are sharded by chat, so the worker holding a user's data in memory is the only one writing it
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        # Every update is written through; nothing is buffered here
+        pass
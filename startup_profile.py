@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from services import SERVICES
+
+def import_breakdown(module: str = "main") -> Tuple[float, List[Tuple[str, float]]]:
+    """Wall time of importing `module` in a fresh interpreter, and self time per top-level package.
+
+    Runs `python -X importtime`, so modules this process already imported
+    are measured as a cold start would see them.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    per_package: Dict[str, float] = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        package = name.strip().split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + int(self_us) / 1e6
+        if name.strip() == module:
+            total = int(cumulative_us) / 1e6
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"import {module} failed")
+    return total, sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+
+def profile_startup(bot, top: int = 15):
+    """Print where a cold start spends its time: imports, application setup and service initialisation"""
+    total, packages = import_breakdown()
+    print(f"⏱️ import main: {total * 1000:.0f}ms")
+    for package, seconds in packages[:top]:
+        print(f"  {package:<28} {seconds * 1000:8.1f}ms")
+    rest = sum(seconds for _, seconds in packages[top:])
+    if rest:
+        print(f"  {'(other)':<28} {rest * 1000:8.1f}ms")
+
+    start = time.perf_counter()
+    bot.build_application()
+    print(f"⏱️ build_application: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    # Services are built lazily while the bot runs; build them here to show what each costs
+    for name, service in SERVICES.items():
+        try:
+            service.get()
+            print(f"⏱️ {name}: {service.init_seconds * 1000:.0f}ms")
+        except Exception as e:
+            print(f"⏱️ {name}: failed ({type(e).__name__}: {e})")
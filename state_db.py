@@ -0,0 +1,34 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import config
+
+_local = threading.local()
+
+def get_connection(path: str = None) -> sqlite3.Connection:
+    """Per-thread connection to the shared state database (WAL, so readers never block the writer)"""
+    path = path or config.state_db_path
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        # Autocommit; writers open explicit transactions with `transaction()`
+        conn = sqlite3.connect(path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """BEGIN IMMEDIATE so read-modify-write sequences are atomic across processes"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
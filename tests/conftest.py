@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory with its own data.json and state database"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("STATE_DB_PATH", str(tmp_path / "state.db"))
+    from config import config
+    monkeypatch.setattr(config, "state_db_path", str(tmp_path / "state.db"))
+    return tmp_path
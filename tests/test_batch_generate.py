@@ -0,0 +1,63 @@
+import asyncio
+import json
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("aiofiles")
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+
+from conftest import ROOT
+
+# What a running bot does when it saves a real-time conversation
+BOT_APPEND = """
+import asyncio, sys
+sys.path.insert(0, {root!r})
+from utils import data_manager
+asyncio.run(data_manager.add_conversations([{{"jp": {jp!r}, "kr": "실시간"}}], "N5"))
+"""
+
+def bot_appends(jp: str):
+    subprocess.run([sys.executable, "-c", BOT_APPEND.format(root=ROOT, jp=jp)], check=True)
+
+class FakeClient:
+    name = "fake"
+
+class FakeBatchGeneration:
+    """Streams batch results while the bot appends real-time conversations in between"""
+
+    def __init__(self, client):
+        pass
+
+    async def run(self, jobs, existing=()):
+        for i in range(120):
+            if i in (10, 60, 110):
+                bot_appends(f"実時間 {i}")
+            yield {"jp": f"バッチ {i}", "kr": f"배치 {i}", "level": "N4"}
+
+def test_batch_results_keep_conversations_appended_meanwhile(workdir, monkeypatch):
+    with open("data.json", "w", encoding="utf-8") as f:
+        json.dump({"conversations": [{"id": 1, "level": "N5", "jp": "既存", "kr": "기존"}]}, f)
+
+    import batch_generation
+    import run_mass_generation
+    import utils
+    from id_allocator import IdAllocator
+    monkeypatch.setattr(batch_generation, "BatchGeneration", FakeBatchGeneration)
+    monkeypatch.setattr(batch_generation, "create_batch_client", lambda provider=None: FakeClient())
+    monkeypatch.setattr(run_mass_generation, "BATCH_SAVE_EVERY", 50)
+    monkeypatch.setattr(run_mass_generation, "data_manager", utils.DataManager())
+    monkeypatch.setattr(utils, "conversation_ids", IdAllocator("conversation", floor=utils._next_free_id))
+
+    asyncio.run(run_mass_generation.batch_generate())
+
+    with open("data.json", "r", encoding="utf-8") as f:
+        conversations = json.load(f)["conversations"]
+    texts = {conv["jp"] for conv in conversations}
+    assert "既存" in texts
+    assert {"実時間 10", "実時間 60", "実時間 110"} <= texts
+    assert {f"バッチ {i}" for i in range(120)} <= texts
+    assert len(conversations) == 1 + 3 + 120
+    assert len({conv["id"] for conv in conversations}) == len(conversations)
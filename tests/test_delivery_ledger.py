@@ -0,0 +1,70 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("dotenv")
+
+from conftest import ROOT
+
+RUN_ID = "hourly-20260101T09"
+
+# Delivers RUN_ID to the given users, logging each send, and dies right
+# after the send to `crash_after` (before the ledger flushes any outcome)
+DELIVER = """
+import asyncio, os, sys
+sys.path.insert(0, {root!r})
+from delivery import DeliveryScheduler
+from delivery_ledger import DeliveryLedger
+
+async def send(user_id):
+    with open("sent.log", "a") as f:
+        f.write(f"{{user_id}}\\n")
+    if user_id == {crash_after!r}:
+        os._exit(1)
+
+scheduler = DeliveryScheduler(send, max_concurrent=1, ledger=DeliveryLedger(flush_size=1000, flush_interval=3600))
+print(asyncio.run(scheduler.deliver_all({user_ids!r}, {run_id!r})))
+"""
+
+def deliver(user_ids, crash_after=None) -> int:
+    script = DELIVER.format(root=ROOT, user_ids=user_ids, run_id=RUN_ID, crash_after=crash_after)
+    return subprocess.run([sys.executable, "-c", script]).returncode
+
+def sent_log():
+    with open("sent.log") as f:
+        return [int(line) for line in f.read().split()]
+
+def test_crash_between_send_and_flush_does_not_resend(workdir):
+    assert deliver([1, 2, 3, 4], crash_after=4) == 1
+    assert sorted(sent_log()) == [1, 2, 3, 4]
+
+    # The restarted process sees the pending claims and only sends to the new user
+    assert deliver([1, 2, 3, 4, 5]) == 0
+    assert sorted(sent_log()) == [1, 2, 3, 4, 5]
+
+def test_schedulers_sharing_the_database_send_once(workdir):
+    from delivery import DeliveryScheduler
+    from delivery_ledger import DeliveryLedger
+
+    sent = []
+
+    async def send(user_id):
+        await asyncio.sleep(0)
+        sent.append(user_id)
+
+    async def main():
+        # Like the leader and a worker running /test_broadcast: separate ledgers, one database
+        leader = DeliveryScheduler(send, max_concurrent=4, ledger=DeliveryLedger())
+        worker = DeliveryScheduler(send, max_concurrent=4, ledger=DeliveryLedger())
+        return await asyncio.gather(
+            leader.deliver_all(range(50), RUN_ID),
+            worker.deliver_all(range(25, 75), RUN_ID),
+        )
+
+    first, second = asyncio.run(main())
+    assert sorted(sent) == list(range(75))
+    assert first["sent"] + second["sent"] == 75
+    assert first["skipped"] + second["skipped"] == 25
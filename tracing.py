@@ -0,0 +1,106 @@
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+update_duration = metrics.histogram(
+    "update_duration_seconds", "End-to-end handling time of an update", ("handler",)
+)
+slow_updates = metrics.counter(
+    "slow_updates_total", "Updates slower than SLOW_UPDATE_THRESHOLD", ("handler",)
+)
+
+class Trace:
+    """Timing of one update: total wall time plus time spent per span name"""
+
+    __slots__ = ("trace_id", "handler", "started", "sampled", "spans")
+
+    def __init__(self, handler: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        # span name -> [seconds, calls]
+        self.spans: Dict[str, list] = {}
+
+    def add(self, name: str, seconds: float):
+        entry = self.spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def breakdown(self, total: float) -> str:
+        parts = [
+            f"{name}={seconds * 1000:.0f}ms" + (f"×{calls}" if calls > 1 else "")
+            for name, (seconds, calls) in sorted(self.spans.items(), key=lambda item: -item[1][0])
+        ]
+        # Spans may overlap (concurrent LLM calls), so "other" is a lower bound
+        other = total - sum(seconds for seconds, _ in self.spans.values())
+        if other > 0:
+            parts.append(f"other={other * 1000:.0f}ms")
+        return ", ".join(parts)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+def current_trace_id() -> str:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else ""
+
+def start_trace(handler: str) -> Trace:
+    """Begin timing an update; spans are only collected for sampled traces"""
+    trace = Trace(handler, sampled=random.random() < config.trace_sample_rate)
+    _current_trace.set(trace)
+    return trace
+
+def finish_trace():
+    """Record the current update's duration and log it if it was slow"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    _current_trace.set(None)
+    total = time.perf_counter() - trace.started
+    update_duration.observe(total, handler=trace.handler)
+    if total >= config.slow_update_threshold:
+        slow_updates.inc(handler=trace.handler)
+        detail = trace.breakdown(total) if trace.sampled else "not sampled"
+        logger.warning(f"🐢 Slow update [{trace.trace_id}] {trace.handler}: {total * 1000:.0f}ms ({detail})")
+
+def record_span(name: str, seconds: float):
+    """Add time measured elsewhere (e.g. across a stream's chunks) to the current trace"""
+    trace = _current_trace.get()
+    if trace is not None and trace.sampled:
+        trace.add(name, seconds)
+
+@contextmanager
+def span(name: str):
+    """Attribute the time spent in the block to `name` in the current trace"""
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+def describe_update(update) -> str:
+    """Handler label for an update: command name, callback action prefix or message type"""
+    if getattr(update, "callback_query", None) is not None:
+        # Drop conversation ids so labels stay bounded: show_jp_12 -> show_jp
+        parts = [part for part in (update.callback_query.data or "").split("_") if not part.isdigit()]
+        return f"callback:{'_'.join(parts[:2])}"
+    message = getattr(update, "message", None)
+    if message is not None:
+        text = message.text or ""
+        if text.startswith("/"):
+            return f"command:{text.split()[0][1:].split('@', 1)[0]}"
+        return "message:text" if text else "message:other"
+    return "update:other"
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+
+updates_active = metrics.gauge("updates_active", "Updates currently being handled")
+updates_waiting = metrics.gauge("updates_waiting", "Updates queued behind a global slot or their chat's previous update")
+update_wait = metrics.histogram(
+    "update_wait_seconds", "Time an update waited for its chat and a global slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+updates_superseded = metrics.counter(
+    "updates_superseded_total", "Updates dropped or cancelled because a newer one of the same action arrived", ("action", "state")
+)
+
+def _chat_key(update: object) -> Optional[Hashable]:
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return user.id if user is not None else None
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Handle updates concurrently, but one at a time per chat.
+
+    Updates of different chats run in parallel up to `max_concurrent_updates`.
+    Updates of the same chat run strictly in arrival order, so handlers never
+    mutate one user's `user_data` (quiz_data, daily_conversation) concurrently.
+    The chat lock is taken before the global slot, so a user with a backlog
+    waits without occupying capacity other users could use.
+
+    Updates for which `coalesce_key` returns an action label supersede the
+    chat's earlier updates of the same action: queued ones are dropped and a
+    running one is cancelled, so repeated presses never add up.
+    """
+
+    def __init__(self, max_concurrent_updates: int, coalesce_key: Callable[[object], Optional[str]] = None):
+        super().__init__(max_concurrent_updates)
+        self._limit = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._coalesce_key = coalesce_key
+        # chat key -> [lock, updates holding or waiting for it]
+        self._chats: Dict[Hashable, list] = {}
+        # (chat key, action) -> [newest sequence number, running task, updates holding or waiting]
+        self._actions: Dict[tuple, list] = {}
+        self._seq = itertools.count()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        # Overrides the base implementation, which would take the global slot first
+        await self.do_process_update(update, coroutine)
+
+    def _supersede(self, key: Hashable, action: str) -> tuple:
+        """Register a new update of `action`, cancelling the chat's running one"""
+        seq = next(self._seq)
+        coalesced = self._actions.get((key, action))
+        if coalesced is None:
+            coalesced = self._actions[(key, action)] = [seq, None, 0]
+        coalesced[0] = seq
+        coalesced[2] += 1
+        running = coalesced[1]
+        if running is not None and not running.done() and not running.cancelling():
+            running.cancel()
+            updates_superseded.inc(action=action, state="running")
+        return seq, coalesced
+
+    async def _run(self, coroutine: Awaitable, coalesced: Optional[list]):
+        if coalesced is None:
+            await coroutine
+            return
+        task = asyncio.ensure_future(coroutine)
+        coalesced[1] = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            # Cancelled by a newer update of the same action rather than by shutdown
+            if not task.cancelled() or asyncio.current_task().cancelling():
+                raise
+        finally:
+            if coalesced[1] is task:
+                coalesced[1] = None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = _chat_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chats.get(key)
+            if entry is None:
+                entry = self._chats[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+        action = self._coalesce_key(update) if self._coalesce_key and key is not None else None
+        seq, coalesced = self._supersede(key, action) if action else (None, None)
+
+        start = time.perf_counter()
+        started = False
+        updates_waiting.inc()
+        try:
+            async with entry[0] if entry else contextlib.nullcontext():
+                if coalesced is not None and coalesced[0] != seq:
+                    updates_superseded.inc(action=action, state="queued")
+                    return
+                async with self._limit:
+                    started = True
+                    updates_waiting.dec()
+                    update_wait.observe(time.perf_counter() - start)
+                    updates_active.inc()
+                    try:
+                        await self._run(coroutine, coalesced)
+                    finally:
+                        updates_active.dec()
+        finally:
+            if not started:
+                # Superseded, or cancelled while waiting (shutdown): the handler coroutine never ran
+                updates_waiting.dec()
+                coroutine.close()
+            if coalesced is not None:
+                coalesced[2] -= 1
+                if coalesced[2] == 0:
+                    del self._actions[(key, action)]
+            if entry:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[key]
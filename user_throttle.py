@@ -0,0 +1,72 @@
+import time
+from typing import Dict, Hashable, Optional
+
+from config import config
+from metrics import metrics
+from tracing import describe_update
+
+user_throttled = metrics.counter("user_throttled_total", "Actions rejected by the per-user rate limit", ("action",))
+
+# Actions where a newer press replaces an older one of the same user instead of
+# queueing behind it: both only produce a fresh conversation to look at
+COALESCED_ACTIONS = {"command:push", "callback:new_quiz"}
+
+def coalesce_key(update: object) -> Optional[str]:
+    """Action label of updates that supersede their predecessors, None for everything else"""
+    label = describe_update(update)
+    return label if label in COALESCED_ACTIONS else None
+
+class UserThrottle:
+    """In-memory token bucket per user for actions that spend LLM or TTS time.
+
+    A user gets `burst` actions at once and `rate_per_minute` afterwards, so
+    nobody can consume the shared provider budget by hammering a button.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        # user id -> [tokens, last refill]
+        self._buckets: Dict[Hashable, list] = {}
+
+    def _refill(self, user_id: Hashable, now: float) -> list:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [float(self.burst), now]
+        else:
+            elapsed = now - bucket[1]
+            bucket[0] = min(float(self.burst), bucket[0] + elapsed * self.rate_per_minute / 60.0)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, user_id: Hashable, action: str, cost: float = 1.0) -> bool:
+        """Take `cost` tokens from the user's bucket; False when they are out"""
+        if self.rate_per_minute <= 0:
+            return True
+        bucket = self._refill(user_id, time.monotonic())
+        if bucket[0] < cost:
+            user_throttled.inc(action=action)
+            return False
+        bucket[0] -= cost
+        self._prune()
+        return True
+
+    def retry_after(self, user_id: Hashable, cost: float = 1.0) -> float:
+        """Seconds until the user can afford `cost` again"""
+        if self.rate_per_minute <= 0:
+            return 0.0
+        bucket = self._refill(user_id, time.monotonic())
+        return max(0.0, (cost - bucket[0]) * 60.0 / self.rate_per_minute)
+
+    def _prune(self):
+        # Full buckets carry no state worth keeping
+        if len(self._buckets) < 10000:
+            return
+        now = time.monotonic()
+        full_after = self.burst * 60.0 / self.rate_per_minute
+        self._buckets = {
+            user_id: bucket for user_id, bucket in self._buckets.items()
+            if now - bucket[1] < full_after
+        }
+
+user_throttle = UserThrottle(config.user_rate_per_minute, config.user_burst)
@@ -1,26 +1,78 @@
+import asyncio
 import json
 import os
 import random
+from collections import OrderedDict
 from typing import List, Dict, Optional
-from gtts import gTTS
 import aiofiles
 import aiohttp
+import time
 from datetime import datetime
+from config import config
+from conversation_store import ConversationStore
+from corpus_snapshot import CorpusSnapshot, is_current, json_to_snapshot
+from file_lock import exclusive_lock
+from id_allocator import IdAllocator
+from metrics import metrics
+from tracing import span
+from realtime_controller import realtime_controller
+from services import LazyService
 
 DATA_FILE = "data.json"
+# Serializes data.json read-merge-write cycles across worker processes
+DATA_LOCK_FILE = DATA_FILE + ".lock"
 WORDBOOK_DIR = "wordbooks"
 AUDIO_DIR = "audio_cache"
+# Real-time conversations that could not be saved, kept so references to them still resolve
+UNSAVED_LIMIT = 1000
+# Copies of the conversations user_data last referred to, in case their id later disappears from data.json
+REFERENCED_LIMIT = 1000
 
-os.makedirs(WORDBOOK_DIR, exist_ok=True)
-os.makedirs(AUDIO_DIR, exist_ok=True)
+storage_write_latency = metrics.histogram(
+    "storage_write_seconds", "Time spent writing data.json and wordbook files", ("store",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+cache_requests = metrics.counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+audio_generation_latency = metrics.histogram("audio_generation_seconds", "gTTS synthesis time", ("lang",))
+conversations_served = metrics.counter("conversations_served_total", "Practice conversations served by source", ("source",))
+
+def _next_free_id() -> int:
+    """One past the largest id in data.json; where the conversation id counter starts"""
+    try:
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            conversations = json.load(f).get("conversations", [])
+    except FileNotFoundError:
+        return 1
+    return max((c.get("id", 0) for c in conversations), default=0) + 1
+
+# Every conversation id (real-time, /generate, generation scripts) comes from here
+conversation_ids = IdAllocator("conversation", floor=_next_free_id)
 
 class DataManager:
     def __init__(self):
+        self._loaded_mtime = None
         self.conversations = self._load_conversations()
+        self.unsaved: "OrderedDict[int, Dict]" = OrderedDict()
+        self.referenced: "OrderedDict[int, Dict]" = OrderedDict()
         self.realtime_generation = True  # Enable aggressive real-time generation
+        self._write_lock = asyncio.Lock()
     
-    def _load_conversations(self) -> List[Dict]:
+    def _load_conversations(self):
+        """data.json as a compact ConversationStore, or the memory-mapped snapshot when CORPUS_SNAPSHOT_PATH is set"""
+        if config.corpus_snapshot_path:
+            with exclusive_lock(DATA_LOCK_FILE):
+                if os.path.exists(DATA_FILE) and not is_current(config.corpus_snapshot_path, DATA_FILE):
+                    # Scripts and other tools keep writing data.json; rebuild the snapshot when it changed
+                    json_to_snapshot(DATA_FILE, config.corpus_snapshot_path)
+                self._loaded_mtime = os.stat(DATA_FILE).st_mtime_ns if os.path.exists(DATA_FILE) else None
+                if not os.path.exists(config.corpus_snapshot_path):
+                    return ConversationStore()
+                return CorpusSnapshot(config.corpus_snapshot_path)
+        return ConversationStore(self._read_json())
+    
+    def _read_json(self) -> List[Dict]:
         try:
+            self._loaded_mtime = os.stat(DATA_FILE).st_mtime_ns
             with open(DATA_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 return data.get("conversations", [])
@@ -31,49 +83,71 @@ class DataManager:
         """Reload conversations from file"""
         self.conversations = self._load_conversations()
     
+    async def refresh(self) -> bool:
+        """Pick up conversations other worker processes added; True if data.json had changed"""
+        try:
+            mtime = os.stat(DATA_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        async with self._write_lock:
+            self.conversations = await asyncio.to_thread(self._load_conversations)
+        return True
+    
     async def get_conversation_by_level(self, level: str) -> Optional[Dict]:
         """Aggressive real-time generation to avoid repetition"""
         
         # Check stored conversation count for this level
-        level_conversations = [c for c in self.conversations if c.get("level") == level]
+        level_conversations = self.conversations.by_level(level)
         stored_count = len(level_conversations)
         
-        # Aggressive real-time generation logic:
-        # - Always try real-time if < 10 stored conversations for this level
-        # - 80% chance for real-time even with stored conversations (to avoid repetition)
-        should_generate_realtime = (
-            self.realtime_generation and 
-            (stored_count < 10 or random.random() < 0.8)
-        )
+        # Real-time share adapts to LLM load; see RealtimeController
+        should_generate_realtime = False
+        if self.realtime_generation:
+            from llm import remaining_deadline
+            should_generate_realtime = realtime_controller.should_generate(stored_count, remaining_deadline())
         
         # Try real-time generation first
         if should_generate_realtime:
             try:
                 from llm import llm_manager
                 
-                # Check if LLM manager is properly configured
-                if not llm_manager.provider:
-                    print(f"⚠️ LLM provider not configured, falling back to stored conversations")
-                    self.realtime_generation = False  # Disable to avoid repeated failures
+                # Fail fast to stored content while no provider is configured or its
+                # circuit is open; real-time resumes once a probe sees it recover
+                if not llm_manager.is_available():
+                    print(f"⚠️ LLM provider unavailable, falling back to stored conversations")
                 else:
                     # Generate a single fresh conversation
                     themes = ["daily_life", "restaurant", "business", "travel", "shopping", "emergency", "education", "work"]
                     theme = random.choice(themes)
                     
                     print(f"🔄 Generating real-time conversation: {level} {theme}")
-                    conversations = await llm_manager.generate_conversations(level, theme, 1)
-                    
-                    if conversations and len(conversations) > 0:
-                        conv = conversations[0]
-                        # Add temporary ID and level
-                        conv["id"] = random.randint(100000, 999999)  # Temp ID for real-time
+
+                    # Serve the first object as soon as it closes instead of
+                    # waiting for the whole completion
+                    conv = None
+                    started = time.monotonic()
+                    stream = llm_manager.stream_conversations(level, theme, 1, operation="realtime_generation")
+                    try:
+                        async for generated in stream:
+                            conv = generated
+                            break
+                    finally:
+                        await stream.aclose()
+                        realtime_controller.record(time.monotonic() - started, conv is not None)
+
+                    if conv:
                         conv["level"] = level
-                        conv["is_realtime"] = True
+                        # Final id before it is shown: buttons and user_data refer to it
+                        conv["id"] = (await conversation_ids.allocate_async())[0]
                         
                         print(f"✅ Real-time generation successful")
+                        conversations_served.inc(source="realtime")
                         
-                        # Optionally save to database for future use
+                        # Saved before it is shown, so other workers and later lookups find it by id
                         await self._save_generated_conversation(conv)
+                        conv["is_realtime"] = True
                         
                         return conv
                     else:
@@ -84,8 +158,9 @@ class DataManager:
         
         # Fallback to stored conversations (level_conversations already calculated above)
         if level_conversations:
-            conv = random.choice(level_conversations).copy()  # Copy to avoid modifying original
-            conv["is_realtime"] = False
+            # Read-only view; handlers that keep it (user_data) store a copy
+            conv = random.choice(level_conversations)
+            conversations_served.inc(source="stored")
             print(f"📚 Using stored conversation ID {conv['id']} (stored_count: {stored_count})")
             return conv
             
@@ -93,33 +168,79 @@ class DataManager:
         return None
     
     async def _save_generated_conversation(self, conversation: Dict):
-        """Optionally save generated conversations to build database"""
+        """Save a generated conversation to build the database"""
         try:
-            # Remove temporary fields
-            conv_to_save = conversation.copy()
-            conv_to_save.pop("is_realtime", None)
-            
-            # Generate proper ID
-            max_id = max([c.get("id", 0) for c in self.conversations]) if self.conversations else 0
-            conv_to_save["id"] = max_id + 1
-            
-            # Add to memory
-            self.conversations.append(conv_to_save)
+            await self._append([conversation])
             
-            # Save to file
-            data = {"conversations": self.conversations}
-            with open(DATA_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                
-            print(f"💾 Saved conversation to database (ID: {conv_to_save['id']})")
+            print(f"💾 Saved conversation to database (ID: {conversation['id']})")
         except Exception as e:
             print(f"⚠️ Failed to save conversation: {e}")
+            # Still shown; keep it in memory so callbacks can find it by its id
+            self.unsaved[conversation["id"]] = conversation
+            while len(self.unsaved) > UNSAVED_LIMIT:
+                self.unsaved.popitem(last=False)
+    
+    async def add_conversations(self, conversations: List[Dict], level: str = None) -> List[Dict]:
+        """Assign ids (and level, if given), add to data.json off the event loop, and refresh memory"""
+        if level is not None:
+            for conv in conversations:
+                conv["level"] = level
+        await self._append(conversations)
+        return conversations
+    
+    async def _append(self, conversations: List[Dict]):
+        """Add conversations to data.json in a worker thread, one writer at a time across processes"""
+        async with self._write_lock:
+            with storage_write_latency.time(store="data_json"), span("storage.data_json"):
+                self.conversations = await asyncio.to_thread(self._append_locked, conversations)
+    
+    def _append_locked(self, conversations: List[Dict]):
+        # Re-read under the lock, so nothing another worker wrote is lost
+        with exclusive_lock(DATA_LOCK_FILE):
+            stored = self._read_json()
+            unnumbered = [conv for conv in conversations if "id" not in conv]
+            for conv, conv_id in zip(unnumbered, conversation_ids.allocate(len(unnumbered))):
+                conv["id"] = conv_id
+            stored.extend(conversations)
+            self._write_data({"conversations": stored})
+            self._loaded_mtime = os.stat(DATA_FILE).st_mtime_ns
+            if config.corpus_snapshot_path:
+                json_to_snapshot(DATA_FILE, config.corpus_snapshot_path)
+                return CorpusSnapshot(config.corpus_snapshot_path)
+        return ConversationStore(stored)
+    
+    @staticmethod
+    def _write_data(data: Dict):
+        # Write then rename, so readers in other processes never see a half-written file
+        tmp_path = f"{DATA_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, DATA_FILE)
     
     def get_conversation_by_id(self, conv_id: int) -> Optional[Dict]:
-        for conv in self.conversations:
-            if conv["id"] == conv_id:
-                return conv
-        return None
+        conv = self.conversations.get(conv_id)
+        if conv is None:
+            conv = self.unsaved.get(conv_id)
+        return conv
+    
+    def remember(self, conversation: Dict):
+        """Keep a copy of a conversation user_data refers to, for resolve()"""
+        self.referenced[conversation["id"]] = dict(conversation)
+        self.referenced.move_to_end(conversation["id"])
+        while len(self.referenced) > REFERENCED_LIMIT:
+            self.referenced.popitem(last=False)
+    
+    def resolve(self, conv_id: int) -> Optional[Dict]:
+        """A conversation referenced from user_data, falling back to the remembered copy"""
+        conv = self.get_conversation_by_id(conv_id)
+        if conv is not None:
+            return conv
+        conv = self.referenced.get(conv_id)
+        if conv is not None:
+            print(f"⚠️ Conversation ID {conv_id} is no longer in {DATA_FILE}; using the remembered copy")
+        else:
+            print(f"⚠️ Conversation ID {conv_id} referenced by user data no longer exists")
+        return conv
     
     def toggle_realtime_generation(self, enabled: bool = None):
         """Toggle or set real-time generation mode"""
@@ -171,8 +292,9 @@ class WordbookManager:
             
             # Save to file
             filepath = os.path.join(WORDBOOK_DIR, f"{user_id}.json")
-            async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(wordbook, ensure_ascii=False, indent=2))
+            with storage_write_latency.time(store="wordbook"), span("storage.wordbook"):
+                async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
+                    await f.write(json.dumps(wordbook, ensure_ascii=False, indent=2))
             
             print(f"✅ Successfully saved to wordbook: {filepath}")
             return True
@@ -189,8 +311,9 @@ class WordbookManager:
         
         if len(wordbook) < original_length:
             filepath = os.path.join(WORDBOOK_DIR, f"{user_id}.json")
-            async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(wordbook, ensure_ascii=False, indent=2))
+            with storage_write_latency.time(store="wordbook"), span("storage.wordbook"):
+                async with aiofiles.open(filepath, "w", encoding="utf-8") as f:
+                    await f.write(json.dumps(wordbook, ensure_ascii=False, indent=2))
             return True
         return False
 
@@ -202,13 +325,21 @@ class AudioGenerator:
         audio_file = os.path.join(AUDIO_DIR, f"conv_{conv_id}{lang_suffix}.mp3")
         
         if os.path.exists(audio_file):
+            cache_requests.inc(cache="audio", result="hit")
             return audio_file
+        cache_requests.inc(cache="audio", result="miss")
         
         try:
+            from gtts import gTTS
+            os.makedirs(AUDIO_DIR, exist_ok=True)
             # Map language codes for gTTS
             gtts_lang = 'ko' if lang == 'kr' else 'ja'
-            tts = gTTS(text=text, lang=gtts_lang, slow=False)
-            tts.save(audio_file)
+            with audio_generation_latency.time(lang=lang), span("audio.generate"):
+                tts = gTTS(text=text, lang=gtts_lang, slow=False)
+                # Another worker may serve the same file while this one is writing it
+                tmp_file = f"{audio_file}.{os.getpid()}.tmp"
+                tts.save(tmp_file)
+                os.replace(tmp_file, audio_file)
             return audio_file
         except Exception as e:
             print(f"Error generating audio: {e}")
@@ -322,13 +453,23 @@ class UserDataManager:
     
     @staticmethod
     def get_quiz_data(context) -> Optional[Dict]:
-        return context.user_data.get("quiz_data")
+        """The quiz conversation with its start time, resolved from the stored reference"""
+        quiz = context.user_data.get("quiz_data")
+        if not quiz:
+            return None
+        if "jp" in quiz:
+            # Stored as a full copy by older versions
+            return quiz
+        conversation = data_manager.resolve(quiz["id"])
+        if conversation is None:
+            return None
+        return dict(conversation, quiz_start_time=quiz["quiz_start_time"])
     
     @staticmethod
     def set_quiz_data(context, conversation: Dict):
-        quiz_data = conversation.copy()
-        quiz_data["quiz_start_time"] = datetime.now().isoformat()
-        context.user_data["quiz_data"] = quiz_data
+        # Only a reference: user_data is persisted for every user
+        context.user_data["quiz_data"] = {"id": conversation["id"], "quiz_start_time": datetime.now().isoformat()}
+        data_manager.remember(conversation)
     
     @staticmethod
     def clear_quiz_data(context):
@@ -337,14 +478,21 @@ class UserDataManager:
     
     @staticmethod
     def get_daily_conversation(context) -> Optional[Dict]:
-        return context.user_data.get("daily_conversation")
+        conv_id = context.user_data.get("daily_conversation_id")
+        if conv_id is None:
+            # Stored as a full copy by older versions
+            return context.user_data.get("daily_conversation")
+        return data_manager.resolve(conv_id)
     
     @staticmethod
     def set_daily_conversation(context, conversation: Dict):
         if context is not None:
-            context.user_data["daily_conversation"] = conversation
+            context.user_data["daily_conversation_id"] = conversation["id"]
+            context.user_data.pop("daily_conversation", None)
+            data_manager.remember(conversation)
 
-data_manager = DataManager()
+# data.json is loaded on first use rather than at import
+data_manager = LazyService("data_manager", DataManager)
 wordbook_manager = WordbookManager()
 audio_generator = AudioGenerator()
 user_data_manager = UserDataManager()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import hmac
+import json
+import logging
+import secrets
+from typing import Awaitable, Callable
+
+from aiohttp import web
+from telegram import Update
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+webhook_requests = metrics.counter("webhook_requests_total", "Webhook requests by result", ("result",))
+
+def webhook_url() -> str:
+    """Public URL Telegram posts updates to"""
+    return config.webhook_url.rstrip("/") + config.webhook_path
+
+def webhook_secret() -> str:
+    """The configured secret, or a fresh one registered with each start.
+
+    A generated secret is fine for a single process, since the webhook is
+    registered again on every start; several processes behind one URL need
+    WEBHOOK_SECRET so they all accept the same token.
+    """
+    return config.webhook_secret or secrets.token_urlsafe(32)
+
+def application_feed(application) -> Callable[[dict], Awaitable[int]]:
+    """Feed that puts updates on the Application's update queue, as polling would"""
+    async def feed(data: dict) -> int:
+        try:
+            update = Update.de_json(data, application.bot)
+        except (TypeError, KeyError, ValueError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return 400
+        if update is None:
+            return 400
+        await application.update_queue.put(update)
+        return 200
+    return feed
+
+class WebhookHandler:
+    """Receives Telegram webhook POSTs and hands the decoded updates to `feed`.
+
+    Requests without the secret token registered with `setWebhook` are
+    rejected before their body is read. The feed decides the response: the
+    Application's feed answers as soon as the update is queued, so a slow
+    handler never holds up Telegram's delivery of the next update, while the
+    multi-worker router answers with the status of the worker it forwarded to.
+    """
+
+    def __init__(self, secret_token: str, feed: Callable[[dict], Awaitable[int]]):
+        self._secret = secret_token.encode("utf-8")
+        self.feed = feed
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, self._secret):
+            webhook_requests.inc(result="forbidden")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            webhook_requests.inc(result="invalid")
+            logger.warning(f"Rejected malformed webhook request: {e}")
+            return web.Response(status=400)
+        status = await self.feed(data) if isinstance(data, dict) else 400
+        webhook_requests.inc(result="accepted" if status == 200 else "invalid" if status == 400 else "unavailable")
+        return web.Response(status=status)
@@ -0,0 +1,174 @@
+"""
+Multi-process deployment: a router process and N bot workers.
+
+The router is the only process talking to Telegram for updates. It receives
+them through the webhook or long polling, and forwards each one to the
+worker that owns its chat (`chat_id % WORKERS`) over a local HTTP endpoint.
+A chat is always served by the same worker, so per-chat ordering, the
+conversation state in user_data and the per-user throttle stay local to
+one process. Workers share everything else through the SQLite state
+database, and one of them, elected through a file lock, runs the scheduled
+work (hourly delivery and /generate jobs).
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+from typing import List, Optional
+
+import aiohttp
+from telegram import Update
+
+from config import config
+from metrics import metrics
+from monitoring import MetricsServer
+from webhook import SECRET_HEADER, WebhookHandler, webhook_secret, webhook_url
+
+logger = logging.getLogger(__name__)
+
+# Secret the router uses towards its workers' local endpoints
+WORKER_SECRET_ENV = "WORKER_SECRET"
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+RESTART_DELAY = 1.0
+POLL_TIMEOUT = 30
+POLL_RETRY_DELAY = 1.0
+SHUTDOWN_TIMEOUT = 30.0
+
+routed_updates = metrics.counter("routed_updates_total", "Updates forwarded to workers by worker and result", ("worker", "result"))
+worker_restarts = metrics.counter("worker_restarts_total", "Worker processes restarted after exiting", ("worker",))
+
+def update_chat_id(data: dict) -> Optional[int]:
+    """Chat (or, without one, user) an update in Bot API JSON belongs to"""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user and "id" in user:
+            return user["id"]
+    return None
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Worker index that owns a chat"""
+    return chat_id % workers
+
+def worker_port(index: int) -> int:
+    return config.worker_base_port + index
+
+class UpdateRouter:
+    """Runs the worker processes and forwards every update to the worker owning its chat.
+
+    Workers that exit are restarted. While a worker is down its updates are
+    answered with 503: Telegram retries webhook deliveries, and in polling
+    mode the router retries before moving the offset past the update, so
+    nothing is dropped.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or config.workers
+        self.secret = secrets.token_urlsafe(32)
+        self._processes: List[Optional[asyncio.subprocess.Process]] = [None] * self.workers
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stop = asyncio.Event()
+        self._stopping = False
+
+    def worker_url(self, index: int) -> str:
+        return f"http://127.0.0.1:{worker_port(index)}{config.webhook_path}"
+
+    def _request_stop(self):
+        self._stopping = True
+        self._stop.set()
+
+    async def _supervise(self, index: int):
+        env = dict(os.environ, **{WORKER_SECRET_ENV: self.secret})
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, MAIN_SCRIPT, "--worker", str(index), env=env)
+            self._processes[index] = process
+            logger.info(f"Started worker {index} (pid {process.pid}) on 127.0.0.1:{worker_port(index)}")
+            code = await process.wait()
+            if self._stopping:
+                return
+            worker_restarts.inc(worker=str(index))
+            logger.error(f"Worker {index} exited with code {code}; restarting")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def route(self, data: dict) -> int:
+        """Forward one update to its worker; returns the worker's HTTP status (503 if unreachable)"""
+        chat_id = update_chat_id(data)
+        index = shard_for(chat_id if chat_id is not None else data.get("update_id", 0), self.workers)
+        try:
+            async with self._session.post(self.worker_url(index), json=data, headers={SECRET_HEADER: self.secret}) as response:
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 503
+        routed_updates.inc(worker=str(index), result="ok" if status == 200 else str(status))
+        return status
+
+    async def _bot_api(self, method: str, **params):
+        url = f"{config.telegram_base_url.rstrip('/')}/bot{config.bot_token}/{method}"
+        timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+        async with self._session.post(url, json=params, timeout=timeout) as response:
+            body = await response.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"{method} failed: {body.get('description')}")
+        return body["result"]
+
+    async def _poll(self):
+        """Long polling for every worker; the offset only moves past an update once a worker took it"""
+        await self._bot_api("deleteWebhook")
+        params = {"timeout": POLL_TIMEOUT, "allowed_updates": Update.ALL_TYPES}
+        while True:
+            try:
+                updates = await self._bot_api("getUpdates", **params)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+            for update in updates:
+                # Forwarded one at a time, so each chat's updates reach its worker in order
+                while await self.route(update) >= 500:
+                    await asyncio.sleep(POLL_RETRY_DELAY)
+                params["offset"] = update["update_id"] + 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._request_stop)
+        self._session = aiohttp.ClientSession()
+        supervisors = [asyncio.create_task(self._supervise(index)) for index in range(self.workers)]
+        server = None
+        poller = None
+        try:
+            if config.webhook_url:
+                secret = webhook_secret()
+                server = MetricsServer(serve_metrics=config.metrics_port == config.webhook_port)
+                server.add_route("POST", config.webhook_path, WebhookHandler(secret, self.route).handle)
+                await server.start(config.webhook_host, config.webhook_port)
+                await self._bot_api("setWebhook", url=webhook_url(), secret_token=secret, allowed_updates=Update.ALL_TYPES)
+                logger.info(f"Routing webhook updates from {webhook_url()} to {self.workers} workers")
+            else:
+                poller = asyncio.create_task(self._poll())
+                logger.info(f"Routing polled updates to {self.workers} workers")
+            await self._stop.wait()
+        finally:
+            self._stopping = True
+            if poller:
+                poller.cancel()
+                await asyncio.gather(poller, return_exceptions=True)
+            if server:
+                await server.stop()
+            for process in self._processes:
+                if process and process.returncode is None:
+                    process.terminate()
+            try:
+                await asyncio.wait_for(asyncio.gather(*supervisors, return_exceptions=True), SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                for process in self._processes:
+                    if process and process.returncode is None:
+                        process.kill()
+            await self._session.close()